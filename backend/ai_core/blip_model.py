@@ -5,42 +5,64 @@ import io
 import base64
 import os
 
+from ai_core import model_store
+
 # Define the pre-trained model name
 MODEL_NAME = "Salesforce/blip-image-captioning-base"
 
-# Initialize variables to hold the loaded model and processor
-processor = None
-model = None
+# Startup load time and memory figures from the last load_blip_model() call
+LOAD_STATS = {}
 
 # Gemini configuration has been moved to ai_core/gemini_caption.py
 
-def load_blip_model():
-    """Loads the BLIP model and processor into memory."""
-    global processor, model
-    print(f"--- Loading BLIP Model: {MODEL_NAME} ---")
+def load_blip_model(model_name: str = MODEL_NAME, store_dir: str = None, version: str = None):
+    """
+    Loads the BLIP model and processor into memory.
+
+    When BLIP_MODEL_STORE is set (or the model is already in the local store), the model
+    is loaded fully offline from the store and its safetensors weights are memory-mapped,
+    so several worker processes share the same pages. Otherwise it falls back to the Hub.
+    The model is only returned, never kept at module level, so the registry's
+    handle is its only owner and an evicted model can be freed.
+    """
+    global LOAD_STATS
+    print(f"--- Loading BLIP Model: {model_name} ---")
     
     # Check for GPU and set device
     device = "cuda" if torch.cuda.is_available() else "cpu"
     
-    # Load the processor and the model
-    processor = BlipProcessor.from_pretrained(MODEL_NAME)
-    model = BlipForConditionalGeneration.from_pretrained(MODEL_NAME).to(device)
-    
-    print("--- BLIP Model Loaded Successfully ---")
+    local_path = model_store.resolve_model_path(model_name, store_dir, version)
+    if local_path:
+        # local_files_only on every load call keeps this fully offline without touching process-wide env vars
+        print(f"--- Loading {model_name} offline from {local_path} ---")
+
+        def _load():
+            loaded_processor = BlipProcessor.from_pretrained(local_path, local_files_only=True)
+            loaded_model = model_store.load_mmap_model(local_path, BlipForConditionalGeneration)
+            return loaded_processor, loaded_model
+        source = local_path
+    elif version:
+        # An explicit version must never silently turn into whatever the Hub serves
+        raise FileNotFoundError(f"Version '{version}' of {model_name} is not in the model store.")
+    elif os.getenv("BLIP_MODEL_STORE"):
+        raise FileNotFoundError(f"{model_name} not found in model store {os.getenv('BLIP_MODEL_STORE')}. Run fetch_model.py first.")
+    else:
+        def _load():
+            return BlipProcessor.from_pretrained(model_name), BlipForConditionalGeneration.from_pretrained(model_name)
+        source = model_name
+
+    (processor, model), stats = model_store.timed_load(_load)
+    if device != "cpu":
+        model = model.to(device)
+
+    # The version is the store directory actually loaded (CURRENT, or the newest one when there is no pointer)
+    loaded_version = os.path.basename(local_path) if local_path else "hub"
+    LOAD_STATS = {"model_name": model_name, "source": source, "version": loaded_version, "device": device, **stats}
+    print(f"--- BLIP Model Loaded Successfully in {stats['load_seconds']}s (RSS {stats['rss_before_mb']} -> {stats['rss_after_mb']} MB) ---")
     return model, processor, device
 
-def generate_caption(image_data: bytes, model_obj, processor_obj, device, length_preference: str = 'medium'):
-    """
-    Generates a caption from raw image data, controlling length only.
-    
-    :param image_data: Raw bytes of the image file.
-    :param model_obj: The loaded BLIP model.
-    :param processor_obj: The loaded BLIP processor.
-    :param device: The device ('cuda' or 'cpu').
-    :param length_preference: The desired length ('short', 'medium', 'long').
-    :return: The generated caption string.
-    """
-    
+def _generation_settings(length_preference: str):
+    """Return (text_prompt, min_tokens, max_tokens) for a length preference."""
     # --- 1. Define max_length based on preference (in tokens) ---
     # These token counts are used to control the maximum length of the generated sequence.
     length_map = {
@@ -64,6 +86,22 @@ def generate_caption(image_data: bytes, model_obj, processor_obj, device, length
     # Adjust prompt for 'long' to encourage more detail
     if length_preference.lower() == 'long':
         text_prompt = "A detailed and descriptive photo of"
+
+    return text_prompt, min_tokens, max_tokens
+
+def generate_caption(image_data: bytes, model_obj, processor_obj, device, length_preference: str = 'medium'):
+    """
+    Generates a caption from raw image data, controlling length only.
+    
+    :param image_data: Raw bytes of the image file.
+    :param model_obj: The loaded BLIP model.
+    :param processor_obj: The loaded BLIP processor.
+    :param device: The device ('cuda' or 'cpu').
+    :param length_preference: The desired length ('short', 'medium', 'long').
+    :return: The generated caption string.
+    """
+    
+    text_prompt, min_tokens, max_tokens = _generation_settings(length_preference)
     
     # 3. Open image from bytes
     raw_image = Image.open(io.BytesIO(image_data)).convert('RGB')
@@ -82,8 +120,38 @@ def generate_caption(image_data: bytes, model_obj, processor_obj, device, length
     
     return caption
 
-def generate_refined_caption(*args, **kwargs):
-    raise NotImplementedError("Gemini functions moved to ai_core/gemini_caption.py")
+def generate_caption_with_confidence(image_data: bytes, model_obj, processor_obj, device, length_preference: str = 'medium'):
+    """
+    Generates a caption together with the model's confidence in it.
+
+    The confidence is the exponentiated, length-normalised log-probability of the
+    chosen beam (0..1); low values mean BLIP was unsure about the description.
+
+    :return: (caption, confidence)
+    """
+    text_prompt, min_tokens, max_tokens = _generation_settings(length_preference)
+    raw_image = Image.open(io.BytesIO(image_data)).convert('RGB')
+    inputs = processor_obj(raw_image, text=text_prompt, return_tensors="pt").to(device)
+    out = model_obj.generate(
+        **inputs, max_length=max_tokens, min_length=min_tokens, num_beams=6, early_stopping=True,
+        no_repeat_ngram_size=2, output_scores=True, return_dict_in_generate=True,
+    )
+    caption = processor_obj.decode(out.sequences[0], skip_special_tokens=True)
+    confidence = float(torch.exp(out.sequences_scores[0]))
+    return caption, confidence
+
+def generate_caption_batch(images: list, model_obj, processor_obj, device, length_preference: str = 'medium'):
+    """
+    Generates captions for several images in one forward pass.
+
+    :param images: List of raw image bytes.
+    :return: List of caption strings, in the same order as the images.
+    """
+    text_prompt, min_tokens, max_tokens = _generation_settings(length_preference)
+    raw_images = [Image.open(io.BytesIO(image_data)).convert('RGB') for image_data in images]
+    inputs = processor_obj(raw_images, text=[text_prompt] * len(raw_images), return_tensors="pt").to(device)
+    out = model_obj.generate(**inputs, max_length=max_tokens, min_length=min_tokens, num_beams=6, early_stopping=True, no_repeat_ngram_size=2)
+    return [processor_obj.decode(ids, skip_special_tokens=True) for ids in out]
 
 def generate_gemini_caption(*args, **kwargs):
     raise NotImplementedError("Gemini functions moved to ai_core/gemini_caption.py")
\ No newline at end of file
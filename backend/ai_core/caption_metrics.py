@@ -0,0 +1,59 @@
+import threading
+from collections import deque
+
+
+class CaptionMetrics:
+    """
+    Thread-safe per-mode counters for caption requests (blip, gemini, hybrid, ...).
+
+    Keeps the last `window` latencies of each mode for percentiles, plus running
+    totals of request count, errors and bytes sent upstream. Requests the open
+    Gemini circuit sent straight to BLIP are counted as short-circuited, not as
+    errors: Gemini was never called for them.
+    """
+
+    def __init__(self, window: int = 1000):
+        self.window = window
+        self._modes = {}
+        self._lock = threading.Lock()
+
+    def _mode(self, mode: str) -> dict:
+        if mode not in self._modes:
+            self._modes[mode] = {"count": 0, "errors": 0, "short_circuited": 0, "payload_bytes": 0, "latencies": deque(maxlen=self.window)}
+        return self._modes[mode]
+
+    def record(self, mode: str, latency_ms: float, payload_bytes: int = 0, error: bool = False,
+               short_circuited: bool = False):
+        with self._lock:
+            stats = self._mode(mode)
+            stats["count"] += 1
+            stats["payload_bytes"] += payload_bytes
+            stats["latencies"].append(latency_ms)
+            if error:
+                stats["errors"] += 1
+            if short_circuited:
+                stats["short_circuited"] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            modes = {mode: (dict(stats), sorted(stats["latencies"])) for mode, stats in self._modes.items()}
+
+        result = {}
+        for mode, (stats, latencies) in modes.items():
+            count = stats["count"]
+            result[mode] = {
+                "count": count,
+                "errors": stats["errors"],
+                "short_circuited": stats["short_circuited"],
+                "avg_payload_bytes": round(stats["payload_bytes"] / count) if count else 0,
+                "avg_latency_ms": round(sum(latencies) / len(latencies), 1) if latencies else None,
+                "p50_latency_ms": percentile(latencies, 0.50),
+                "p95_latency_ms": percentile(latencies, 0.95),
+            }
+        return result
+
+
+def percentile(sorted_values: list, q: float):
+    if not sorted_values:
+        return None
+    return round(sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))], 1)
@@ -0,0 +1,166 @@
+import json
+import os
+import tempfile
+
+# Written by autotune_blip.py
+DEFAULT_TUNING_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "blip_tuning.json")
+
+
+def available_cpus() -> list:
+    """Logical CPUs this process may run on."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def physical_core_groups() -> list:
+    """
+    Group the available logical CPUs by physical core (hyper-threads share a group).
+
+    Uses the Linux sysfs topology; elsewhere every logical CPU is its own group.
+    """
+    cpus = available_cpus()
+    groups, seen = [], set()
+    for cpu in cpus:
+        if cpu in seen:
+            continue
+        siblings_path = f"/sys/devices/system/cpu/cpu{cpu}/topology/thread_siblings_list"
+        try:
+            with open(siblings_path, "r") as f:
+                siblings = _parse_cpu_list(f.read())
+        except OSError:
+            siblings = [cpu]
+        group = [c for c in siblings if c in cpus] or [cpu]
+        seen.update(group)
+        groups.append(group)
+    return groups
+
+
+def _parse_cpu_list(text: str) -> list:
+    """Parse a sysfs CPU list such as '0-3,8,10-11'."""
+    cpus = []
+    for part in text.strip().split(","):
+        if "-" in part:
+            start, end = part.split("-")
+            cpus.extend(range(int(start), int(end) + 1))
+        elif part:
+            cpus.append(int(part))
+    return cpus
+
+
+def plan_worker_cpus(worker_index: int, workers: int) -> list:
+    """
+    Give each worker a disjoint slice of physical cores (with their hyper-thread siblings).
+
+    With more workers than cores, workers share cores round-robin.
+    """
+    groups = physical_core_groups()
+    if workers >= len(groups):
+        return groups[worker_index % len(groups)]
+    per_worker = len(groups) // workers
+    start = worker_index * per_worker
+    return [cpu for group in groups[start:start + per_worker] for cpu in group]
+
+
+_worker_slot = None  # open lock file that holds this process's worker index
+
+
+def claim_worker_index(workers: int) -> int:
+    """
+    Claim a free worker index in [0, workers) for this process.
+
+    uvicorn and waitress do not tell a worker its index, so each worker takes an
+    exclusive lock on the first free slot file; the lock is released when the
+    process exits, so a restarted worker reuses its predecessor's slot. Where
+    file locks are unavailable the index is derived from the pid.
+    """
+    global _worker_slot
+    try:
+        import fcntl
+    except ImportError:
+        return os.getpid() % workers
+    slot_dir = os.getenv("WORKER_SLOT_DIR") or tempfile.gettempdir()
+    for index in range(workers):
+        path = os.path.join(slot_dir, f"blip-worker-{os.getenv('PORT', 'default')}-{index}.lock")
+        slot = open(path, "a")
+        try:
+            fcntl.flock(slot, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            slot.close()
+            continue
+        _worker_slot = slot
+        return index
+    return os.getpid() % workers
+
+
+def load_tuning(path: str = None, objective: str = None) -> dict:
+    """Read the best configuration for `objective` ('throughput' or 'latency') from the autotune file."""
+    path = path or os.getenv("BLIP_TUNING_FILE") or DEFAULT_TUNING_FILE
+    objective = objective or os.getenv("BLIP_TUNING_OBJECTIVE", "throughput")
+    if not os.path.isfile(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f).get(objective, {})
+    except (OSError, ValueError) as e:
+        print(f"[WARNING] Could not read BLIP tuning file {path}: {e}")
+        return {}
+
+
+def _env_int(name: str):
+    value = os.getenv(name)
+    return int(value) if value else None
+
+
+def apply_cpu_config(worker_index: int = None, workers: int = None, intra_op_threads: int = None,
+                     inter_op_threads: int = None, pin: bool = None) -> dict:
+    """
+    Configure torch threading (and optionally CPU affinity) for this inference worker.
+
+    Explicit arguments win, then environment variables (CAPTION_WORKERS, WORKER_INDEX,
+    TORCH_INTRA_OP_THREADS, TORCH_INTER_OP_THREADS, BLIP_PIN_CPUS), then the autotune
+    file, then a default that splits the physical cores evenly between workers so that
+    several WSGI workers on one node do not oversubscribe it. Without WORKER_INDEX,
+    pinned workers claim an index with claim_worker_index().
+
+    Must run before the first inference, since torch fixes its inter-op pool on first use.
+    """
+    import torch
+
+    tuning = load_tuning()
+    workers = workers or _env_int("CAPTION_WORKERS") or tuning.get("workers") or 1
+    if worker_index is None:
+        worker_index = _env_int("WORKER_INDEX")
+    if pin is None:
+        pin_env = os.getenv("BLIP_PIN_CPUS")
+        pin = pin_env.lower() == "true" if pin_env else bool(tuning.get("pin", False))
+    if pin and worker_index is None:
+        worker_index = claim_worker_index(workers)
+
+    cores = len(physical_core_groups())
+    intra_op_threads = (intra_op_threads or _env_int("TORCH_INTRA_OP_THREADS")
+                        or tuning.get("intra_op_threads") or max(1, cores // workers))
+    inter_op_threads = inter_op_threads or _env_int("TORCH_INTER_OP_THREADS") or tuning.get("inter_op_threads") or 1
+
+    torch.set_num_threads(intra_op_threads)
+    try:
+        torch.set_num_interop_threads(inter_op_threads)
+    except RuntimeError:
+        # Raised when parallel work already ran in this process; the pool size is then fixed
+        print("[WARNING] torch inter-op threads already initialised; keeping the existing pool.")
+
+    pinned = None
+    if pin and worker_index is not None and hasattr(os, "sched_setaffinity"):
+        pinned = plan_worker_cpus(worker_index, workers)
+        os.sched_setaffinity(0, pinned)
+
+    config = {
+        "workers": workers,
+        "worker_index": worker_index,
+        "intra_op_threads": torch.get_num_threads(),
+        "inter_op_threads": torch.get_num_interop_threads(),
+        "pinned_cpus": pinned,
+        "physical_cores": cores,
+    }
+    print(f"[INFO] CPU config: {config}")
+    return config
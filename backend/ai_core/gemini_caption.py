@@ -1,6 +1,21 @@
+import asyncio
 import os
+import re
 import google.generativeai as genai
 
+GEMINI_MODEL_NAME = 'gemini-2.5-flash'
+
+# Upper bound on a single Gemini call, so a degraded upstream cannot hold a request for minutes
+DEFAULT_GEMINI_TIMEOUT_SECONDS = 30
+
+# Gemini bills every image input as a fixed number of tokens
+GEMINI_IMAGE_TOKENS = 258
+
+def gemini_timeout_seconds() -> float:
+    """Read GEMINI_TIMEOUT at call time, so a value from .env (loaded after import) applies."""
+    return float(os.getenv("GEMINI_TIMEOUT", DEFAULT_GEMINI_TIMEOUT_SECONDS))
+
+
 def configure_gemini():
     """Configure the Gemini API using the key from environment variables."""
     api_key = os.getenv("GEMINI_API_KEY")
@@ -11,7 +26,13 @@ def configure_gemini():
     print(f"[DEBUG] GEMINI_API_KEY loaded: {api_key is not None}")
     if api_key and len(api_key) > 0:
         try:
-            genai.configure(api_key=api_key)
+            # GEMINI_API_ENDPOINT points the client at another endpoint (e.g. fake_gemini_server.py)
+            endpoint = os.getenv("GEMINI_API_ENDPOINT")
+            if endpoint:
+                genai.configure(api_key=api_key, transport="rest", client_options={"api_endpoint": endpoint})
+                print(f"[INFO] Gemini API endpoint overridden: {endpoint}")
+            else:
+                genai.configure(api_key=api_key)
             print("[INFO] Gemini API configured successfully.")
             return True
         except Exception as e:
@@ -21,122 +42,222 @@ def configure_gemini():
     return False
 
 
-def generate_gemini_caption(image_data: bytes, tone: str, length: str, platform: str, include_hashtags: bool = False) -> str:
+def _prompt_instructions(tone: str, length: str, platform: str, include_hashtags: bool = False):
+    """Return the (format, length, tone, hashtag) instructions shared by all caption prompts."""
+    # Platform-specific guidance with hashtag control
+    if include_hashtags:
+        platform_guidance = {
+            "instagram": (
+                "REPLICATE THIS STRUCTURE EXACTLY: 📸 Instagram\n\"[Caption text with emojis] #Hashtag1 #Hashtag2 #Hashtag3\"\n"
+                "Example: 📸 Instagram\n\"Chasing sunsets and dreams 🌅✨ #VibesOnly #GoldenHour #SunsetLovers\""
+            ),
+            "facebook": (
+                "REPLICATE THIS STRUCTURE EXACTLY: 📘 Facebook\n\"[Caption text with emojis] #Hashtag1 #Hashtag2\"\n"
+                "Example: 📘 Facebook\n\"Good times + great friends = unforgettable memories 💙😊 #FriendshipGoals #GoodVibes\""
+            ),
+            "twitter": (
+                "REPLICATE THIS STRUCTURE EXACTLY: 🐦 Twitter (X)\n\"[Caption text with emojis] #Hashtag1 #Hashtag2 #Hashtag3\"\n"
+                "Example: 🐦 Twitter (X)\n\"Small steps lead to big changes. Keep moving forward. 💪 #Motivation #DailyInspo #GrowthMindset\""
+            ),
+            "x": (
+                "REPLICATE THIS STRUCTURE EXACTLY: 🐦 Twitter (X)\n\"[Caption text with emojis] #Hashtag1 #Hashtag2 #Hashtag3\"\n"
+                "Example: 🐦 Twitter (X)\n\"Small steps lead to big changes. Keep moving forward. 💪 #Motivation #DailyInspo #GrowthMindset\""
+            ),
+            "linkedin": (
+                "REPLICATE THIS STRUCTURE EXACTLY: 💼 LinkedIn\n\"[Caption text with emojis] #Hashtag1 #Hashtag2 #Hashtag3\"\n"
+                "Example: 💼 LinkedIn\n\"Grateful to be learning, growing, and creating impact every day 🚀 #ProfessionalGrowth #Networking #CareerDevelopment\""
+            ),
+            "general": (
+                "REPLICATE THIS STRUCTURE EXACTLY: [Caption text with 3-5 relevant hashtags at the end]. "
+                "Example: 'A beautiful landscape view with mountains and a lake. #Nature #Landscape #Mountains #Photography #Scenic'"
+            )
+        }
+    else:
+        platform_guidance = {
+            "instagram": (
+                "REPLICATE THIS STRUCTURE EXACTLY: 📸 Instagram\n\"[Caption text with emojis]\"\n"
+                "Example: 📸 Instagram\n\"Chasing sunsets and dreams 🌅✨\""
+            ),
+            "facebook": (
+                "REPLICATE THIS STRUCTURE EXACTLY: 📘 Facebook\n\"[Caption text with emojis]\"\n"
+                "Example: 📘 Facebook\n\"Good times + great friends = unforgettable memories 💙😊\""
+            ),
+            "twitter": (
+                "REPLICATE THIS STRUCTURE EXACTLY: 🐦 Twitter (X)\n\"[Caption text with emojis]\"\n"
+                "Example: 🐦 Twitter (X)\n\"Small steps lead to big changes. Keep moving forward. 💪\""
+            ),
+            "x": (
+                "REPLICATE THIS STRUCTURE EXACTLY: 🐦 Twitter (X)\n\"[Caption text with emojis]\"\n"
+                "Example: 🐦 Twitter (X)\n\"Small steps lead to big changes. Keep moving forward. 💪\""
+            ),
+            "linkedin": (
+                "REPLICATE THIS STRUCTURE EXACTLY: 💼 LinkedIn\n\"[Caption text with emojis]\"\n"
+                "Example: 💼 LinkedIn\n\"Grateful to be learning, growing, and creating impact every day 🚀\""
+            ),
+            "general": (
+                "REPLICATE THIS STRUCTURE EXACTLY: [Caption text without prefix or hashtags]. "
+                "Example: 'A beautiful landscape view with mountains and a lake.'"
+            )
+        }
+
+    guidance = platform_guidance.get(platform.lower(), "REPLICATE THIS STRUCTURE EXACTLY: [Caption text without prefix or hashtags]. Example: 'A beautiful landscape view with mountains and a lake.'")
+
+    # Length guidance
+    length_guidance = {
+        "short": "Keep it brief and punchy (1-2 sentences, around 10-20 words).",
+        "medium": "Make it engaging and informative (2-3 sentences, around 20-40 words).",
+        "long": "Create a detailed and descriptive caption (3-5 sentences, around 40-70 words)."
+    }
+    length_instruction = length_guidance.get(length.lower(), length_guidance["medium"])
+
+    # Tone guidance
+    tone_guidance = {
+        "casual": "Use a friendly, relaxed, and conversational style.",
+        "professional": "Use a polished, business-appropriate, and authoritative style.",
+        "creative": "Use imaginative, artistic, and expressive language with vivid descriptions.",
+        "funny": "Use humor, wit, and playful language to entertain."
+    }
+    tone_instruction = tone_guidance.get(tone.lower(), tone_guidance["casual"])
+
+    # Build hashtag instruction
+    hashtag_instruction = ""
+    if include_hashtags:
+        hashtag_instruction = "Include 3-5 relevant and trending hashtags that match the image content and platform. "
+    else:
+        hashtag_instruction = "Do NOT include any hashtags. "
+
+    return guidance, length_instruction, tone_instruction, hashtag_instruction
+
+
+def build_gemini_prompt(tone: str, length: str, platform: str, include_hashtags: bool = False) -> str:
+    """Build the caption-writing prompt sent alongside the image."""
+    guidance, length_instruction, tone_instruction, hashtag_instruction = _prompt_instructions(tone, length, platform, include_hashtags)
+    prompt = (
+        f"You are a world-class social media caption writer. "
+        f"Analyze the uploaded image and create a caption for {platform}. "
+        f"\n\nTONE: {tone_instruction} "
+        f"\n\nLENGTH: {length_instruction} "
+        f"\n\nFORMAT: {guidance} "
+        f"\n\nHASHTAGS: {hashtag_instruction}"
+        f"\n\nIMPORTANT: Output ONLY the final caption text that strictly follows the specified structure. "
+        f"Do NOT add any introductory text, explanations, or additional commentary. "
+        f"If the format shows emojis, use 1-3 relevant emojis naturally within the text."
+    )
+    return prompt
+
+
+def build_refine_prompt(draft: str, tone: str, length: str, platform: str, include_hashtags: bool = False, with_image: bool = False) -> str:
+    """Build the prompt that rewrites a BLIP draft description into a platform caption."""
+    guidance, length_instruction, tone_instruction, hashtag_instruction = _prompt_instructions(tone, length, platform, include_hashtags)
+    source = (
+        "The image is attached; the draft below may be inaccurate, so rely on the image where they disagree. "
+        if with_image else
+        "You cannot see the image; rely only on the draft and do not invent details it does not support. "
+    )
+    return (
+        f"You are a world-class social media caption writer. "
+        f"An image captioning model described a photo as: \"{draft}\". "
+        f"{source}"
+        f"Rewrite this description into a caption for {platform}. "
+        f"\n\nTONE: {tone_instruction} "
+        f"\n\nLENGTH: {length_instruction} "
+        f"\n\nFORMAT: {guidance} "
+        f"\n\nHASHTAGS: {hashtag_instruction}"
+        f"\n\nIMPORTANT: Output ONLY the final caption text that strictly follows the specified structure. "
+        f"Do NOT add any introductory text, explanations, or additional commentary. "
+        f"If the format shows emojis, use 1-3 relevant emojis naturally within the text."
+    )
+
+
+def estimate_gemini_tokens(prompt: str, with_image: bool = True) -> int:
+    """Rough token estimate of a caption request (prompt + image + reply), used for TPM budgeting."""
+    return len(prompt) // 4 + (GEMINI_IMAGE_TOKENS if with_image else 0) + 100
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """True if a Gemini error is a 429 / quota exhaustion."""
+    if getattr(error, "code", None) == 429:
+        return True
+    return type(error).__name__ == "ResourceExhausted" or "RESOURCE_EXHAUSTED" in str(error)
+
+
+def retry_after_seconds(error: Exception):
+    """Extract the server-suggested retry delay (in seconds) from a Gemini error, or None."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    if headers.get("Retry-After"):
+        try:
+            return float(headers["Retry-After"])
+        except ValueError:
+            pass
+
+    for detail in getattr(error, "details", None) or []:
+        retry_delay = getattr(detail, "retry_delay", None)
+        if retry_delay is not None and hasattr(retry_delay, "seconds"):
+            return retry_delay.seconds + retry_delay.nanos / 1e9
+        if isinstance(detail, dict) and detail.get("retryDelay"):
+            return float(str(detail["retryDelay"]).rstrip("s"))
+
+    match = re.search(r"retry(?:Delay| in)\W*([\d.]+)\s*s", str(error), re.IGNORECASE)
+    return float(match.group(1)) if match else None
+
+
+def gemini_payload_bytes(prompt: str, image_data: bytes = None) -> int:
+    """Size of the request content actually sent to Gemini: prompt text plus any attached image."""
+    return len(prompt.encode("utf-8")) + (len(image_data) if image_data is not None else 0)
+
+
+def request_gemini_caption(image_data: bytes, tone: str, length: str, platform: str, include_hashtags: bool = False, prompt: str = None) -> str:
+    """
+    Send one caption request to Gemini and return the stripped text.
+
+    Unlike generate_gemini_caption, errors are raised to the caller so that
+    batch jobs can react to rate limiting.
+    """
+    vision_model = genai.GenerativeModel(GEMINI_MODEL_NAME)
+    prompt = prompt or build_gemini_prompt(tone, length, platform, include_hashtags)
+    parts = [
+        {"text": prompt},
+        {"mime_type": "image/jpeg", "data": image_data}
+    ]
+    response = vision_model.generate_content(parts, request_options={"timeout": gemini_timeout_seconds()})
+    return (response.text or "").strip()
+
+
+def generate_refined_caption(draft: str, tone: str, length: str, platform: str, include_hashtags: bool = False, image_data: bytes = None):
+    """
+    Rewrite a BLIP draft into a platform caption with Gemini.
+
+    The request is text-only unless `image_data` is given (used when the draft is unreliable).
+    Errors are raised to the caller.
+
+    :return: (caption, payload_bytes) where payload_bytes is the size of the request content.
+    """
+    model = genai.GenerativeModel(GEMINI_MODEL_NAME)
+    prompt = build_refine_prompt(draft, tone, length, platform, include_hashtags, with_image=image_data is not None)
+    parts = [{"text": prompt}]
+    if image_data is not None:
+        parts.append({"mime_type": "image/jpeg", "data": image_data})
+    payload_bytes = gemini_payload_bytes(prompt, image_data)
+
+    response = model.generate_content(parts, request_options={"timeout": gemini_timeout_seconds()})
+    return (response.text or "").strip(), payload_bytes
+
+
+def generate_gemini_caption(image_data: bytes, tone: str, length: str, platform: str, include_hashtags: bool = False, prompt: str = None) -> str:
     """
     Generate a platform-appropriate caption using Gemini Vision.
     Platforms: instagram, linkedin, twitter/x, facebook
+
+    Pass `prompt` when the caller already built it (e.g. to measure the payload).
     """
     try:
         print(f"[DEBUG] Generating Gemini caption - Platform: {platform}, Tone: {tone}, Length: {length}, Include Hashtags: {include_hashtags}")
-        
-        # Using Gemini 2.5 Flash for vision capabilities
-        vision_model = genai.GenerativeModel('gemini-2.5-flash')
-        print("[DEBUG] Gemini model initialized successfully")
-
-        # Platform-specific guidance with hashtag control
-        if include_hashtags:
-            platform_guidance = {
-                "instagram": (
-                    "REPLICATE THIS STRUCTURE EXACTLY: 📸 Instagram\n\"[Caption text with emojis] #Hashtag1 #Hashtag2 #Hashtag3\"\n"
-                    "Example: 📸 Instagram\n\"Chasing sunsets and dreams 🌅✨ #VibesOnly #GoldenHour #SunsetLovers\""
-                ),
-                "facebook": (
-                    "REPLICATE THIS STRUCTURE EXACTLY: 📘 Facebook\n\"[Caption text with emojis] #Hashtag1 #Hashtag2\"\n"
-                    "Example: 📘 Facebook\n\"Good times + great friends = unforgettable memories 💙😊 #FriendshipGoals #GoodVibes\""
-                ),
-                "twitter": (
-                    "REPLICATE THIS STRUCTURE EXACTLY: 🐦 Twitter (X)\n\"[Caption text with emojis] #Hashtag1 #Hashtag2 #Hashtag3\"\n"
-                    "Example: 🐦 Twitter (X)\n\"Small steps lead to big changes. Keep moving forward. 💪 #Motivation #DailyInspo #GrowthMindset\""
-                ),
-                "x": (
-                    "REPLICATE THIS STRUCTURE EXACTLY: 🐦 Twitter (X)\n\"[Caption text with emojis] #Hashtag1 #Hashtag2 #Hashtag3\"\n"
-                    "Example: 🐦 Twitter (X)\n\"Small steps lead to big changes. Keep moving forward. 💪 #Motivation #DailyInspo #GrowthMindset\""
-                ),
-                "linkedin": (
-                    "REPLICATE THIS STRUCTURE EXACTLY: 💼 LinkedIn\n\"[Caption text with emojis] #Hashtag1 #Hashtag2 #Hashtag3\"\n"
-                    "Example: 💼 LinkedIn\n\"Grateful to be learning, growing, and creating impact every day 🚀 #ProfessionalGrowth #Networking #CareerDevelopment\""
-                ),
-                "general": (
-                    "REPLICATE THIS STRUCTURE EXACTLY: [Caption text with 3-5 relevant hashtags at the end]. "
-                    "Example: 'A beautiful landscape view with mountains and a lake. #Nature #Landscape #Mountains #Photography #Scenic'"
-                )
-            }
-        else:
-            platform_guidance = {
-                "instagram": (
-                    "REPLICATE THIS STRUCTURE EXACTLY: 📸 Instagram\n\"[Caption text with emojis]\"\n"
-                    "Example: 📸 Instagram\n\"Chasing sunsets and dreams 🌅✨\""
-                ),
-                "facebook": (
-                    "REPLICATE THIS STRUCTURE EXACTLY: 📘 Facebook\n\"[Caption text with emojis]\"\n"
-                    "Example: 📘 Facebook\n\"Good times + great friends = unforgettable memories 💙😊\""
-                ),
-                "twitter": (
-                    "REPLICATE THIS STRUCTURE EXACTLY: 🐦 Twitter (X)\n\"[Caption text with emojis]\"\n"
-                    "Example: 🐦 Twitter (X)\n\"Small steps lead to big changes. Keep moving forward. 💪\""
-                ),
-                "x": (
-                    "REPLICATE THIS STRUCTURE EXACTLY: 🐦 Twitter (X)\n\"[Caption text with emojis]\"\n"
-                    "Example: 🐦 Twitter (X)\n\"Small steps lead to big changes. Keep moving forward. 💪\""
-                ),
-                "linkedin": (
-                    "REPLICATE THIS STRUCTURE EXACTLY: 💼 LinkedIn\n\"[Caption text with emojis]\"\n"
-                    "Example: 💼 LinkedIn\n\"Grateful to be learning, growing, and creating impact every day 🚀\""
-                ),
-                "general": (
-                    "REPLICATE THIS STRUCTURE EXACTLY: [Caption text without prefix or hashtags]. "
-                    "Example: 'A beautiful landscape view with mountains and a lake.'"
-                )
-            }
-
-        guidance = platform_guidance.get(platform.lower(), "REPLICATE THIS STRUCTURE EXACTLY: [Caption text without prefix or hashtags]. Example: 'A beautiful landscape view with mountains and a lake.'")
-
-        # Length guidance
-        length_guidance = {
-            "short": "Keep it brief and punchy (1-2 sentences, around 10-20 words).",
-            "medium": "Make it engaging and informative (2-3 sentences, around 20-40 words).",
-            "long": "Create a detailed and descriptive caption (3-5 sentences, around 40-70 words)."
-        }
-        length_instruction = length_guidance.get(length.lower(), length_guidance["medium"])
-
-        # Tone guidance
-        tone_guidance = {
-            "casual": "Use a friendly, relaxed, and conversational style.",
-            "professional": "Use a polished, business-appropriate, and authoritative style.",
-            "creative": "Use imaginative, artistic, and expressive language with vivid descriptions.",
-            "funny": "Use humor, wit, and playful language to entertain."
-        }
-        tone_instruction = tone_guidance.get(tone.lower(), tone_guidance["casual"])
-
-        # Build hashtag instruction
-        hashtag_instruction = ""
-        if include_hashtags:
-            hashtag_instruction = "Include 3-5 relevant and trending hashtags that match the image content and platform. "
-        else:
-            hashtag_instruction = "Do NOT include any hashtags. "
-
-        prompt = (
-            f"You are a world-class social media caption writer. "
-            f"Analyze the uploaded image and create a caption for {platform}. "
-            f"\n\nTONE: {tone_instruction} "
-            f"\n\nLENGTH: {length_instruction} "
-            f"\n\nFORMAT: {guidance} "
-            f"\n\nHASHTAGS: {hashtag_instruction}"
-            f"\n\nIMPORTANT: Output ONLY the final caption text that strictly follows the specified structure. "
-            f"Do NOT add any introductory text, explanations, or additional commentary. "
-            f"If the format shows emojis, use 1-3 relevant emojis naturally within the text."
-        )
-
-        parts = [
-            {"text": prompt},
-            {"mime_type": "image/jpeg", "data": image_data}
-        ]
 
         print("[DEBUG] Sending request to Gemini API...")
-        response = vision_model.generate_content(parts)
+        caption = request_gemini_caption(image_data, tone, length, platform, include_hashtags, prompt=prompt)
         print("[DEBUG] Received response from Gemini API")
         
-        caption = (response.text or "").strip()
         print(f"[Gemini SUCCESS] Platform: {platform} | Caption length: {len(caption)} chars")
         print(f"[Gemini] Caption preview: {caption[:100]}...")
         return caption
@@ -145,4 +266,44 @@ def generate_gemini_caption(image_data: bytes, tone: str, length: str, platform:
         import traceback
         print(f"[ERROR] Gemini caption generation failed: {e}")
         print(f"[ERROR] Full traceback: {traceback.format_exc()}")
-        return ""
\ No newline at end of file
+        return ""
+
+
+# --- Async path (used by the ASGI server) ---
+
+async def _generate_content_async(model, parts):
+    # The async client only exists for the gRPC transport; with a REST endpoint
+    # override (GEMINI_API_ENDPOINT) the blocking call runs in a worker thread instead.
+    if os.getenv("GEMINI_API_ENDPOINT"):
+        return await asyncio.to_thread(model.generate_content, parts, request_options={"timeout": gemini_timeout_seconds()})
+    return await model.generate_content_async(parts, request_options={"timeout": gemini_timeout_seconds()})
+
+
+async def generate_gemini_caption_async(image_data: bytes, tone: str, length: str, platform: str, include_hashtags: bool = False, prompt: str = None) -> str:
+    """Async counterpart of generate_gemini_caption; returns "" on failure."""
+    try:
+        vision_model = genai.GenerativeModel(GEMINI_MODEL_NAME)
+        parts = [
+            {"text": prompt or build_gemini_prompt(tone, length, platform, include_hashtags)},
+            {"mime_type": "image/jpeg", "data": image_data}
+        ]
+        response = await _generate_content_async(vision_model, parts)
+        caption = (response.text or "").strip()
+        print(f"[Gemini SUCCESS] Platform: {platform} | Caption length: {len(caption)} chars")
+        return caption
+    except Exception as e:
+        print(f"[ERROR] Gemini caption generation failed: {e}")
+        return ""
+
+
+async def generate_refined_caption_async(draft: str, tone: str, length: str, platform: str, include_hashtags: bool = False, image_data: bytes = None):
+    """Async counterpart of generate_refined_caption; errors are raised to the caller."""
+    model = genai.GenerativeModel(GEMINI_MODEL_NAME)
+    prompt = build_refine_prompt(draft, tone, length, platform, include_hashtags, with_image=image_data is not None)
+    parts = [{"text": prompt}]
+    if image_data is not None:
+        parts.append({"mime_type": "image/jpeg", "data": image_data})
+    payload_bytes = gemini_payload_bytes(prompt, image_data)
+
+    response = await _generate_content_async(model, parts)
+    return (response.text or "").strip(), payload_bytes
@@ -0,0 +1,145 @@
+import os
+import threading
+import time
+from collections import deque
+
+from ai_core.caption_metrics import percentile
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# What allow_request() admitted a call as; passed back to record()
+REQUEST = "request"
+PROBE = "probe"
+
+
+class GeminiRouter:
+    """
+    Latency- and error-aware circuit breaker in front of Gemini.
+
+    Tracks an EWMA of Gemini latency and error rate (plus a rolling window for
+    percentiles). When either EWMA crosses its threshold the circuit opens and
+    callers should go straight to BLIP instead of paying a slow or failing call.
+    After `open_seconds` a limited number of half-open probes are let through;
+    a successful probe closes the circuit, a failed one re-opens it. Only calls
+    admitted as PROBE decide that: a call admitted while the circuit was closed
+    that finishes during the half-open window just feeds the averages. The circuit
+    only trips once `min_requests` calls were recorded since it last closed, so a
+    single slow call right after recovery cannot re-open it.
+    """
+
+    def __init__(self, latency_threshold_ms: float = 8000, error_threshold: float = 0.5, alpha: float = 0.2,
+                 min_requests: int = 5, open_seconds: float = 30, half_open_probes: int = 1, window: int = 200):
+        self.latency_threshold_ms = latency_threshold_ms
+        self.error_threshold = error_threshold
+        self.alpha = alpha
+        self.min_requests = min_requests
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+
+        self.state = CLOSED
+        self.ewma_latency_ms = None
+        self.ewma_error_rate = 0.0
+        self.requests = 0
+        self.window_requests = 0  # calls recorded since the circuit last closed
+        self.opened_at = None
+        self.last_trip_reason = None
+        self.trips = 0
+        self.short_circuited = 0
+        self.probes_in_flight = 0
+        self.probe_started_at = None
+        self.latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            latency_threshold_ms=float(os.getenv("GEMINI_CB_LATENCY_MS", 8000)),
+            error_threshold=float(os.getenv("GEMINI_CB_ERROR_RATE", 0.5)),
+            min_requests=int(os.getenv("GEMINI_CB_MIN_REQUESTS", 5)),
+            open_seconds=float(os.getenv("GEMINI_CB_OPEN_SECONDS", 30)),
+        )
+
+    def allow_request(self):
+        """
+        Whether the caller should try Gemini now: None to skip it, else REQUEST or PROBE.
+        Every admitted call must be followed by record() with the returned value.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self.state == OPEN and now - self.opened_at >= self.open_seconds:
+                self.state = HALF_OPEN
+                self.probes_in_flight = 0
+            if self.state == HALF_OPEN:
+                # A probe that never reported back must not wedge the circuit
+                if self.probes_in_flight and now - self.probe_started_at >= self.open_seconds:
+                    self.probes_in_flight = 0
+                if self.probes_in_flight < self.half_open_probes:
+                    self.probes_in_flight += 1
+                    self.probe_started_at = now
+                    return PROBE
+            if self.state == CLOSED:
+                return REQUEST
+            self.short_circuited += 1
+            return None
+
+    def record(self, success: bool, latency_ms: float, admission: str = REQUEST):
+        """Feed the outcome of a Gemini call (an empty caption counts as a failure)."""
+        with self._lock:
+            self.requests += 1
+            self.window_requests += 1
+            self.latencies.append(latency_ms)
+            if self.ewma_latency_ms is None:
+                self.ewma_latency_ms = latency_ms
+            else:
+                self.ewma_latency_ms += self.alpha * (latency_ms - self.ewma_latency_ms)
+            self.ewma_error_rate += self.alpha * ((0.0 if success else 1.0) - self.ewma_error_rate)
+
+            if admission == PROBE:
+                self.probes_in_flight = max(0, self.probes_in_flight - 1)
+            if admission == PROBE and self.state == HALF_OPEN:
+                if success and latency_ms <= self.latency_threshold_ms:
+                    # Recovered: start the averages afresh from the probe
+                    self.state = CLOSED
+                    self.ewma_latency_ms = latency_ms
+                    self.ewma_error_rate = 0.0
+                    self.window_requests = 1
+                    print("[INFO] Gemini circuit closed after successful probe.")
+                else:
+                    self._trip("probe failed" if not success else f"probe latency {latency_ms:.0f} ms")
+            elif self.state == CLOSED and self.window_requests >= self.min_requests:
+                if self.ewma_error_rate > self.error_threshold:
+                    self._trip(f"error rate {self.ewma_error_rate:.2f}")
+                elif self.ewma_latency_ms > self.latency_threshold_ms:
+                    self._trip(f"latency {self.ewma_latency_ms:.0f} ms")
+
+    def _trip(self, reason: str):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.last_trip_reason = reason
+        self.trips += 1
+        self.window_requests = 0
+        print(f"[WARNING] Gemini circuit opened ({reason}); routing to BLIP for {self.open_seconds}s.")
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            latencies = sorted(self.latencies)
+            open_for = None
+            if self.state == OPEN:
+                open_for = round(max(0.0, self.open_seconds - (time.monotonic() - self.opened_at)), 1)
+            return {
+                "state": self.state,
+                "ewma_latency_ms": round(self.ewma_latency_ms, 1) if self.ewma_latency_ms is not None else None,
+                "ewma_error_rate": round(self.ewma_error_rate, 3),
+                "p50_latency_ms": percentile(latencies, 0.50),
+                "p95_latency_ms": percentile(latencies, 0.95),
+                "p99_latency_ms": percentile(latencies, 0.99),
+                "requests": self.requests,
+                "window_requests": self.window_requests,
+                "trips": self.trips,
+                "last_trip_reason": self.last_trip_reason,
+                "short_circuited": self.short_circuited,
+                "retry_in_seconds": open_for,
+            }
+
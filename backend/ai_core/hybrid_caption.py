@@ -0,0 +1,99 @@
+import asyncio
+import os
+import time
+
+from ai_core.blip_model import generate_caption_with_confidence
+from ai_core.gemini_caption import generate_refined_caption, generate_refined_caption_async
+
+# Below this BLIP confidence the image is sent to Gemini along with the draft
+DEFAULT_CONFIDENCE_THRESHOLD = 0.4
+
+
+def get_confidence_threshold() -> float:
+    return float(os.getenv("HYBRID_CONFIDENCE_THRESHOLD", DEFAULT_CONFIDENCE_THRESHOLD))
+
+
+def _draft_info(draft: str, confidence: float, confidence_threshold: float) -> dict:
+    if confidence_threshold is None:
+        confidence_threshold = get_confidence_threshold()
+    send_image = confidence < confidence_threshold
+    print(f"[DEBUG] Hybrid draft (confidence {confidence:.2f}, send image: {send_image}): {draft}")
+    return {
+        "draft": draft,
+        "confidence": round(confidence, 3),
+        "image_sent": send_image,
+        "payload_bytes": 0,
+        "refined": False,
+        "refine_latency_ms": None,
+    }
+
+
+def _finish_refinement(draft: str, caption: str, info: dict, refine_started: float, error: Exception = None):
+    info["refine_latency_ms"] = round((time.perf_counter() - refine_started) * 1000, 1)
+    if error is not None:
+        # The draft is still a usable caption, so hand it back instead of failing
+        print(f"[ERROR] Gemini refinement failed, returning BLIP draft: {error}")
+        info["error"] = str(error)
+        return draft, info
+    if not caption:
+        print("[WARNING] Gemini refinement returned empty text, returning BLIP draft.")
+        return draft, info
+    info["refined"] = True
+    return caption, info
+
+
+def generate_hybrid_caption(image_data: bytes, model_obj, processor_obj, device, tone: str, length: str, platform: str,
+                            include_hashtags: bool = False, confidence_threshold: float = None, allow_refine=None):
+    """
+    BLIP drafts a factual description locally, then Gemini rewrites it for the platform.
+
+    The Gemini request is text-only, which keeps the payload to a few hundred bytes; the
+    image is only attached when BLIP's confidence in its draft is below the threshold.
+
+    If the refinement fails, the BLIP draft is returned with info["refined"] = False.
+    `allow_refine`, if given, is called right before Gemini is contacted; returning False
+    skips the refinement (e.g. when the Gemini circuit is open).
+
+    :return: (caption, info) where info holds the draft, confidence, whether the image
+             was sent, and the Gemini payload size in bytes.
+    """
+    # A 'long' draft gives Gemini more facts to work from, whatever the requested length
+    draft, confidence = generate_caption_with_confidence(image_data, model_obj, processor_obj, device, 'long')
+    info = _draft_info(draft, confidence, confidence_threshold)
+    if allow_refine is not None and not allow_refine():
+        info["skipped"] = True
+        return draft, info
+
+    refine_started = time.perf_counter()
+    try:
+        caption, info["payload_bytes"] = generate_refined_caption(
+            draft, tone, length, platform, include_hashtags,
+            image_data=image_data if info["image_sent"] else None,
+        )
+    except Exception as e:
+        return _finish_refinement(draft, "", info, refine_started, error=e)
+    return _finish_refinement(draft, caption, info, refine_started)
+
+
+async def generate_hybrid_caption_async(image_data: bytes, model_obj, processor_obj, device, tone: str, length: str, platform: str,
+                                        include_hashtags: bool = False, confidence_threshold: float = None, allow_refine=None,
+                                        executor=None):
+    """Async counterpart of generate_hybrid_caption; the BLIP draft runs on `executor`."""
+    loop = asyncio.get_running_loop()
+    draft, confidence = await loop.run_in_executor(
+        executor, generate_caption_with_confidence, image_data, model_obj, processor_obj, device, 'long'
+    )
+    info = _draft_info(draft, confidence, confidence_threshold)
+    if allow_refine is not None and not allow_refine():
+        info["skipped"] = True
+        return draft, info
+
+    refine_started = time.perf_counter()
+    try:
+        caption, info["payload_bytes"] = await generate_refined_caption_async(
+            draft, tone, length, platform, include_hashtags,
+            image_data=image_data if info["image_sent"] else None,
+        )
+    except Exception as e:
+        return _finish_refinement(draft, "", info, refine_started, error=e)
+    return _finish_refinement(draft, caption, info, refine_started)
@@ -0,0 +1,352 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from ai_core import blip_model as blip_core
+from ai_core import model_store
+
+DEFAULT_MODELS = {
+    "base": blip_core.MODEL_NAME,
+    "large": "Salesforce/blip-image-captioning-large",
+}
+DEFAULT_TIERS = {"fast": "base", "quality": "large"}
+# In-memory fp32 size of the stock checkpoints, the load estimate when the store cannot tell
+DEFAULT_SIZES_MB = {
+    "Salesforce/blip-image-captioning-base": 945.0,
+    "Salesforce/blip-image-captioning-large": 1790.0,
+}
+
+
+class UnknownModelError(KeyError):
+    """Raised when a request names a model or tier the registry does not know."""
+
+    def __str__(self):
+        return str(self.args[0]) if self.args else "Unknown model"
+
+
+class PinnedModelError(ValueError):
+    """Raised when asked to unload the default model, which readiness depends on."""
+
+
+def _parse_mapping(value: str) -> dict:
+    """Parse 'a=b,c=d' into {'a': 'b', 'c': 'd'}."""
+    mapping = {}
+    for pair in (value or "").split(","):
+        key, sep, target = pair.partition("=")
+        if sep and key.strip() and target.strip():
+            mapping[key.strip()] = target.strip()
+    return mapping
+
+
+def _model_size_mb(model) -> float:
+    tensors = list(model.parameters()) + list(model.buffers())
+    return round(sum(t.numel() * t.element_size() for t in tensors) / (1024 * 1024), 1)
+
+
+class ModelHandle:
+    """
+    One loaded model version. Requests hold a reference while they run, so a handle
+    that was swapped out or evicted keeps working until its last request releases it.
+    """
+
+    def __init__(self, name: str, model_name: str, version: str, model, processor, device, load_stats: dict):
+        self.name = name
+        self.model_name = model_name
+        self.version = version
+        self.model = model
+        self.processor = processor
+        self.device = device
+        self.load_stats = load_stats
+        self.size_mb = _model_size_mb(model)
+        self.loaded_at = time.time()
+        self.last_used = self.loaded_at
+        self.refs = 0
+        self.retired = False
+        self._registry = None
+
+    @property
+    def label(self) -> str:
+        return f"{self.name}@{self.version}"
+
+    def release(self):
+        self._registry._release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+    def snapshot(self) -> dict:
+        return {
+            "name": self.name,
+            "model_name": self.model_name,
+            "version": self.version,
+            "device": self.device,
+            "size_mb": self.size_mb,
+            "in_flight": self.refs,
+            "retired": self.retired,
+            "loaded_at": self.loaded_at,
+            "last_used": self.last_used,
+            "load_seconds": self.load_stats.get("load_seconds"),
+        }
+
+
+class ModelRegistry:
+    """
+    Named BLIP captioning models loaded on demand under a memory budget.
+
+    Requests ask for a model by name ('base', 'large') or quality tier ('fast',
+    'quality') and get a ModelHandle from acquire(). Before a model is loaded its
+    size is estimated from the model store manifest, and the least recently used
+    models are evicted so the load fits `memory_budget_mb`; the default model is
+    pinned and never evicted. swap() loads a new version next to the old one and
+    replaces it atomically, while requests already holding the old handle finish
+    on it. Swaps are recorded in the store's swaps.json, and every worker process
+    applies them on its next acquire().
+    """
+
+    def __init__(self, models: dict = None, tiers: dict = None, default: str = "base",
+                 memory_budget_mb: float = 0, store_dir: str = None, loader=None):
+        self.models = dict(models or DEFAULT_MODELS)
+        self.tiers = dict(DEFAULT_TIERS if tiers is None else tiers)
+        self.default = self.tiers.get(default, default)
+        self.memory_budget_mb = memory_budget_mb
+        self.store_dir = store_dir
+        self.loader = loader or blip_core.load_blip_model
+        self.loaded = OrderedDict()  # name -> ModelHandle, least recently used first
+        self.versions = {}  # name -> version to load, set by swaps (None: the store's CURRENT)
+        self.sizes_mb = {}  # model_name -> size measured on its last load
+        self.retired = []  # swapped-out or evicted handles with requests still running
+        self.loads = 0
+        self.evictions = 0
+        self.swaps = 0
+        self._lock = threading.Lock()
+        # One load at a time, so two loads never overshoot the budget together
+        self._load_lock = threading.Lock()
+        self._swaps_lock = threading.Lock()
+        self._swaps_mtime = None
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            models=_parse_mapping(os.getenv("BLIP_MODELS")) or None,
+            tiers=_parse_mapping(os.getenv("BLIP_MODEL_TIERS")) or None,
+            default=os.getenv("BLIP_DEFAULT_MODEL", "base"),
+            memory_budget_mb=float(os.getenv("MODEL_MEMORY_BUDGET_MB", 0)),
+        )
+
+    def resolve(self, name: str = None) -> str:
+        """Map a model name, tier or None (default model) to a registered model name."""
+        name = (name or self.default).strip().lower()
+        name = self.tiers.get(name, name)
+        if name not in self.models:
+            raise UnknownModelError(f"Unknown model '{name}'. Available: {', '.join(sorted(self.models))}; tiers: {', '.join(sorted(self.tiers))}")
+        return name
+
+    # --- Serving ---
+
+    def acquire(self, name: str = None) -> ModelHandle:
+        """
+        Return a handle to the requested model, loading it if needed. The caller must
+        release() it (or use it as a context manager) when the request is done.
+        """
+        name = self.resolve(name)
+        self._apply_recorded_swaps()
+        with self._lock:
+            handle = self.loaded.get(name)
+            if handle is not None:
+                return self._checkout(handle)
+        with self._load_lock:
+            # Another request may have loaded it while this one waited
+            with self._lock:
+                handle = self.loaded.get(name)
+                if handle is not None:
+                    return self._checkout(handle)
+            version = self.versions.get(name)
+            needed_mb = self.estimate_mb(name, version)
+            with self._lock:
+                self._evict_over_budget(keep=name, needed_mb=needed_mb)
+            handle = self._load(name, version)
+            with self._lock:
+                self.loaded[name] = handle
+                self._evict_over_budget(keep=name)
+                return self._checkout(handle)
+
+    def _checkout(self, handle: ModelHandle) -> ModelHandle:
+        handle.refs += 1
+        handle.last_used = time.time()
+        self.loaded.move_to_end(handle.name)
+        return handle
+
+    def _release(self, handle: ModelHandle):
+        with self._lock:
+            handle.refs -= 1
+            if handle.retired and handle.refs <= 0 and handle in self.retired:
+                self.retired.remove(handle)
+                print(f"[INFO] Released retired model {handle.label}.")
+
+    def is_ready(self) -> bool:
+        """Whether the default model is loaded and can serve requests (it is never evicted)."""
+        with self._lock:
+            return self.default in self.loaded
+
+    # --- Loading, eviction and swapping ---
+
+    def estimate_mb(self, name: str, version: str = None, model_name: str = None) -> float:
+        """
+        Expected size of a model before loading it: the store manifest of `version` (None: CURRENT),
+        then the size measured on its last load, then the stock checkpoint size.
+        """
+        model_name = model_name or self.models[name]
+        try:
+            path = model_store.resolve_model_path(model_name, self.store_dir, version)
+            if path:
+                return model_store.weights_size_mb(path)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[WARNING] Could not read the stored size of {model_name}: {e}")
+        return self.sizes_mb.get(model_name) or DEFAULT_SIZES_MB.get(model_name, 0.0)
+
+    def _load(self, name: str, version: str = None, model_name: str = None) -> ModelHandle:
+        model_name = model_name or self.models[name]
+        model, processor, device = self.loader(model_name, self.store_dir, version)
+        load_stats = dict(blip_core.LOAD_STATS)
+        handle = ModelHandle(name, model_name, load_stats.get("version") or "hub", model, processor, device, load_stats)
+        handle._registry = self
+        self.loads += 1
+        self.sizes_mb[model_name] = handle.size_mb
+        print(f"[INFO] Loaded model {handle.label} ({handle.size_mb} MB).")
+        return handle
+
+    def _retire(self, handle: ModelHandle):
+        # Called with _lock held; the handle is freed once its last request releases it
+        handle.retired = True
+        if handle.refs > 0:
+            self.retired.append(handle)
+
+    def _evict_over_budget(self, keep: str, needed_mb: float = 0):
+        """
+        Drop least recently used models until the loaded set plus `needed_mb` (a model about
+        to be loaded) fits the budget. The default model is pinned. Called with _lock held.
+        """
+        if self.memory_budget_mb <= 0:
+            return
+        for name in list(self.loaded):
+            if self.loaded_mb() + needed_mb <= self.memory_budget_mb:
+                break
+            if name in (keep, self.default):
+                continue
+            handle = self.loaded.pop(name)
+            self._retire(handle)
+            self.evictions += 1
+            print(f"[INFO] Evicted model {handle.label} to stay under the {self.memory_budget_mb} MB budget.")
+        if self.loaded_mb() + needed_mb > self.memory_budget_mb:
+            # `keep` and the pinned default do not fit together, or evicted models are still finishing requests
+            print(f"[WARNING] Loaded models would use {round(self.loaded_mb() + needed_mb, 1)} MB, over the {self.memory_budget_mb} MB memory budget.")
+
+    def loaded_mb(self) -> float:
+        return round(sum(h.size_mb for h in self.loaded.values()) + sum(h.size_mb for h in self.retired), 1)
+
+    def load(self, name: str) -> ModelHandle:
+        """Load a model ahead of traffic (e.g. at startup) without holding a reference."""
+        handle = self.acquire(name)
+        handle.release()
+        return handle
+
+    def swap(self, name: str, version: str = None, model_name: str = None, record: bool = True) -> ModelHandle:
+        """
+        Load a new version (or a different checkpoint) for `name` and switch to it atomically.
+
+        The old handle stays alive for requests already using it and is dropped when
+        they finish. New requests get the new handle as soon as this returns; other
+        worker processes pick the swap up from swaps.json on their next acquire().
+
+        :raises UnknownModelError: for an unknown name, or a version that is not in the model store.
+        """
+        name = self.resolve(name)
+        model_name = model_name or self.models[name]
+        if version and model_store.resolve_model_path(model_name, self.store_dir, version) is None:
+            raise UnknownModelError(f"Version '{version}' of {model_name} is not in the model store.")
+        with self._load_lock:
+            needed_mb = self.estimate_mb(name, version, model_name)
+            with self._lock:
+                self._evict_over_budget(keep=name, needed_mb=needed_mb)
+            handle = self._load(name, version, model_name)
+            with self._lock:
+                self.models[name] = handle.model_name
+                self.versions[name] = None if handle.version == "hub" else handle.version
+                old = self.loaded.pop(name, None)
+                self.loaded[name] = handle
+                if old is not None:
+                    self._retire(old)
+                self.swaps += 1
+                self._evict_over_budget(keep=name)
+        print(f"[INFO] Swapped model {name}: {old.label if old else 'none'} -> {handle.label}.")
+        if record:
+            try:
+                self._swaps_mtime = model_store.record_swap(name, handle.model_name, self.versions[name], self.store_dir)
+            except OSError as e:
+                print(f"[ERROR] Failed to record swap of {name}; other workers keep their current version: {e}")
+        return handle
+
+    def _apply_recorded_swaps(self):
+        """Follow swaps other worker processes recorded in the model store since the last check."""
+        if not self._swaps_lock.acquire(blocking=False):
+            return  # another request of this worker is already applying them
+        try:
+            try:
+                mtime, swaps = model_store.read_swaps(self.store_dir, since=self._swaps_mtime)
+            except (OSError, ValueError) as e:
+                print(f"[WARNING] Could not read recorded model swaps: {e}")
+                return
+            self._swaps_mtime = mtime
+            for name, target in (swaps or {}).items():
+                if name not in self.models:
+                    continue
+                model_name, version = target.get("model_name") or self.models[name], target.get("version")
+                with self._lock:
+                    handle = self.loaded.get(name)
+                    if handle is None:
+                        # Not loaded here; the next load uses the swapped version
+                        self.models[name], self.versions[name] = model_name, version
+                        continue
+                    if (handle.model_name, handle.version) == (model_name, version or "hub"):
+                        continue
+                try:
+                    self.swap(name, version, model_name, record=False)
+                except Exception as e:
+                    print(f"[ERROR] Failed to follow recorded swap of {name} to {model_name}@{version}: {e}")
+        finally:
+            self._swaps_lock.release()
+
+    def unload(self, name: str) -> bool:
+        """
+        :raises PinnedModelError: for the default model.
+        """
+        name = self.resolve(name)
+        if name == self.default:
+            raise PinnedModelError(f"Model '{name}' is the default model and cannot be unloaded.")
+        with self._lock:
+            handle = self.loaded.pop(name, None)
+            if handle is None:
+                return False
+            self._retire(handle)
+        print(f"[INFO] Unloaded model {handle.label}.")
+        return True
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "default": self.default,
+                "models": self.models,
+                "versions": self.versions,
+                "tiers": self.tiers,
+                "memory_budget_mb": self.memory_budget_mb,
+                "loaded_mb": self.loaded_mb(),
+                "loaded": [h.snapshot() for h in reversed(self.loaded.values())],
+                "retired": [h.snapshot() for h in self.retired],
+                "loads": self.loads,
+                "evictions": self.evictions,
+                "swaps": self.swaps,
+            }
@@ -0,0 +1,334 @@
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import sys
+import time
+from datetime import datetime
+
+# Default location of the local model store (relative to the backend folder)
+DEFAULT_STORE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "model_store")
+
+MANIFEST_FILE = "manifest.json"
+CURRENT_FILE = "CURRENT"
+SAFETENSORS_INDEX = "model.safetensors.index.json"
+SAFETENSORS_SINGLE = "model.safetensors"
+# Model swaps made through the admin API, so every worker process follows them
+SWAPS_FILE = "swaps.json"
+WEIGHT_SUFFIXES = (".safetensors", ".bin")
+
+
+def _model_slug(model_name: str) -> str:
+    """Turn a Hub name like 'Salesforce/blip-image-captioning-base' into a folder name."""
+    return model_name.replace("/", "--")
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_store_dir(store_dir: str = None) -> str:
+    """Resolve the model store directory from the argument or BLIP_MODEL_STORE."""
+    return store_dir or os.getenv("BLIP_MODEL_STORE") or DEFAULT_STORE_DIR
+
+
+def list_versions(model_name: str, store_dir: str = None) -> list:
+    """Return the versions stored locally for a model, oldest first."""
+    model_dir = os.path.join(get_store_dir(store_dir), _model_slug(model_name))
+    if not os.path.isdir(model_dir):
+        return []
+    return sorted(
+        entry for entry in os.listdir(model_dir)
+        if os.path.isfile(os.path.join(model_dir, entry, MANIFEST_FILE))
+    )
+
+
+def get_current_version(model_name: str, store_dir: str = None):
+    """Return the version the CURRENT pointer refers to, or None."""
+    pointer = os.path.join(get_store_dir(store_dir), _model_slug(model_name), CURRENT_FILE)
+    if not os.path.isfile(pointer):
+        return None
+    with open(pointer, "r", encoding="utf-8") as f:
+        return f.read().strip() or None
+
+
+def set_current_version(model_name: str, version: str, store_dir: str = None):
+    """Atomically point CURRENT at an existing version."""
+    model_dir = os.path.join(get_store_dir(store_dir), _model_slug(model_name))
+    if not os.path.isfile(os.path.join(model_dir, version, MANIFEST_FILE)):
+        raise FileNotFoundError(f"Version '{version}' of {model_name} is not in the model store.")
+    tmp_pointer = os.path.join(model_dir, CURRENT_FILE + ".tmp")
+    with open(tmp_pointer, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(tmp_pointer, os.path.join(model_dir, CURRENT_FILE))
+
+
+def resolve_model_path(model_name: str, store_dir: str = None, version: str = None):
+    """
+    Find the local directory for a stored model.
+
+    :param model_name: Hub name of the model.
+    :param store_dir: Model store root (defaults to BLIP_MODEL_STORE).
+    :param version: Explicit version, otherwise the CURRENT pointer (or newest version).
+    :return: The version directory, or None when the model is not in the store.
+    """
+    version = version or get_current_version(model_name, store_dir)
+    if not version:
+        versions = list_versions(model_name, store_dir)
+        if not versions:
+            return None
+        version = versions[-1]
+    path = os.path.join(get_store_dir(store_dir), _model_slug(model_name), version)
+    return path if os.path.isfile(os.path.join(path, MANIFEST_FILE)) else None
+
+
+def weights_size_mb(model_path: str) -> float:
+    """Size of a stored version's weight files in MB, from its manifest (or the files on disk)."""
+    with open(os.path.join(model_path, MANIFEST_FILE), "r", encoding="utf-8") as f:
+        files = json.load(f).get("files", {})
+    sizes = [info["size"] for name, info in files.items() if name.endswith(WEIGHT_SUFFIXES)]
+    if not sizes:
+        sizes = [os.path.getsize(os.path.join(model_path, name)) for name in _weight_files(model_path)]
+    return round(sum(sizes) / (1024 * 1024), 1)
+
+
+def read_swaps(store_dir: str = None, since=None):
+    """
+    Return (mtime, swaps) for the store's swaps file, where swaps maps a registry name to
+    {"model_name", "version"}. swaps is None when the file is missing or unchanged since `since`.
+    """
+    path = os.path.join(get_store_dir(store_dir), SWAPS_FILE)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return since, None
+    if mtime == since:
+        return mtime, None
+    with open(path, "r", encoding="utf-8") as f:
+        return mtime, json.load(f)
+
+
+def record_swap(name: str, model_name: str, version: str, store_dir: str = None):
+    """Atomically record that registry model `name` now serves `model_name` at `version`. Returns the new mtime."""
+    root = get_store_dir(store_dir)
+    os.makedirs(root, exist_ok=True)
+    path = os.path.join(root, SWAPS_FILE)
+    _, swaps = read_swaps(store_dir)
+    swaps = swaps or {}
+    swaps[name] = {"model_name": model_name, "version": version, "swapped_at": datetime.now().isoformat()}
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(swaps, f, indent=2)
+    os.replace(tmp_path, path)
+    return os.stat(path).st_mtime_ns
+
+
+def fetch_model(model_name: str, store_dir: str = None, version: str = None, source: str = None, make_current: bool = True) -> str:
+    """
+    Download (or convert from a local checkpoint) a BLIP model into the store as safetensors.
+
+    The new version is written to a temporary folder first and renamed into place,
+    so a partially written version is never visible to the loader.
+
+    :param model_name: Hub name of the model, also used as the store key.
+    :param store_dir: Model store root.
+    :param version: Version label (defaults to a timestamp).
+    :param source: Optional local checkpoint directory to convert instead of downloading.
+    :param make_current: Whether to point CURRENT at the new version.
+    :return: Path of the stored version.
+    """
+    from transformers import BlipProcessor, BlipForConditionalGeneration
+
+    version = version or datetime.now().strftime("%Y%m%d%H%M%S")
+    model_dir = os.path.join(get_store_dir(store_dir), _model_slug(model_name))
+    final_dir = os.path.join(model_dir, version)
+    if os.path.exists(final_dir):
+        raise FileExistsError(f"Version '{version}' of {model_name} already exists in the model store.")
+
+    tmp_dir = final_dir + ".partial"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    origin = source or model_name
+    print(f"--- Fetching {origin} into the model store as version {version} ---")
+    try:
+        processor = BlipProcessor.from_pretrained(origin, local_files_only=bool(source))
+        model = BlipForConditionalGeneration.from_pretrained(origin, local_files_only=bool(source))
+        processor.save_pretrained(tmp_dir)
+        model.save_pretrained(tmp_dir, safe_serialization=True)
+
+        files = {}
+        for name in sorted(os.listdir(tmp_dir)):
+            path = os.path.join(tmp_dir, name)
+            files[name] = {"sha256": _sha256(path), "size": os.path.getsize(path)}
+
+        manifest = {
+            "model_name": model_name,
+            "version": version,
+            "source": origin,
+            "created_at": datetime.now().isoformat(),
+            "files": files,
+        }
+        with open(os.path.join(tmp_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+
+        os.replace(tmp_dir, final_dir)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    if make_current:
+        set_current_version(model_name, version, store_dir)
+    print(f"--- Stored {model_name} version {version} at {final_dir} ---")
+    return final_dir
+
+
+def verify_model(model_name: str, store_dir: str = None, version: str = None) -> bool:
+    """Check every file of a stored version against its manifest checksum."""
+    path = resolve_model_path(model_name, store_dir, version)
+    if not path:
+        print(f"[ERROR] {model_name} is not in the model store.")
+        return False
+    with open(os.path.join(path, MANIFEST_FILE), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    ok = True
+    for name, info in manifest["files"].items():
+        file_path = os.path.join(path, name)
+        if not os.path.isfile(file_path) or _sha256(file_path) != info["sha256"]:
+            print(f"[ERROR] Checksum mismatch or missing file: {file_path}")
+            ok = False
+    return ok
+
+
+# --- Memory-mapped safetensors loading ---
+
+_SAFETENSORS_DTYPES = {
+    "F64": "float64",
+    "F32": "float32",
+    "F16": "float16",
+    "BF16": "bfloat16",
+    "I64": "int64",
+    "I32": "int32",
+    "I16": "int16",
+    "I8": "int8",
+    "U8": "uint8",
+    "BOOL": "bool",
+}
+
+
+def _weight_files(model_path: str) -> list:
+    index_path = os.path.join(model_path, SAFETENSORS_INDEX)
+    if os.path.isfile(index_path):
+        with open(index_path, "r", encoding="utf-8") as f:
+            weight_map = json.load(f)["weight_map"]
+        return sorted(set(weight_map.values()))
+    if os.path.isfile(os.path.join(model_path, SAFETENSORS_SINGLE)):
+        return [SAFETENSORS_SINGLE]
+    raise FileNotFoundError(f"No safetensors weights found in {model_path}")
+
+
+def mmap_safetensors(file_path: str) -> dict:
+    """
+    Map a safetensors file into memory and return tensors that view the mapping.
+
+    The file is mapped copy-on-write, so the page cache is shared between every
+    process that loads the same weights and nothing is copied until a tensor is written.
+    """
+    import torch
+
+    with open(file_path, "rb") as f:
+        header_len = int.from_bytes(f.read(8), "little")
+        header = json.loads(f.read(header_len))
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    data_start = 8 + header_len
+    tensors = {}
+    for name, info in header.items():
+        if name == "__metadata__":
+            continue
+        dtype = getattr(torch, _SAFETENSORS_DTYPES[info["dtype"]])
+        begin, end = info["data_offsets"]
+        shape = info["shape"]
+        if end == begin:
+            tensors[name] = torch.empty(shape, dtype=dtype)
+            continue
+        count = (end - begin) // torch.empty((), dtype=dtype).element_size()
+        flat = torch.frombuffer(mapped, dtype=dtype, count=count, offset=data_start + begin)
+        tensors[name] = flat.view(shape)
+    return tensors
+
+
+def load_mmap_model(model_path: str, model_cls):
+    """
+    Build a model from its config and assign memory-mapped safetensors weights to it.
+
+    The module is constructed without running weight initialisation, so its placeholder
+    parameters are never touched and do not add to RSS before being replaced.
+    """
+    from transformers import AutoConfig
+
+    try:
+        from transformers.modeling_utils import no_init_weights
+    except ImportError:
+        no_init_weights = None
+
+    config = AutoConfig.from_pretrained(model_path, local_files_only=True)
+    if no_init_weights is not None:
+        with no_init_weights():
+            model = model_cls(config)
+    else:
+        model = model_cls(config)
+
+    state_dict = {}
+    for name in _weight_files(model_path):
+        state_dict.update(mmap_safetensors(os.path.join(model_path, name)))
+
+    result = model.load_state_dict(state_dict, strict=False, assign=True)
+    model.tie_weights()
+    if result.unexpected_keys:
+        print(f"[WARNING] Unexpected keys in stored weights: {result.unexpected_keys[:5]}")
+    # Keys missing from the file are expected only for weights tied to another tensor
+    tied = {name for name, _ in model.named_parameters(remove_duplicate=False)} - {name for name, _ in model.named_parameters()}
+    untied_missing = [key for key in result.missing_keys if key not in tied]
+    if untied_missing:
+        raise RuntimeError(f"Stored weights are missing keys: {untied_missing[:5]}")
+
+    model.eval()
+    return model
+
+
+def current_rss_mb():
+    """Return the resident set size of this process in MB, or None if unavailable."""
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    try:
+        import resource
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and KB on Linux
+        return round(max_rss / (1024 * 1024) if sys.platform == "darwin" else max_rss / 1024, 1)
+    except ImportError:
+        return None
+
+
+def timed_load(load_fn):
+    """Run a load function and return its result together with timing and RSS figures."""
+    rss_before = current_rss_mb()
+    start = time.perf_counter()
+    result = load_fn()
+    stats = {
+        "load_seconds": round(time.perf_counter() - start, 3),
+        "rss_before_mb": rss_before,
+        "rss_after_mb": current_rss_mb(),
+    }
+    return result, stats
@@ -0,0 +1,69 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled continuously at `rate_per_minute`.
+
+    acquire() blocks until enough tokens are available; pause() stops all
+    acquisitions until a deadline, which is how a server Retry-After is honoured.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: float = None):
+        if rate_per_minute <= 0:
+            raise ValueError("rate_per_minute must be positive")
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        if now <= self.updated_at:
+            return
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self, amount: float = 1):
+        """Block until `amount` tokens have been taken from the bucket."""
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                elif self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                else:
+                    wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        """Hold every caller for `seconds` and drain the bucket so traffic restarts gently."""
+        with self._lock:
+            now = time.monotonic()
+            self.paused_until = max(self.paused_until, now + seconds)
+            self.tokens = 0.0
+            self.updated_at = self.paused_until
+
+
+class QuotaLimiter:
+    """Combined requests-per-minute and tokens-per-minute limiter for one API quota."""
+
+    def __init__(self, rpm: float, tpm: float = None):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm) if tpm else None
+
+    def acquire(self, tokens: float = 0):
+        self.requests.acquire(1)
+        if self.tokens and tokens:
+            self.tokens.acquire(tokens)
+
+    def pause(self, seconds: float):
+        self.requests.pause(seconds)
+        if self.tokens:
+            self.tokens.pause(seconds)
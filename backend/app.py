@@ -6,8 +6,12 @@ from dotenv import load_dotenv
 import google.generativeai as genai # Import genai here
 
 # AI Core Imports
-from ai_core.blip_model import load_blip_model
+from ai_core import blip_model as blip_core
+from ai_core.model_registry import ModelRegistry
 from ai_core.gemini_caption import configure_gemini
+from ai_core.cpu_tuning import apply_cpu_config
+from ai_core.caption_metrics import CaptionMetrics
+from ai_core.gemini_router import GeminiRouter
 
 # Load environment variables
 load_dotenv()
@@ -21,33 +25,42 @@ print(f"[DEBUG] FRONTEND_URL: {os.getenv('FRONTEND_URL')}")
 print(f"[DEBUG] BACKEND_URL: {os.getenv('BACKEND_URL')}")
 
 # Blueprint imports
-from routes.auth import auth_blueprint
+from routes.auth import auth_blueprint, ensure_user_indexes
+from routes.caption_common import ensure_caption_indexes
+from routes.session_auth import BcryptExecutor, check_session_config
 from routes.captioning import captioning_blueprint
-
-# Global BLIP variables
-BLIP_MODEL = None
-BLIP_PROCESSOR = None
-BLIP_DEVICE = "cpu"
-
+from routes.admin import admin_blueprint
+from request_profiler import RequestProfiler
 
 def create_app():
-    global BLIP_MODEL, BLIP_PROCESSOR, BLIP_DEVICE
+    # Refuse to start with session auth on and no shared SESSION_SECRET
+    check_session_config()
 
     app = Flask(__name__)
     CORS(app)
 
     # -------------------------------
-    # 1. Load BLIP Model
+    # 1. Load BLIP Models
     # -------------------------------
+    # Size torch thread pools (and optional CPU pinning) for this worker before any inference
     try:
-        BLIP_MODEL, BLIP_PROCESSOR, BLIP_DEVICE = load_blip_model()
+        app.cpu_config = apply_cpu_config()
+    except Exception as e:
+        app.cpu_config = {}
+        print(f"[ERROR] Failed to apply CPU config: {e}")
+
+    # Named models (BLIP_MODELS, BLIP_MODEL_TIERS) kept under MODEL_MEMORY_BUDGET_MB; only the
+    # default one is loaded up front, the others on first request
+    app.model_registry = ModelRegistry.from_env()
+    try:
+        app.model_registry.load(app.model_registry.default)
         print("[INFO] BLIP model loaded successfully.")
     except Exception as e:
         print(f"[ERROR] Failed to load BLIP model: {e}")
 
-    app.blip_model = BLIP_MODEL
-    app.blip_processor = BLIP_PROCESSOR
-    app.blip_device = BLIP_DEVICE
+    app.blip_load_stats = blip_core.LOAD_STATS
+    app.caption_metrics = CaptionMetrics()
+    app.gemini_router = GeminiRouter.from_env()
 
     # Temporary: List available Gemini models for debugging
     print("[DEBUG] Listing available Gemini models...")
@@ -81,19 +94,39 @@ def create_app():
     app.config["MONGO_URI"] = mongo_uri
     mongo = PyMongo(app)
     app.mongo = mongo
+    if mongo.db is not None:
+        ensure_user_indexes(mongo.db)
+        ensure_caption_indexes(mongo.db)
+
+    # Password hashing runs here instead of on request threads (BCRYPT_WORKERS, BCRYPT_MAX_QUEUE),
+    # with at most half of WEB_THREADS waiting on it
+    app.bcrypt_executor = BcryptExecutor.from_env()
 
     # -------------------------------
     # 4. Register Blueprints
     # -------------------------------
     app.register_blueprint(auth_blueprint, url_prefix='/api/auth')
     app.register_blueprint(captioning_blueprint, url_prefix='/api/caption')
+    app.register_blueprint(admin_blueprint, url_prefix='/api/admin')
+
+    # Opt-in request profiling (armed via /api/admin/profiling or the X-Profile-Request header)
+    RequestProfiler().init_app(app)
 
     # -------------------------------
     # 5. Optional: Health Check
     # -------------------------------
     @app.route("/api/health", methods=["GET"])
     def health_check():
-        return jsonify({"status": "ok"}), 200
+        return jsonify({"status": "ok", "blip_load": app.blip_load_stats, "models": app.model_registry.snapshot(), "cpu_config": app.cpu_config}), 200
+
+    @app.route("/api/ready", methods=["GET"])
+    def readiness_check():
+        # Ready as long as BLIP can serve; an open Gemini circuit only degrades quality
+        routing = app.gemini_router.snapshot()
+        if not app.model_registry.is_ready():
+            return jsonify({"status": "not_ready", "reason": "BLIP model not loaded", "gemini_routing": routing}), 503
+        status = "degraded" if routing["state"] != "closed" else "ready"
+        return jsonify({"status": status, "gemini_routing": routing}), 200
 
     return app
 
@@ -0,0 +1,95 @@
+"""
+ASGI entry point: the caption and history routes run as coroutines on Quart,
+everything else (auth, admin, health) is the existing Flask app served through
+an ASGI-to-WSGI adapter on a thread pool.
+
+    python serve.py --mode async
+    uvicorn asgi_app:create_asgi_app --factory --port 5123
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from motor.motor_asyncio import AsyncIOMotorClient
+from quart import Quart
+from quart_cors import cors
+
+from app import create_app
+from routes.captioning_async import async_captioning_blueprint
+
+ASYNC_PREFIX = "/api/caption"
+
+# App state created by create_app() that the async routes share
+SHARED_STATE = ("model_registry", "caption_metrics", "gemini_router", "cpu_config")
+
+
+class _ThreadedWsgiInstance(WsgiToAsgiInstance):
+    executor = None
+
+    async def run_wsgi_app(self, body):
+        # The base class runs every request on asgiref's single thread-sensitive thread,
+        # which would serialize all Flask routes; run them on the pool instead.
+        run = WsgiToAsgiInstance.__dict__["run_wsgi_app"].func
+        return await sync_to_async(run, thread_sensitive=False, executor=self.executor)(self, body)
+
+
+class ThreadedWsgiToAsgi(WsgiToAsgi):
+    """WsgiToAsgi that serves concurrent WSGI requests on `threads` worker threads."""
+
+    def __init__(self, wsgi_application, threads: int):
+        super().__init__(wsgi_application)
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="wsgi")
+
+    async def __call__(self, scope, receive, send):
+        instance = _ThreadedWsgiInstance(self.wsgi_application, self.duplicate_header_limit)
+        instance.executor = self.executor
+        await instance(scope, receive, send)
+
+
+class PrefixDispatcher:
+    """Send HTTP requests under `prefix` (and lifespan events) to one ASGI app, the rest to another."""
+
+    def __init__(self, prefix: str, prefixed_app, default_app):
+        self.prefix = prefix
+        self.prefixed_app = prefixed_app
+        self.default_app = default_app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan" or scope.get("path", "").startswith(self.prefix):
+            await self.prefixed_app(scope, receive, send)
+        else:
+            await self.default_app(scope, receive, send)
+
+
+def create_asgi_app():
+    flask_app = create_app()
+
+    quart_app = cors(Quart(__name__), allow_origin="*")
+    for name in SHARED_STATE:
+        setattr(quart_app, name, getattr(flask_app, name))
+
+    # BLIP is CPU-bound and already multi-threaded inside torch, so a small pool is enough
+    quart_app.blip_executor = ThreadPoolExecutor(
+        max_workers=int(os.getenv("BLIP_EXECUTOR_WORKERS", 1)), thread_name_prefix="blip"
+    )
+
+    @quart_app.before_serving
+    async def connect_mongo():
+        # Motor binds to the running event loop, so connect once serving has started
+        quart_app.motor_client = AsyncIOMotorClient(os.getenv("MONGO_URI"))
+        quart_app.motor_db = quart_app.motor_client.get_default_database()
+
+    @quart_app.after_serving
+    async def close_mongo():
+        quart_app.motor_client.close()
+        quart_app.blip_executor.shutdown(wait=False)
+
+    quart_app.register_blueprint(async_captioning_blueprint, url_prefix=ASYNC_PREFIX)
+    # Arming profiling through the admin API covers the async routes too; sampled
+    # profiles include the BLIP executor threads, where model time is spent
+    flask_app.profiler.init_async_app(quart_app, executor_threads=("blip",))
+
+    # Auth, admin and health stay blocking Flask views, so they get the same thread count as sync mode
+    wsgi_app = ThreadedWsgiToAsgi(flask_app, threads=int(os.getenv("WEB_THREADS", 16)))
+    return PrefixDispatcher(ASYNC_PREFIX, quart_app, wsgi_app)
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Sweep BLIP inference settings on this machine and record the best configuration.
+
+Every combination of (workers x intra-op threads x batch size) is run with one
+process per worker, each pinned to its own slice of physical cores. Batch size 1
+captions one synthetic image per call as the API does; larger batches go through
+generate_caption_batch in one forward pass. The best batch-1 setting for
+throughput (images/s) and for latency (p95 per call) is written to
+blip_tuning.json, which the backend reads at startup via ai_core/cpu_tuning.py.
+The best setting across all batch sizes is recorded as "batch_throughput", for
+offline jobs that can caption several images per call.
+
+Usage:
+    python autotune_blip.py
+    python autotune_blip.py --workers 1,2,4 --threads 1,2,4 --batch 1,4 --iterations 5 --no-pin
+"""
+import argparse
+import io
+import json
+import multiprocessing as mp
+import queue
+import statistics
+import sys
+import time
+from datetime import datetime
+
+from ai_core.cpu_tuning import DEFAULT_TUNING_FILE, available_cpus, physical_core_groups
+
+
+def _int_list(text: str) -> list:
+    return [int(x) for x in text.split(",") if x.strip()]
+
+
+def _synthetic_image() -> bytes:
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (384, 384), color=(40, 90, 160)).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def _worker(worker_index, workers, threads, batch_size, iterations, pin, length, barrier, barrier_timeout, results):
+    from ai_core.cpu_tuning import apply_cpu_config
+    from ai_core.blip_model import load_blip_model, generate_caption, generate_caption_batch
+
+    apply_cpu_config(worker_index=worker_index, workers=workers, intra_op_threads=threads, inter_op_threads=1, pin=pin)
+    model, processor, device = load_blip_model()
+    image = _synthetic_image()
+    if batch_size == 1:
+        def caption():
+            generate_caption(image, model, processor, device, length)
+    else:
+        images = [image] * batch_size
+
+        def caption():
+            generate_caption_batch(images, model, processor, device, length)
+    caption()  # warm-up
+
+    # Raises BrokenBarrierError if a sibling died, so this worker exits instead of hanging
+    barrier.wait(timeout=barrier_timeout)
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        caption()
+        latencies.append(time.perf_counter() - t0)
+    results.put({"elapsed": time.perf_counter() - start, "latencies": latencies})
+
+
+class WorkerFailed(RuntimeError):
+    """A sweep worker crashed or did not report back in time."""
+
+
+def _collect(procs, results, timeout: float) -> list:
+    """Wait for one result per worker, failing fast if a worker exits without reporting."""
+    outputs, deadline = [], time.monotonic() + timeout
+    while len(outputs) < len(procs):
+        try:
+            outputs.append(results.get(timeout=1))
+            continue
+        except queue.Empty:
+            pass
+        crashed = [p for p in procs if p.exitcode not in (None, 0)]
+        if crashed:
+            raise WorkerFailed(f"worker exited with code {crashed[0].exitcode}")
+        if time.monotonic() > deadline:
+            raise WorkerFailed(f"no result after {timeout:.0f}s")
+    return outputs
+
+
+def run_config(workers, threads, batch_size, iterations, pin, length, timeout: float) -> dict:
+    ctx = mp.get_context("spawn")
+    barrier = ctx.Barrier(workers)
+    results = ctx.Queue()
+    procs = [
+        ctx.Process(target=_worker, args=(i, workers, threads, batch_size, iterations, pin, length, barrier, timeout, results))
+        for i in range(workers)
+    ]
+    for proc in procs:
+        proc.start()
+    try:
+        outputs = _collect(procs, results, timeout)
+    finally:
+        for proc in procs:
+            proc.join(timeout=5)
+            if proc.is_alive():
+                proc.terminate()
+                proc.join()
+
+    latencies = sorted(l for out in outputs for l in out["latencies"])
+    wall = max(out["elapsed"] for out in outputs)
+    images = workers * iterations * batch_size
+    return {
+        "workers": workers,
+        "intra_op_threads": threads,
+        "inter_op_threads": 1,
+        "batch_size": batch_size,
+        "pin": pin,
+        "images_per_sec": round(images / wall, 3),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "p95_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 1),
+    }
+
+
+def main():
+    cores = len(physical_core_groups())
+    parser = argparse.ArgumentParser(description="Autotune BLIP workers x threads x batch size on this machine.")
+    parser.add_argument("--workers", default="1,2,4", help="Comma-separated worker counts to try")
+    parser.add_argument("--threads", default=",".join(str(t) for t in (1, 2, 4, 8) if t <= cores), help="Comma-separated intra-op thread counts")
+    parser.add_argument("--batch", default="1,2,4", help="Comma-separated batch sizes (1 is what the API serves)")
+    parser.add_argument("--iterations", type=int, default=5, help="Timed caption calls per worker")
+    parser.add_argument("--length", default="short", help="Caption length preference used for the sweep")
+    parser.add_argument("--timeout", type=float, default=600, help="Seconds to wait for one configuration (model load included)")
+    parser.add_argument("--no-pin", action="store_true", help="Do not pin workers to CPU cores")
+    parser.add_argument("--output", default=DEFAULT_TUNING_FILE)
+    args = parser.parse_args()
+
+    results = []
+    for workers in _int_list(args.workers):
+        for threads in _int_list(args.threads):
+            if workers * threads > cores:
+                continue  # would oversubscribe the physical cores
+            for batch_size in _int_list(args.batch):
+                print(f"--- workers={workers} threads={threads} batch={batch_size} ---")
+                try:
+                    result = run_config(workers, threads, batch_size, args.iterations, not args.no_pin, args.length, args.timeout)
+                except WorkerFailed as e:
+                    print(f"[ERROR] Skipping workers={workers} threads={threads} batch={batch_size}: {e}")
+                    continue
+                print(f"    {result['images_per_sec']} img/s, p50 {result['p50_ms']} ms, p95 {result['p95_ms']} ms per call")
+                results.append(result)
+
+    # The API captions one image per request, so only batch-1 results can configure serving
+    serving = [r for r in results if r["batch_size"] == 1]
+    if not serving:
+        print("[ERROR] No batch-1 configuration fits on this machine.")
+        return 1
+
+    best_throughput = max(serving, key=lambda r: r["images_per_sec"])
+    best_latency = min(serving, key=lambda r: (r["p95_ms"], -r["images_per_sec"]))
+    report = {
+        "generated_at": datetime.now().isoformat(),
+        "host": {"logical_cpus": len(available_cpus()), "physical_cores": cores},
+        "throughput": best_throughput,
+        "latency": best_latency,
+        "batch_throughput": max(results, key=lambda r: r["images_per_sec"]),
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"Best throughput: {best_throughput}")
+    print(f"Best latency:    {best_latency}")
+    print(f"Best batched:    {report['batch_throughput']}")
+    print(f"Wrote {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
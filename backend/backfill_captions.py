@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+Re-caption stored images with Gemini, e.g. after the prompt style changed.
+
+Target caption documents are streamed from Mongo with a cursor, Gemini calls run
+concurrently under a token-bucket limiter sized to the RPM/TPM quota, 429s are
+retried after the server's Retry-After, results are written back with batched
+bulk_write, and progress is checkpointed so an interrupted job can resume.
+
+Usage:
+    python backfill_captions.py --job restyle-2026-10 --rpm 15 --tpm 1000000 --concurrency 8
+    python backfill_captions.py --job restyle-2026-10 --platform instagram --tone creative
+
+Against the local fake Gemini:
+    python fake_gemini_server.py --port 8089 --rpm 30
+    GEMINI_API_ENDPOINT=http://127.0.0.1:8089 python backfill_captions.py --job test --rpm 30
+"""
+import argparse
+import base64
+import os
+import sys
+import time
+from collections import deque
+from itertools import chain
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from dotenv import load_dotenv
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import CursorNotFound
+
+from ai_core.gemini_caption import (
+    configure_gemini,
+    build_gemini_prompt,
+    estimate_gemini_tokens,
+    request_gemini_caption,
+    is_rate_limit_error,
+    retry_after_seconds,
+)
+from ai_core.rate_limiter import QuotaLimiter
+from routes.caption_stats import rebuild_stats
+
+# Fields needed to re-caption a document
+TARGET_PROJECTION = {"caption": 1, "image_url": 1, "platform": 1, "tone": 1, "length": 1}
+
+
+def decode_image_url(image_url: str) -> bytes:
+    """Decode the data URL stored in caption documents back to raw image bytes."""
+    _, _, encoded = image_url.partition("base64,")
+    return base64.b64decode(encoded)
+
+
+class BackfillJob:
+    def __init__(self, db, job_name: str, query: dict, limiter: QuotaLimiter, concurrency: int = 4,
+                 batch_size: int = 100, max_retries: int = 5, overrides: dict = None, include_hashtags: bool = False,
+                 dry_run: bool = False):
+        self.db = db
+        self.captions = db.captions
+        self.checkpoints = db.backfill_checkpoints
+        self.job_name = job_name
+        self.query = query
+        self.limiter = limiter
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.overrides = overrides or {}
+        self.include_hashtags = include_hashtags
+        self.dry_run = dry_run
+        self.pending_writes = []
+        self.stats = {"processed": 0, "updated": 0, "failed": 0, "skipped": 0}
+        self.last_id = None
+        self.last_dispatched = None
+        # Documents that failed are re-queued at the start of the next run instead of being skipped for good
+        self.failed_ids = []
+        self.retry_ids = set()
+
+    # --- Checkpointing ---
+
+    def load_checkpoint(self):
+        checkpoint = self.checkpoints.find_one({"_id": self.job_name})
+        if checkpoint:
+            self.last_id = checkpoint.get("last_id")
+            self.stats.update(checkpoint.get("stats", {}))
+            self.failed_ids = list(checkpoint.get("failed_ids", []))
+            print(f"[INFO] Resuming job '{self.job_name}' after {self.last_id} ({self.stats['processed']} already processed, "
+                  f"{len(self.failed_ids)} failed to retry).")
+        return checkpoint
+
+    def save_checkpoint(self, done: bool = False):
+        if self.dry_run:
+            return
+        self.checkpoints.update_one(
+            {"_id": self.job_name},
+            {"$set": {"last_id": self.last_id, "failed_ids": self.failed_ids, "stats": self.stats, "done": done, "updatedAt": datetime.now()}},
+            upsert=True,
+        )
+
+    # --- Work ---
+
+    def iter_failed(self):
+        """Documents that failed in an earlier run, retried before resuming after the checkpoint."""
+        if not self.retry_ids:
+            return
+        query = dict(self.query)
+        query["_id"] = {"$in": sorted(self.retry_ids)}
+        found = set()
+        for doc in self.captions.find(query, TARGET_PROJECTION).sort("_id", 1):
+            found.add(doc["_id"])
+            yield doc
+        self.drop_missing(self.retry_ids - found)
+
+    def drop_missing(self, missing_ids):
+        """Forget failed documents that were deleted or no longer match the job, so they stop failing every run."""
+        if not missing_ids:
+            return
+        self.retry_ids -= missing_ids
+        self.failed_ids = [doc_id for doc_id in self.failed_ids if doc_id not in missing_ids]
+        self.stats["failed"] -= len(missing_ids)
+        print(f"[INFO] Dropped {len(missing_ids)} failed document(s) that no longer match the job.")
+
+    def iter_targets(self):
+        """Stream target documents in _id order, reopening the cursor if the server drops it."""
+        while True:
+            query = dict(self.query)
+            if self.last_dispatched is not None:
+                query["_id"] = {"$gt": self.last_dispatched}
+            cursor = self.captions.find(query, TARGET_PROJECTION).sort("_id", 1).batch_size(self.batch_size)
+            try:
+                for doc in cursor:
+                    self.last_dispatched = doc["_id"]
+                    yield doc
+                return
+            except CursorNotFound:
+                print("[WARNING] Cursor expired, reopening from the last dispatched document.")
+            finally:
+                cursor.close()
+
+    def recaption(self, doc):
+        """Generate a new caption for one document, retrying on rate limits. Returns the caption or None."""
+        tone = self.overrides.get("tone") or doc.get("tone", "casual")
+        length = self.overrides.get("length") or doc.get("length", "short")
+        platform = self.overrides.get("platform") or doc.get("platform", "general")
+        prompt = build_gemini_prompt(tone, length, platform, self.include_hashtags)
+        image_bytes = decode_image_url(doc["image_url"])
+        tokens = estimate_gemini_tokens(prompt)
+
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire(tokens)
+            try:
+                return request_gemini_caption(image_bytes, tone, length, platform, self.include_hashtags, prompt=prompt) or None
+            except Exception as e:
+                if attempt == self.max_retries:
+                    print(f"[ERROR] Giving up on {doc['_id']} after {attempt + 1} attempts: {e}")
+                    return None
+                if is_rate_limit_error(e):
+                    delay = retry_after_seconds(e) or min(60, 2 ** attempt)
+                    print(f"[WARNING] Gemini quota hit, pausing all workers for {delay:.1f}s.")
+                    self.limiter.pause(delay)
+                else:
+                    time.sleep(min(30, 2 ** attempt))
+        return None
+
+    def collect(self, doc, future):
+        new_caption = future.result()
+        retry = doc["_id"] in self.retry_ids
+        if retry:
+            # Already counted as processed and failed by the run that first tried it
+            self.retry_ids.discard(doc["_id"])
+            if new_caption is not None:
+                self.failed_ids.remove(doc["_id"])
+                self.stats["failed"] -= 1
+        else:
+            self.stats["processed"] += 1
+            if new_caption is None:
+                self.stats["failed"] += 1
+                self.failed_ids.append(doc["_id"])
+        if new_caption is not None and new_caption == doc.get("caption"):
+            self.stats["skipped"] += 1
+        elif new_caption is not None:
+            now = datetime.now()
+            # Filter on the old caption so edits made while the job runs are not overwritten
+            self.pending_writes.append(UpdateOne(
+                {"_id": doc["_id"], "caption": doc.get("caption")},
+                {"$set": {
+                    "caption": new_caption,
+                    "model_used": "gemini",
+                    "updatedAt": now,
+                    "backfill": {"job": self.job_name, "at": now, "previous_caption": doc.get("caption")},
+                }},
+            ))
+        if not retry:
+            # Failures are tracked in failed_ids, so the checkpoint can move past them
+            self.last_id = doc["_id"]
+        if len(self.pending_writes) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.pending_writes and not self.dry_run:
+            result = self.captions.bulk_write(self.pending_writes, ordered=False)
+            self.stats["updated"] += result.modified_count
+        elif self.dry_run:
+            self.stats["updated"] += len(self.pending_writes)
+        self.pending_writes = []
+        self.save_checkpoint()
+        print(f"[INFO] Checkpoint at {self.last_id}: {self.stats}")
+
+    def run(self):
+        self.load_checkpoint()
+        self.last_dispatched = self.last_id
+        self.retry_ids = set(self.failed_ids)
+        start = time.perf_counter()
+
+        # Futures are collected in dispatch order, so the checkpoint never skips
+        # over a document whose result has not been written yet.
+        in_flight = deque()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            for doc in chain(self.iter_failed(), self.iter_targets()):
+                in_flight.append((doc, executor.submit(self.recaption, doc)))
+                while in_flight and (in_flight[0][1].done() or len(in_flight) >= self.concurrency * 2):
+                    self.collect(*in_flight.popleft())
+            while in_flight:
+                self.collect(*in_flight.popleft())
+
+        self.flush()
+        self.save_checkpoint(done=True)
+        elapsed = time.perf_counter() - start
+        print(f"[INFO] Backfill '{self.job_name}' finished in {elapsed:.1f}s: {self.stats}")
+        return self.stats
+
+
+def build_query(args) -> dict:
+    query = {"image_url": {"$exists": True}}
+    if args.user:
+        query["user_id"] = args.user
+    if args.platform:
+        query["platform"] = {"$in": [p.lower() for p in args.platform]}
+    if args.model_used:
+        query["model_used"] = {"$in": args.model_used}
+    if args.before:
+        query["createdAt"] = {"$lt": datetime.fromisoformat(args.before)}
+    return query
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Re-caption stored images with Gemini under the API quota.")
+    parser.add_argument("--job", required=True, help="Job name, used as the checkpoint key")
+    parser.add_argument("--rpm", type=float, default=float(os.getenv("GEMINI_RPM", 15)), help="Gemini requests-per-minute quota")
+    parser.add_argument("--tpm", type=float, default=float(os.getenv("GEMINI_TPM", 1000000)), help="Gemini tokens-per-minute quota")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=100, help="Cursor batch size and bulk_write size")
+    parser.add_argument("--max-retries", type=int, default=5)
+    parser.add_argument("--user", help="Only captions of this user_id")
+    parser.add_argument("--platform", action="append", help="Only these platforms (repeatable)")
+    parser.add_argument("--model-used", action="append", help="Only captions produced by these models (repeatable)")
+    parser.add_argument("--before", help="Only captions created before this ISO date")
+    parser.add_argument("--tone", help="Override the stored tone")
+    parser.add_argument("--length", help="Override the stored length")
+    parser.add_argument("--hashtags", action="store_true", help="Ask Gemini to include hashtags")
+    parser.add_argument("--reset", action="store_true", help="Discard the job's checkpoint and start over")
+    parser.add_argument("--dry-run", action="store_true", help="Call Gemini but do not write results")
+    args = parser.parse_args()
+
+    mongo_uri = os.getenv("MONGO_URI")
+    if not mongo_uri:
+        print("[ERROR] MONGO_URI not set in environment variables.")
+        return 1
+    if not configure_gemini():
+        print("[ERROR] Gemini API not configured.")
+        return 1
+
+    db = MongoClient(mongo_uri).get_default_database()
+    if args.reset:
+        db.backfill_checkpoints.delete_one({"_id": args.job})
+
+    job = BackfillJob(
+        db,
+        args.job,
+        build_query(args),
+        QuotaLimiter(args.rpm, args.tpm),
+        concurrency=args.concurrency,
+        batch_size=args.batch_size,
+        max_retries=args.max_retries,
+        overrides={"tone": args.tone, "length": args.length},
+        include_hashtags=args.hashtags,
+        dry_run=args.dry_run,
+    )
+    stats = job.run()
+    if not args.dry_run:
+        # The job rewrites model_used and updatedAt outside the API, so recount the dashboard stats
+        rebuild_stats(db, user_id=args.user)
+    return 0 if stats["failed"] == 0 else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Load benchmark for the caption backend: compare sync (WSGI) and async (ASGI) serving.
+
+Start both servers (e.g. with the fake Gemini so upstream latency is controlled):
+    python fake_gemini_server.py --port 8089 --rpm 0 --latency 0.5
+    GEMINI_API_ENDPOINT=http://127.0.0.1:8089 python serve.py --mode sync  --port 5123
+    GEMINI_API_ENDPOINT=http://127.0.0.1:8089 python serve.py --mode async --port 5124
+
+Then run:
+    python bench_serving.py --target sync=http://127.0.0.1:5123 --target async=http://127.0.0.1:5124 \
+        --scenario history --scenario generate --concurrency 16,64,256 --requests 2000
+
+Auth throughput: 'login' and 'register' measure the bcrypt path, 'stats' the
+token-verified hot path. The bench user is registered on first use and logged in
+once per target to get the session token the caption routes require.
+    python bench_serving.py --target sync=http://127.0.0.1:5123 --scenario login --scenario stats --concurrency 4,16,64
+"""
+import argparse
+import asyncio
+import io
+import json
+import statistics
+import sys
+import time
+import uuid
+
+import httpx
+
+
+def _test_image() -> bytes:
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (256, 256), color=(30, 120, 200)).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+SCENARIOS = ("health", "history", "generate", "stats", "login", "register")
+# Scenarios that hit caption/history routes and need a session token
+TOKEN_SCENARIOS = ("history", "generate", "stats")
+
+
+def _registration(username: str, password: str) -> dict:
+    return {
+        "username": username,
+        "email": f"{username}@bench.local",
+        "password": password,
+        "confirm_password": password,
+        "security_question": "bench",
+        "security_answer": "bench",
+    }
+
+
+def build_request(scenario: str, args, image: bytes, token: str = None, seq: int = 0):
+    """Return (method, path, kwargs) for one request of a scenario."""
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    if scenario == "health":
+        return "GET", "/api/health", {}
+    if scenario == "history":
+        return "GET", f"/api/caption/user_captions/{args.user}", {"headers": headers}
+    if scenario == "stats":
+        return "GET", f"/api/caption/stats/{args.user}", {"headers": headers}
+    if scenario == "generate":
+        return "POST", "/api/caption/generate", {
+            "files": {"image": ("bench.jpg", image, "image/jpeg")},
+            "data": {"ai_model": args.model, "platform": "instagram", "tone": "casual", "length": "short", "user_id": args.user},
+            "headers": headers,
+        }
+    if scenario == "login":
+        return "POST", "/api/auth/login", {"json": {"username": args.user, "password": args.password}}
+    if scenario == "register":
+        # Unique per request, so every call pays for the uniqueness query, two hashes and the insert
+        return "POST", "/api/auth/register", {"json": _registration(f"{args.user}_{args.run_id}_{seq}", args.password)}
+    raise ValueError(f"Unknown scenario: {scenario}")
+
+
+async def fetch_token(base_url: str, args):
+    """Log the bench user in (registering it first if needed) and return its session token."""
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout) as client:
+        credentials = {"username": args.user, "password": args.password}
+        response = await client.post("/api/auth/login", json=credentials)
+        if response.status_code == 401:
+            await client.post("/api/auth/register", json=_registration(args.user, args.password))
+            response = await client.post("/api/auth/login", json=credentials)
+        if response.status_code != 200:
+            print(f"[WARNING] Could not log in as {args.user} on {base_url} ({response.status_code}); running without a token.")
+            return None
+        return response.json().get("token")
+
+
+async def run_level(base_url: str, scenario: str, concurrency: int, total: int, args, image: bytes, token: str = None) -> dict:
+    latencies, errors = [], 0
+    counter = iter(range(total))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        async def worker():
+            nonlocal errors
+            for seq in counter:
+                method, path, kwargs = build_request(scenario, args, image, token, seq)
+                started = time.perf_counter()
+                try:
+                    response = await client.request(method, path, **kwargs)
+                    ok = response.status_code < 400
+                except httpx.HTTPError:
+                    ok = False
+                latencies.append(time.perf_counter() - started)
+                if not ok:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    pick = lambda q: round(latencies[min(len(latencies) - 1, int(len(latencies) * q))] * 1000, 1)
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "rps": round(total / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "p95_ms": pick(0.95),
+        "p99_ms": pick(0.99),
+    }
+
+
+async def main_async(args) -> list:
+    image = _test_image() if "generate" in args.scenario else b""
+    rows = []
+    for target in args.target:
+        name, _, base_url = target.partition("=")
+        token = await fetch_token(base_url, args) if any(s in TOKEN_SCENARIOS or s == "login" for s in args.scenario) else None
+        for scenario in args.scenario:
+            for concurrency in [int(c) for c in args.concurrency.split(",")]:
+                result = await run_level(base_url, scenario, concurrency, args.requests, args, image, token)
+                result["target"] = name
+                rows.append(result)
+                print(f"{name:>8} {scenario:>9} c={concurrency:<4} {result['rps']:>8} req/s  "
+                      f"p50 {result['p50_ms']:>8} ms  p95 {result['p95_ms']:>8} ms  p99 {result['p99_ms']:>8} ms  errors {result['errors']}")
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sync vs async serving at increasing concurrency.")
+    parser.add_argument("--target", action="append", required=True, help="name=base_url (repeatable)")
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS, help="Repeatable (default: history)")
+    parser.add_argument("--concurrency", default="16,64,256", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=1000, help="Requests per level")
+    parser.add_argument("--user", default="bench_user", help="Bench username (history, stats, login; prefix for register)")
+    parser.add_argument("--password", default="bench-password", help="Password of the bench user")
+    parser.add_argument("--model", default="gemini", help="ai_model for the generate scenario")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+    args.scenario = args.scenario or ["history"]
+    args.run_id = uuid.uuid4().hex[:8]
+
+    rows = asyncio.run(main_async(args))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Local fake of the Gemini generateContent REST endpoint for testing batch jobs.
+
+It enforces its own requests-per-minute quota and answers with 429 +
+Retry-After / RetryInfo when the quota is exceeded, just like the real API.
+
+Usage:
+    python fake_gemini_server.py --port 8089 --rpm 60 --latency 0.3
+    GEMINI_API_ENDPOINT=http://127.0.0.1:8089 python backfill_captions.py --job test
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeGeminiState:
+    def __init__(self, rpm: int, latency: float, error_rate: float):
+        self.rpm = rpm
+        self.latency = latency
+        self.error_rate = error_rate
+        self.window_start = time.monotonic()
+        self.window_count = 0
+        self.total = 0
+        self.rejected = 0
+        self.lock = threading.Lock()
+
+    def admit(self):
+        """Fixed one-minute window quota. Returns seconds to wait, or 0 if admitted."""
+        with self.lock:
+            now = time.monotonic()
+            if now - self.window_start >= 60:
+                self.window_start = now
+                self.window_count = 0
+            self.total += 1
+            if self.rpm and self.window_count >= self.rpm:
+                self.rejected += 1
+                return max(1, int(60 - (now - self.window_start)) + 1)
+            self.window_count += 1
+            return 0
+
+
+def make_handler(state: FakeGeminiState):
+    class FakeGeminiHandler(BaseHTTPRequestHandler):
+        def _send_json(self, status, payload, headers=None):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            request_body = json.loads(self.rfile.read(length) or b"{}")
+
+            if not self.path.split("?")[0].endswith(":generateContent"):
+                return self._send_json(404, {"error": {"code": 404, "message": "Not found", "status": "NOT_FOUND"}})
+
+            wait = state.admit()
+            if wait:
+                return self._send_json(429, {
+                    "error": {
+                        "code": 429,
+                        "message": f"Resource has been exhausted (e.g. check quota). Please retry in {wait}s.",
+                        "status": "RESOURCE_EXHAUSTED",
+                        "details": [{"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": f"{wait}s"}],
+                    }
+                }, headers={"Retry-After": str(wait)})
+
+            if state.error_rate and random.random() < state.error_rate:
+                return self._send_json(500, {"error": {"code": 500, "message": "Internal error", "status": "INTERNAL"}})
+
+            if state.latency:
+                time.sleep(state.latency)
+
+            parts = [part for content in request_body.get("contents", []) for part in content.get("parts", [])]
+            has_image = any("inlineData" in part or "inline_data" in part for part in parts)
+            text = f"Fake caption #{state.total} {'for an image ' if has_image else ''}📸 #Fake"
+            return self._send_json(200, {
+                "candidates": [{
+                    "content": {"parts": [{"text": text}], "role": "model"},
+                    "finishReason": "STOP",
+                    "index": 0,
+                }],
+                "usageMetadata": {"promptTokenCount": 300, "candidatesTokenCount": 20, "totalTokenCount": 320},
+            })
+
+        def log_message(self, format, *args):
+            pass
+
+    return FakeGeminiHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local fake Gemini API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--rpm", type=int, default=60, help="Requests per minute before returning 429 (0 = unlimited)")
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds to sleep per successful request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that fail with 500")
+    args = parser.parse_args()
+
+    state = FakeGeminiState(args.rpm, args.latency, args.error_rate)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(state))
+    print(f"Fake Gemini listening on http://{args.host}:{args.port} (rpm={args.rpm}, latency={args.latency}s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"Served {state.total} requests, rejected {state.rejected} with 429.")
+
+
+if __name__ == "__main__":
+    main()
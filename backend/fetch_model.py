@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Manage the local BLIP model store used for offline loading.
+
+Examples:
+    python fetch_model.py fetch                       # download the default model as a new version
+    python fetch_model.py fetch --source ./my-ckpt    # convert a local checkpoint to safetensors
+    python fetch_model.py list
+    python fetch_model.py use 20261019120000
+    python fetch_model.py verify
+
+Point the backend at the store with BLIP_MODEL_STORE=<dir>; it then loads fully offline.
+A running backend picks up a new version without a restart:
+    curl -X POST -H "X-Admin-Token: $ADMIN_TOKEN" -d '{"version": "20261019120000"}' \
+         -H "Content-Type: application/json" http://localhost:5123/api/admin/models/base/swap
+"""
+import argparse
+import sys
+
+from ai_core import model_store
+from ai_core.blip_model import MODEL_NAME
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-fetch and manage BLIP models in the local model store.")
+    parser.add_argument("--store", default=None, help="Model store directory (default: BLIP_MODEL_STORE or backend/model_store)")
+    parser.add_argument("--model", default=MODEL_NAME, help=f"Hub model name (default: {MODEL_NAME})")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    fetch_parser = subparsers.add_parser("fetch", help="Download or convert a model into a new store version")
+    fetch_parser.add_argument("--version", default=None, help="Version label (default: timestamp)")
+    fetch_parser.add_argument("--source", default=None, help="Local checkpoint directory to convert instead of downloading")
+    fetch_parser.add_argument("--no-current", action="store_true", help="Do not point CURRENT at the new version")
+
+    subparsers.add_parser("list", help="List stored versions")
+
+    use_parser = subparsers.add_parser("use", help="Point CURRENT at a stored version")
+    use_parser.add_argument("version")
+
+    verify_parser = subparsers.add_parser("verify", help="Verify stored files against the manifest")
+    verify_parser.add_argument("--version", default=None)
+
+    load_parser = subparsers.add_parser("load", help="Load the stored model offline and report load time and RSS")
+    load_parser.add_argument("--version", default=None)
+
+    args = parser.parse_args()
+
+    if args.command == "fetch":
+        model_store.fetch_model(args.model, args.store, args.version, args.source, make_current=not args.no_current)
+    elif args.command == "list":
+        current = model_store.get_current_version(args.model, args.store)
+        versions = model_store.list_versions(args.model, args.store)
+        if not versions:
+            print(f"No versions of {args.model} in {model_store.get_store_dir(args.store)}")
+        for version in versions:
+            marker = "*" if version == current else " "
+            print(f"{marker} {version}")
+    elif args.command == "use":
+        model_store.set_current_version(args.model, args.version, args.store)
+        print(f"CURRENT -> {args.version}")
+    elif args.command == "verify":
+        if not model_store.verify_model(args.model, args.store, args.version):
+            return 1
+        print("✅ All files match the manifest.")
+    elif args.command == "load":
+        from ai_core import blip_model
+        if not model_store.resolve_model_path(args.model, args.store, args.version):
+            print(f"[ERROR] {args.model} is not in the model store.")
+            return 1
+        blip_model.load_blip_model(args.model, args.store, args.version)
+        for key, value in blip_model.LOAD_STATS.items():
+            print(f"{key}: {value}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
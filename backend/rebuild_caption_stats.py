@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Recompute the per-user dashboard counters (caption_stats collection) from the
+captions collection with aggregation pipelines.
+
+The API keeps the counters current with $inc on every insert, edit and delete,
+but the $inc is a separate write from the caption change: a failed one (logged as
+"[ERROR] Failed to update caption stats") or a crash between the two leaves the
+counters off. Run this on a schedule to repair that drift, and after writes that
+bypass the API (backfills, manual fixes).
+
+Usage:
+    python rebuild_caption_stats.py
+    python rebuild_caption_stats.py --user alice
+    python rebuild_caption_stats.py --interval 3600     # keep running, rebuild hourly
+    python rebuild_caption_stats.py --migrate-edited    # once, for captions edited before editedAt existed
+
+Or from cron instead of --interval:
+    0 * * * * cd /path/to/backend && python rebuild_caption_stats.py
+"""
+import argparse
+import os
+import sys
+import time
+
+from dotenv import load_dotenv
+from pymongo import MongoClient
+
+from routes.caption_stats import migrate_edited_flags, rebuild_stats
+
+
+def rebuild_once(db, args):
+    started = time.perf_counter()
+    written = rebuild_stats(db, user_id=args.user, batch_size=args.batch_size)
+    print(f"[INFO] Rebuilt caption stats for {written} user(s) in {time.perf_counter() - started:.1f}s.")
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Rebuild dashboard caption counters from the captions collection.")
+    parser.add_argument("--user", help="Only rebuild this user_id's counters")
+    parser.add_argument("--batch-size", type=int, default=500, help="Counter documents per bulk_write")
+    parser.add_argument("--interval", type=float, default=float(os.getenv("STATS_REBUILD_INTERVAL_SECONDS", 0)),
+                        help="Keep running and rebuild every N seconds (0 = rebuild once and exit)")
+    parser.add_argument("--migrate-edited", action="store_true",
+                        help="First set editedAt on captions edited before the field existed")
+    args = parser.parse_args()
+
+    mongo_uri = os.getenv("MONGO_URI")
+    if not mongo_uri:
+        print("[ERROR] MONGO_URI not set in environment variables.")
+        return 1
+
+    db = MongoClient(mongo_uri).get_default_database()
+    if args.migrate_edited:
+        print(f"[INFO] Marked {migrate_edited_flags(db)} previously edited caption(s) with editedAt.")
+
+    rebuild_once(db, args)
+    while args.interval > 0:
+        time.sleep(args.interval)
+        try:
+            rebuild_once(db, args)
+        except Exception as e:
+            # Keep the schedule going; the next run repairs whatever this one missed
+            print(f"[ERROR] Scheduled caption stats rebuild failed: {e}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,361 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+
+from flask import g, request
+
+from routes.admin import admin_token_valid
+
+# Send this header (with X-Admin-Token) to profile a single request; value 'cprofile' or 'sample'
+PROFILE_HEADER = "X-Profile-Request"
+
+DEFAULT_PROFILE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles")
+TOP_FUNCTIONS = 15
+
+# Shortest sampling interval; anything lower turns the sampler thread into a busy loop
+MIN_INTERVAL_MS = 1
+
+
+class _Sampler:
+    """
+    Samples one thread's Python stack at a fixed interval and counts collapsed stacks.
+
+    Threads whose names start with one of `thread_prefixes` (e.g. the BLIP executor
+    of the async app) are sampled too, under a 'thread:<name>' root frame.
+    """
+
+    def __init__(self, thread_id: int, interval: float, thread_prefixes: tuple = ()):
+        self.thread_id = thread_id
+        self.interval = max(interval, MIN_INTERVAL_MS / 1000.0)
+        self.thread_prefixes = tuple(thread_prefixes)
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _threads(self) -> dict:
+        """{thread id: root frame} to sample; executor threads are looked up each time as pools start them lazily."""
+        threads = {self.thread_id: None}
+        if self.thread_prefixes:
+            for thread in threading.enumerate():
+                if thread.name.startswith(self.thread_prefixes):
+                    threads[thread.ident] = f"thread:{thread.name}"
+        return threads
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id, root in self._threads().items():
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{code.co_firstlineno}")
+                    frame = frame.f_back
+                if root and stack:
+                    stack.append(root)
+                if stack:
+                    self.stacks[";".join(reversed(stack))] += 1
+
+
+async def _until_closed(body, done):
+    try:
+        async for chunk in body:
+            yield chunk
+    finally:
+        try:
+            if hasattr(body, "aclose"):
+                await body.aclose()
+        finally:
+            done()
+
+
+class RequestProfiler:
+    """
+    Opt-in per-request profiling for the Flask app (and the Quart app in async mode).
+
+    Armed through the admin API (next N requests and/or a sampled percentage) or
+    per request with the X-Profile-Request header. 'sample' mode writes a collapsed
+    stack (.folded) file for flamegraph.pl / speedscope; 'cprofile' mode writes a
+    .prof file. Both write a JSON summary of the top functions. When nothing is
+    armed the request hooks return after a single attribute and header check.
+
+    A streamed response (the caption export) is profiled until its body has been
+    sent, not only until the view returned.
+
+    The output directory keeps at most `max_profiles` profiles and `max_mb` MB;
+    the oldest profiles are deleted after each write.
+    """
+
+    def __init__(self, output_dir: str = None, max_profiles: int = None, max_mb: float = None):
+        self.output_dir = output_dir or os.getenv("PROFILE_DIR") or DEFAULT_PROFILE_DIR
+        self.max_profiles = max_profiles or int(os.getenv("PROFILE_MAX_FILES", 200))
+        self.max_mb = max_mb or float(os.getenv("PROFILE_MAX_MB", 100))
+        self.armed = False
+        self.remaining = 0
+        self.sample_rate = 0.0
+        self.mode = "sample"
+        self.interval_ms = 5
+        self.recent = deque(maxlen=50)
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        app.profiler = self
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    def init_async_app(self, app, executor_threads: tuple = ()):
+        """
+        Register the same hooks on the Quart app behind asgi_app.py, sharing this
+        profiler's arming with the Flask app. Async routes run on the event loop
+        thread, so samples there also include requests interleaved on the loop.
+
+        'sample' mode also samples the threads named by `executor_threads` (the BLIP
+        executor), where model time is spent; those are shared by concurrent
+        requests as well. 'cprofile' mode only sees the event loop thread, so its
+        async profiles exclude model time.
+        """
+        from quart import g as quart_g, request as quart_request
+
+        app.profiler = self
+
+        @app.before_request
+        async def _before_request():
+            self._start(quart_request, quart_g, executor_threads)
+
+        @app.after_request
+        async def _after_request(response):
+            return self._finish(quart_request, quart_g, response)
+
+        @app.teardown_request
+        async def _teardown_request(exc):
+            self._abort(quart_g)
+
+    # --- Arming ---
+
+    def arm(self, count: int = 0, sample_rate: float = 0.0, mode: str = "sample", interval_ms: float = 5):
+        """Profile the next `count` requests and/or a `sample_rate` fraction of requests."""
+        if mode not in ("sample", "cprofile"):
+            raise ValueError("mode must be 'sample' or 'cprofile'")
+        if count <= 0 and sample_rate <= 0:
+            raise ValueError("Provide a positive count and/or sample_rate")
+        if interval_ms < MIN_INTERVAL_MS:
+            raise ValueError(f"interval_ms must be at least {MIN_INTERVAL_MS}")
+        with self._lock:
+            self.remaining = count
+            self.sample_rate = min(1.0, sample_rate)
+            self.mode = mode
+            self.interval_ms = interval_ms
+            self.armed = True
+
+    def disarm(self):
+        with self._lock:
+            self.armed = False
+            self.remaining = 0
+            self.sample_rate = 0.0
+
+    def status(self) -> dict:
+        return {
+            "armed": self.armed,
+            "remaining": self.remaining,
+            "sample_rate": self.sample_rate,
+            "mode": self.mode,
+            "interval_ms": self.interval_ms,
+            "output_dir": self.output_dir,
+            "max_profiles": self.max_profiles,
+            "max_mb": self.max_mb,
+        }
+
+    def _take_slot(self):
+        """Decide whether this request is profiled by the armed settings; returns the mode or None."""
+        with self._lock:
+            if not self.armed:
+                return None
+            if self.remaining > 0:
+                self.remaining -= 1
+                if self.remaining == 0 and self.sample_rate <= 0:
+                    self.armed = False
+                return self.mode
+            if self.sample_rate > 0 and random.random() < self.sample_rate:
+                return self.mode
+            return None
+
+    # --- Request hooks ---
+
+    def _before_request(self):
+        self._start(request, g)
+
+    def _after_request(self, response):
+        return self._finish(request, g, response)
+
+    def _teardown_request(self, exc):
+        # after_request is skipped when a view raises; make sure profiling still stops
+        self._abort(g)
+
+    def _start(self, req, store, executor_threads: tuple = ()):
+        if not self.armed and PROFILE_HEADER not in req.headers:
+            return
+
+        mode = None
+        header_mode = req.headers.get(PROFILE_HEADER)
+        if header_mode and admin_token_valid(req):
+            mode = header_mode if header_mode in ("sample", "cprofile") else "sample"
+        elif self.armed:
+            mode = self._take_slot()
+        if not mode:
+            return
+
+        session = {"id": uuid.uuid4().hex[:12], "mode": mode, "started": time.perf_counter()}
+        if mode == "cprofile":
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # Another request on a different thread already holds the interpreter profiler
+                return
+            session["profile"] = profile
+        else:
+            sampler = _Sampler(threading.get_ident(), self.interval_ms / 1000.0, executor_threads)
+            sampler.start()
+            session["sampler"] = sampler
+        store.profile_session = session
+
+    def _finish(self, req, store, response):
+        session = store.pop("profile_session", None)
+        if session is None:
+            return response
+
+        method, path = req.method, req.path
+        response.headers["X-Profile-Id"] = session["id"]
+        complete = lambda: self._complete(session, method, path)
+        if getattr(response, "is_streamed", False):
+            # Flask: the body is generated after this hook, while the server sends it
+            response.call_on_close(complete)
+        elif hasattr(getattr(response, "response", None), "iter"):
+            # Quart: wrap the body iterator so the profile ends once it is exhausted or closed
+            response.response.iter = _until_closed(response.response.iter, complete)
+        else:
+            complete()
+        return response
+
+    def _complete(self, session: dict, method: str, path: str):
+        elapsed_ms = round((time.perf_counter() - session["started"]) * 1000, 1)
+        if "profile" in session:
+            session["profile"].disable()
+        else:
+            session["sampler"].stop()
+
+        try:
+            self._write(session, elapsed_ms, method, path)
+        except Exception as e:
+            print(f"[ERROR] Failed to write request profile: {e}")
+
+    def _abort(self, store):
+        session = store.pop("profile_session", None)
+        if session is None:
+            return
+        if "profile" in session:
+            session["profile"].disable()
+        else:
+            session["sampler"].stop()
+
+    # --- Output ---
+
+    def _write(self, session: dict, elapsed_ms: float, method: str, path: str) -> dict:
+        os.makedirs(self.output_dir, exist_ok=True)
+        base = os.path.join(self.output_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{session['id']}")
+        summary = {
+            "id": session["id"],
+            "mode": session["mode"],
+            "method": method,
+            "path": path,
+            "elapsed_ms": elapsed_ms,
+        }
+
+        if session["mode"] == "cprofile":
+            profile = session["profile"]
+            profile.dump_stats(base + ".prof")
+            stats = pstats.Stats(profile, stream=io.StringIO())
+            rows = []
+            for (filename, line, func), (_, calls, tottime, cumtime, _) in stats.stats.items():
+                rows.append({
+                    "function": f"{os.path.basename(filename)}:{func}:{line}",
+                    "calls": calls,
+                    "self_ms": round(tottime * 1000, 2),
+                    "cumulative_ms": round(cumtime * 1000, 2),
+                })
+            summary["top_functions"] = sorted(rows, key=lambda r: r["cumulative_ms"], reverse=True)[:TOP_FUNCTIONS]
+            summary["files"] = [base + ".prof"]
+        else:
+            stacks = session["sampler"].stacks
+            with open(base + ".folded", "w", encoding="utf-8") as f:
+                for stack, count in stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            self_samples, total_samples = Counter(), Counter()
+            for stack, count in stacks.items():
+                frames = stack.split(";")
+                self_samples[frames[-1]] += count
+                for frame in set(frames):
+                    total_samples[frame] += count
+            samples = sum(stacks.values())
+            summary["samples"] = samples
+            summary["top_functions"] = [
+                {
+                    "function": frame,
+                    "self_pct": round(100 * self_samples[frame] / samples, 1),
+                    "total_pct": round(100 * count / samples, 1),
+                }
+                for frame, count in total_samples.most_common(TOP_FUNCTIONS)
+            ] if samples else []
+            summary["files"] = [base + ".folded"]
+
+        with open(base + ".json", "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        self.recent.appendleft(summary)
+        self._prune()
+        print(f"[INFO] Profiled {method} {path} in {elapsed_ms} ms -> {summary['files'][0]}")
+        return summary
+
+    def _prune(self):
+        """Delete the oldest profiles until the directory is within max_profiles and max_mb."""
+        profiles = {}
+        for name in os.listdir(self.output_dir):
+            path = os.path.join(self.output_dir, name)
+            if not os.path.isfile(path):
+                continue
+            # <timestamp>-<id>.json and its .prof/.folded data file form one profile
+            profiles.setdefault(os.path.splitext(name)[0], []).append((path, os.path.getsize(path)))
+
+        total_bytes = sum(size for files in profiles.values() for _, size in files)
+        max_bytes = self.max_mb * 1024 * 1024
+        # Names start with the write timestamp, so sorting puts the oldest first
+        for key in sorted(profiles):
+            if len(profiles) <= self.max_profiles and total_bytes <= max_bytes:
+                break
+            for path, size in profiles.pop(key):
+                try:
+                    os.remove(path)
+                    total_bytes -= size
+                except OSError as e:
+                    print(f"[WARNING] Could not delete old profile {path}: {e}")
+
+    def get_summary(self, profile_id: str):
+        for summary in self.recent:
+            if summary["id"] == profile_id:
+                return summary
+        return None
@@ -0,0 +1,124 @@
+import hmac
+import os
+from functools import wraps
+
+from flask import Blueprint, jsonify, request, current_app
+
+from ai_core.model_registry import PinnedModelError, UnknownModelError
+
+admin_blueprint = Blueprint('admin', __name__)
+
+
+def admin_token_valid(req) -> bool:
+    """Check the X-Admin-Token header against ADMIN_TOKEN. Admin access is off when ADMIN_TOKEN is unset."""
+    expected = os.getenv("ADMIN_TOKEN")
+    provided = req.headers.get("X-Admin-Token", "")
+    return bool(expected) and hmac.compare_digest(provided, expected)
+
+
+def require_admin(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not admin_token_valid(request):
+            return jsonify({"status": "error", "message": "Admin token required."}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+
+# --- PROFILING ---
+@admin_blueprint.route('/profiling', methods=['GET'])
+@require_admin
+def profiling_status():
+    profiler = current_app.profiler
+    return jsonify({"status": "success", "profiling": profiler.status(), "recent": list(profiler.recent)}), 200
+
+
+@admin_blueprint.route('/profiling', methods=['POST'])
+@require_admin
+def arm_profiling():
+    """Body: {"count": N, "sample_rate": 0.05, "mode": "sample"|"cprofile", "interval_ms": 5}"""
+    data = request.get_json(silent=True) or {}
+    try:
+        current_app.profiler.arm(
+            count=int(data.get('count', 0)),
+            sample_rate=float(data.get('sample_rate', 0.0)),
+            mode=data.get('mode', 'sample'),
+            interval_ms=float(data.get('interval_ms', 5)),
+        )
+    except (TypeError, ValueError) as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    return jsonify({"status": "success", "profiling": current_app.profiler.status()}), 200
+
+
+@admin_blueprint.route('/profiling', methods=['DELETE'])
+@require_admin
+def disarm_profiling():
+    current_app.profiler.disarm()
+    return jsonify({"status": "success", "profiling": current_app.profiler.status()}), 200
+
+
+@admin_blueprint.route('/profiling/<profile_id>', methods=['GET'])
+@require_admin
+def get_profile(profile_id):
+    summary = current_app.profiler.get_summary(profile_id)
+    if not summary:
+        return jsonify({"status": "error", "message": "Profile not found."}), 404
+    return jsonify({"status": "success", "profile": summary}), 200
+
+
+# --- MODELS ---
+@admin_blueprint.route('/models', methods=['GET'])
+@require_admin
+def list_models():
+    return jsonify({"status": "success", "registry": current_app.model_registry.snapshot()}), 200
+
+
+@admin_blueprint.route('/models/<name>/load', methods=['POST'])
+@require_admin
+def load_model(name):
+    registry = current_app.model_registry
+    try:
+        handle = registry.load(name)
+    except UnknownModelError as e:
+        return jsonify({"status": "error", "message": str(e)}), 404
+    except Exception as e:
+        print(f"[ERROR] Failed to load model {name}: {e}")
+        return jsonify({"status": "error", "message": f"Failed to load model: {str(e)}"}), 500
+    return jsonify({"status": "success", "model": handle.snapshot(), "registry": registry.snapshot()}), 200
+
+
+@admin_blueprint.route('/models/<name>/swap', methods=['POST'])
+@require_admin
+def swap_model(name):
+    """
+    Body: {"version": "2026-10-01", "model_name": "Salesforce/blip-image-captioning-large"} (both optional)
+
+    This worker switches immediately; the swap is recorded in the model store, and the other
+    worker processes switch on their next caption request.
+    """
+    data = request.get_json(silent=True) or {}
+    registry = current_app.model_registry
+    try:
+        handle = registry.swap(name, version=data.get('version'), model_name=data.get('model_name'))
+    except UnknownModelError as e:
+        return jsonify({"status": "error", "message": str(e)}), 404
+    except Exception as e:
+        # The old version keeps serving when the new one fails to load
+        print(f"[ERROR] Failed to swap model {name}: {e}")
+        return jsonify({"status": "error", "message": f"Failed to swap model: {str(e)}"}), 500
+    return jsonify({"status": "success", "model": handle.snapshot(), "registry": registry.snapshot()}), 200
+
+
+@admin_blueprint.route('/models/<name>', methods=['DELETE'])
+@require_admin
+def unload_model(name):
+    registry = current_app.model_registry
+    try:
+        unloaded = registry.unload(name)
+    except UnknownModelError as e:
+        return jsonify({"status": "error", "message": str(e)}), 404
+    except PinnedModelError as e:
+        return jsonify({"status": "error", "message": str(e)}), 409
+    if not unloaded:
+        return jsonify({"status": "error", "message": "Model is not loaded."}), 404
+    return jsonify({"status": "success", "registry": registry.snapshot()}), 200
@@ -1,11 +1,27 @@
 from flask import Blueprint, jsonify, request, current_app, redirect, url_for
-from bcrypt import hashpw, gensalt, checkpw
 from bson.objectid import ObjectId # Used to handle unique MongoDB IDs for reset process
+from pymongo.errors import DuplicateKeyError
+from routes.session_auth import issue_token, BcryptBusy
 import requests
 import os
 
 auth_blueprint = Blueprint('auth', __name__)
 
+
+def ensure_user_indexes(db):
+    """Unique indexes behind the registration check and the login lookup; run once at startup."""
+    for field in ("username", "email"):
+        try:
+            # Partial, so OAuth users without the field do not collide on null
+            db.users.create_index(field, unique=True, name=f"{field}_unique",
+                                  partialFilterExpression={field: {"$type": "string"}})
+        except Exception as e:
+            print(f"[ERROR] Failed to create unique index on users.{field}: {e}")
+
+
+def _busy_response(e):
+    return jsonify({"message": str(e)}), 503, {"Retry-After": str(e.retry_after)}
+
 @auth_blueprint.route('/register', methods=['POST'])
 def register():
     mongo = current_app.mongo
@@ -29,22 +45,27 @@ def register():
     if password != confirm_password:
         return jsonify({"message": "Passwords do not match"}), 400
 
-    # 3. Uniqueness Check
-    if users_collection.find_one({"username": username}) or users_collection.find_one({"email": email}):
+    # 3. Uniqueness Check: one indexed query, before paying for the hashes
+    if users_collection.find_one({"$or": [{"username": username}, {"email": email}]}, {"_id": 1}):
         return jsonify({"message": "Username or Email already exists"}), 409
 
-    # Hash the password AND the security answer for secure storage
-    hashed_password = hashpw(password.encode('utf-8'), gensalt())
-    hashed_answer = hashpw(security_answer.encode('utf-8'), gensalt())
+    # Hash the password AND the security answer for secure storage (off the request thread)
+    try:
+        hashed_password, hashed_answer = current_app.bcrypt_executor.hash(password, security_answer)
+    except BcryptBusy as e:
+        return _busy_response(e)
 
-    # Insert the new user into the database
-    users_collection.insert_one({
-        "username": username,
-        "email": email, 
-        "password": hashed_password.decode('utf-8'),
-        "security_question": security_question,
-        "security_answer_hash": hashed_answer.decode('utf-8')
-    })
+    # Insert the new user into the database; the unique indexes catch a concurrent duplicate
+    try:
+        users_collection.insert_one({
+            "username": username,
+            "email": email, 
+            "password": hashed_password,
+            "security_question": security_question,
+            "security_answer_hash": hashed_answer
+        })
+    except DuplicateKeyError:
+        return jsonify({"message": "Username or Email already exists"}), 409
     return jsonify({"message": "User registered successfully"}), 201
 
 @auth_blueprint.route('/login', methods=['POST'])
@@ -60,13 +81,30 @@ def login():
         return jsonify({"message": "Username/Email and password are required"}), 400
 
     # User lookup: Find user by either username OR email
-    user = users_collection.find_one({"$or": [{"username": login_id}, {"email": login_id}]})
+    user = users_collection.find_one(
+        {"$or": [{"username": login_id}, {"email": login_id}]},
+        {"username": 1, "email": 1, "password": 1}
+    )
     
-    if not user:
+    # OAuth-only accounts have no password to check
+    if not user or not user.get('password'):
         return jsonify({"message": "Invalid credentials"}), 401
 
-    if checkpw(password.encode('utf-8'), user['password'].encode('utf-8')):
-        return jsonify({"message": "Login successful", "username": user['username'], "email": user['email']}), 200
+    try:
+        password_ok = current_app.bcrypt_executor.check(password, user['password'])
+    except BcryptBusy as e:
+        return _busy_response(e)
+
+    if password_ok:
+        # The session token replaces the password check on every later caption/history call
+        session = issue_token(user['username'])
+        return jsonify({
+            "message": "Login successful",
+            "username": user['username'],
+            "email": user['email'],
+            "token": session["token"],
+            "expires_at": session["expires_at"]
+        }), 200
     else:
         return jsonify({"message": "Invalid credentials"}), 401
 
@@ -122,16 +160,18 @@ def reset_password_challenge():
         return jsonify({"message": "User not found"}), 404
 
     # 2. Verify the security answer hash
-    stored_hash = user.get('security_answer_hash').encode('utf-8')
-    if not checkpw(answer.encode('utf-8'), stored_hash):
-        return jsonify({"message": "Security answer is incorrect."}), 401
+    try:
+        if not current_app.bcrypt_executor.check(answer, user.get('security_answer_hash')):
+            return jsonify({"message": "Security answer is incorrect."}), 401
 
-    # 3. Hash the new password and update the user document
-    new_hashed_password = hashpw(new_password.encode('utf-8'), gensalt())
+        # 3. Hash the new password and update the user document
+        new_hashed_password, = current_app.bcrypt_executor.hash(new_password)
+    except BcryptBusy as e:
+        return _busy_response(e)
     
     users_collection.update_one(
         {"_id": ObjectId(user_id)},
-        {"$set": {"password": new_hashed_password.decode('utf-8')}}
+        {"$set": {"password": new_hashed_password}}
     )
     
     return jsonify({"message": "Password successfully reset. You can now log in."}), 200
@@ -0,0 +1,691 @@
+"""
+Request handling shared by the sync (Flask) and async (Quart) captioning blueprints:
+validation, Gemini routing, metrics, stats bookkeeping and response bodies. The
+blueprints only make the model and Mongo calls, blocking or awaited, so both
+servers make the same decisions and serve identical payloads.
+"""
+import base64
+import csv
+import io
+import json
+import time
+import zlib
+from datetime import datetime, timedelta
+
+from bson.errors import InvalidId
+from bson.objectid import ObjectId
+from pymongo import DeleteOne, ReturnDocument, UpdateOne
+
+from ai_core.gemini_caption import build_gemini_prompt, gemini_payload_bytes
+from routes.caption_stats import STAT_PROJECTION, bulk_increments, bulk_longest, edit_increments
+
+# Social platforms that should use Gemini refinement
+SOCIAL_PLATFORMS = {"instagram", "linkedin", "twitter", "x", "facebook"}
+
+# Maximum number of operations accepted by one bulk request
+BULK_MAX_ITEMS = 1000
+
+# Caption history export settings
+EXPORT_BATCH_SIZE = 500
+# Rows with the base64 image_url are far larger, so far fewer of them are held per batch
+EXPORT_IMAGE_BATCH_SIZE = 20
+# Caption history is served a page at a time, newest first
+CAPTIONS_PAGE_SIZE = 20
+CAPTIONS_MAX_PAGE_SIZE = 100
+EXPORT_FIELDS = ["_id", "caption", "platform", "tone", "length", "model_used", "createdAt", "updatedAt", "editedAt", "image_url"]
+# image_url holds the whole base64 image, so it is only exported when asked for
+EXPORT_DEFAULT_FIELDS = [field for field in EXPORT_FIELDS if field != "image_url"]
+
+
+class RequestError(ValueError):
+    """A client error with the message to return in a 400 response."""
+
+
+def error_body(message: str, model: str = None) -> dict:
+    body = {"status": "error", "message": message}
+    if model is not None:
+        body["model"] = model
+    return body
+
+
+def owner_filter(owner) -> dict:
+    # Without session auth (SESSION_AUTH_REQUIRED=false, no token) captions are matched by _id alone
+    return {"user_id": owner} if owner else {}
+
+
+def ensure_caption_indexes(db):
+    """
+    Index behind the per-user history (sorted newest first, _id breaking ties), stats
+    rebuild and export queries; run once at startup. Replaces the older user_createdAt index.
+    """
+    try:
+        db.captions.create_index([("user_id", 1), ("createdAt", -1), ("_id", -1)], name="user_createdAt_id")
+    except Exception as e:
+        print(f"[ERROR] Failed to create captions index on user_id/createdAt/_id: {e}")
+        return
+    try:
+        if "user_createdAt" in db.captions.index_information():
+            db.captions.drop_index("user_createdAt")
+            print("[INFO] Dropped superseded captions index user_createdAt.")
+    except Exception as e:
+        print(f"[WARNING] Could not drop old captions index user_createdAt: {e}")
+
+
+# --- Caption generation ---
+
+def parse_generate_form(form) -> dict:
+    """Read the caption options from the upload form and auto-decide the model if not given."""
+    platform = form.get('platform', 'general').lower()
+    ai_model_choice = form.get('ai_model')  # optional
+
+    # Auto-decide model if not given by frontend
+    if not ai_model_choice:
+        if platform in SOCIAL_PLATFORMS:
+            ai_model_choice = "gemini"
+        else:
+            ai_model_choice = "blip"
+
+    return {
+        "tone": form.get('tone', 'casual'),
+        "length": form.get('length', 'short'),
+        "platform": platform,
+        "ai_model_choice": ai_model_choice.lower(),
+        "user_id": form.get('user_id'),
+        "include_hashtags": form.get('includeHashtags', 'false').lower() == 'true',
+        # BLIP model name or quality tier ('fast', 'quality'); the registry default when empty
+        "blip_model": form.get('blip_model') or None,
+    }
+
+
+def build_caption_doc(user_id, caption, options: dict, image_url: str, used_model: str) -> dict:
+    return {
+        "user_id": user_id,
+        "caption": caption,
+        "platform": options["platform"],
+        "tone": options["tone"],
+        "length": options["length"],
+        "image_url": image_url,
+        "model_used": used_model,
+        "createdAt": datetime.now()
+    }
+
+
+class CaptionGeneration:
+    """
+    Bookkeeping for one /generate request: validation, the Gemini circuit breaker,
+    per-mode metrics and the response body.
+
+    The blueprints run the BLIP and Gemini calls between these steps. fail() and
+    finish() record the request in the metrics exactly once and return the
+    (body, status) to send.
+    """
+
+    MODES = ("blip", "gemini", "hybrid")
+
+    def __init__(self, options: dict, image_bytes: bytes, metrics, router):
+        self.options = options
+        self.mode = options["ai_model_choice"]
+        self.image_bytes = image_bytes
+        self.image_url = f"data:image/jpeg;base64,{base64.b64encode(image_bytes).decode('utf-8')}"
+        self.metrics = metrics
+        self.router = router
+        self.started_at = time.perf_counter()
+        self.payload_bytes = 0
+        self.hybrid_info = None
+        self.used_model = ""
+        self.latency_ms = None
+        self.recorded = False
+        self.admission = None  # how the Gemini circuit admitted this request, None if it was not
+        self.short_circuited = False
+        self._gemini_started = None
+        print(f"[DEBUG] Backend decided: AI Model = {self.mode}, Platform = {options['platform']}")
+
+    def _elapsed_ms(self) -> float:
+        return round((time.perf_counter() - self.started_at) * 1000, 1)
+
+    def _record(self, error: bool):
+        if not self.recorded:
+            self.recorded = True
+            self.metrics.record(self.mode, self._elapsed_ms(), self.payload_bytes, error=error,
+                                short_circuited=self.short_circuited)
+
+    def validate(self):
+        """(body, status) for a request that cannot be served as asked, else None."""
+        if self.mode not in self.MODES:
+            print(f"[ERROR] Invalid AI model choice received: {self.mode}")
+            return error_body("Invalid AI model choice.", "none"), 400
+        if self.mode == "blip" and self.options["platform"] != "general":
+            print(f"[ERROR] BLIP model selected for non-general platform: {self.options['platform']}")
+            return error_body("BLIP model can only be used for 'General' captions. Please select 'General' platform or switch to Gemini API.", "blip"), 400
+        return None
+
+    # --- Gemini routing ---
+
+    def allow_gemini(self) -> bool:
+        """Ask the circuit breaker whether to call Gemini; passed as `allow_refine` on the hybrid path."""
+        self.admission = self.router.allow_request()
+        if self.admission is None:
+            # Circuit open: go straight to BLIP instead of paying for a slow or failing Gemini call
+            print(f"[WARNING] Gemini circuit is {self.router.state}, routing straight to BLIP.")
+            self.short_circuited = True
+            return False
+        return True
+
+    def gemini_prompt(self):
+        """The prompt to send to Gemini, or None when the circuit is open and the request should go to BLIP."""
+        if not self.allow_gemini():
+            return None
+        options = self.options
+        prompt = build_gemini_prompt(options["tone"], options["length"], options["platform"], options["include_hashtags"])
+        self.payload_bytes = gemini_payload_bytes(prompt, self.image_bytes)
+        self._gemini_started = time.perf_counter()
+        return prompt
+
+    def gemini_done(self, caption: str) -> str:
+        """Feed the Gemini outcome to the circuit breaker; an empty caption means fall back to BLIP."""
+        self.router.record(bool(caption), (time.perf_counter() - self._gemini_started) * 1000, self.admission)
+        if caption:
+            self.used_model = "gemini"
+        else:
+            print("[WARNING] Gemini returned empty caption, attempting BLIP fallback.")
+        return caption
+
+    def hybrid_done(self, caption: str, info: dict) -> str:
+        if info["refine_latency_ms"] is not None:
+            self.router.record(info["refined"], info["refine_latency_ms"], self.admission)
+        self.hybrid_info = info
+        self.payload_bytes = info["payload_bytes"]
+        self.used_model = "hybrid" if info["refined"] else "blip_fallback"
+        return caption
+
+    # --- Outcome ---
+
+    def fail(self, message: str, model: str = None, status: int = 500):
+        print(f"[ERROR] {message}")
+        self._record(error=True)
+        return error_body(message, model or self.mode), status
+
+    def finish(self, caption: str, blip=None):
+        """Record the request and build the response; an empty caption is a 500."""
+        self.latency_ms = self._elapsed_ms()
+        # A fallback after a failed Gemini call is an error; one the open circuit chose is not
+        self._record(error=not caption or (self.used_model == "blip_fallback" and not self.short_circuited))
+        if not caption:
+            print(f"[ERROR] Final caption is empty after using {self.used_model}.")
+            return error_body(f"Failed to generate caption: result was empty from {self.used_model}.", self.used_model), 500
+        return {
+            "status": "success",
+            "caption": caption,
+            "platform": self.options["platform"],
+            "model": self.used_model,
+            "image_url": self.image_url,
+            "latency_ms": self.latency_ms,
+            "payload_bytes": self.payload_bytes,
+            "hybrid": self.hybrid_info,
+            "blip_model": blip.label if blip and self.used_model != "gemini" else None
+        }, 200
+
+    def caption_doc(self, caption: str) -> dict:
+        return build_caption_doc(self.options["user_id"], caption, self.options, self.image_url, self.used_model)
+
+
+class BlipLease:
+    """
+    The BLIP model of one caption request, acquired from the registry only once a path
+    actually needs it and then held until the request ends, so a hot swap or eviction
+    cannot pull it away mid-caption.
+    """
+
+    def __init__(self, registry, name: str):
+        self.registry = registry
+        self.name = name
+        self.handle = None
+
+    def acquire(self):
+        if self.handle is None:
+            self.handle = self.registry.acquire(self.name)
+        return self
+
+    async def acquire_async(self, run):
+        """Same as acquire(), with `run(func, *args)` keeping a load from disk off the event loop."""
+        if self.handle is None:
+            self.handle = await run(self.registry.acquire, self.name)
+        return self
+
+    def args(self) -> tuple:
+        """(model, processor, device) for the BLIP caption functions."""
+        if self.handle is None:
+            return None, None, "cpu"
+        return self.handle.model, self.handle.processor, self.handle.device
+
+    def release(self):
+        if self.handle is not None:
+            self.handle.release()
+            self.handle = None
+
+
+# --- Single caption edit and delete ---
+
+def parse_caption_edit(data) -> str:
+    new_text = (data or {}).get('text')
+    if not new_text:
+        raise RequestError("Caption text is required")
+    return new_text
+
+
+def caption_edit_query(owner, caption_id: str, new_text: str) -> dict:
+    """
+    find_one_and_update() arguments for an edit by `owner`. Returns the pre-update
+    document, so a first edit can be counted in the stats; a caption that already has
+    this text does not match.
+
+    :raises InvalidId: for a malformed caption id.
+    """
+    now = datetime.now()
+    return {
+        "filter": {**owner_filter(owner), "_id": ObjectId(caption_id), "caption": {"$ne": new_text}},
+        "update": {"$set": {"caption": new_text, "updatedAt": now, "editedAt": now}},
+        "projection": {"user_id": 1, "editedAt": 1},
+        "return_document": ReturnDocument.BEFORE,
+    }
+
+
+def edit_stats(previous: dict):
+    """Counter change for an edit, given the pre-update document."""
+    return edit_increments(0 if previous.get("editedAt") else 1)
+
+
+def caption_delete_query(owner, caption_id: str) -> dict:
+    """find_one_and_delete() arguments; the deleted document carries the fields its stats need."""
+    return {"filter": {**owner_filter(owner), "_id": ObjectId(caption_id)}, "projection": STAT_PROJECTION}
+
+
+def _parse_page_cursor(value):
+    # Cursor is "<createdAt ISO>|<_id>" of the last caption on the previous page
+    created, sep, caption_id = (value or "").rpartition("|")
+    try:
+        return datetime.fromisoformat(created), ObjectId(caption_id)
+    except (ValueError, InvalidId):
+        raise RequestError("Invalid 'before' cursor.")
+
+
+def user_captions_query(user_id, args=None) -> dict:
+    """
+    Find kwargs for one page of a user's captions, newest first.
+
+    Query params: limit (default CAPTIONS_PAGE_SIZE, at most CAPTIONS_MAX_PAGE_SIZE),
+    before (the next_before cursor of the previous page), platform.
+    One extra document is fetched so finish_captions_page() can tell whether more exist.
+
+    :raises RequestError: on invalid parameters.
+    """
+    args = args or {}
+    try:
+        limit = int(args.get('limit', CAPTIONS_PAGE_SIZE))
+    except (TypeError, ValueError):
+        raise RequestError("limit must be an integer.")
+    if not 1 <= limit <= CAPTIONS_MAX_PAGE_SIZE:
+        raise RequestError(f"limit must be between 1 and {CAPTIONS_MAX_PAGE_SIZE}.")
+
+    query = {"user_id": user_id}
+    platform = args.get('platform')
+    if platform and platform.lower() != 'all':
+        query["platform"] = platform.lower()
+    if args.get('before'):
+        created, caption_id = _parse_page_cursor(args['before'])
+        # _id breaks ties between captions saved in the same millisecond
+        query["$or"] = [{"createdAt": {"$lt": created}}, {"createdAt": created, "_id": {"$lt": caption_id}}]
+    return {"filter": query, "sort": [("createdAt", -1), ("_id", -1)], "limit": limit + 1}
+
+
+def finish_captions_page(captions: list, query: dict):
+    """Drop the look-ahead document and return (captions, next_before cursor or None)."""
+    limit = query["limit"] - 1
+    if len(captions) <= limit:
+        return captions, None
+    captions = captions[:limit]
+    last = captions[-1]
+    return captions, f"{last['createdAt'].isoformat()}|{last['_id']}"
+
+
+def serialize_captions(captions: list) -> list:
+    for caption in captions:
+        caption['_id'] = str(caption['_id'])
+    return captions
+
+
+# --- Bulk mutation ---
+
+def parse_bulk_request(data: dict):
+    """
+    Validate a bulk mutation body and every item in it.
+
+    :return: (user_id, items, results, valid_ids) with results in request order;
+             items that failed validation already carry a status.
+    :raises RequestError: when the request as a whole is malformed.
+    """
+    user_id = data.get('user_id')
+    deletes = data.get('delete') or []
+    updates = data.get('update') or []
+
+    if not user_id:
+        raise RequestError("user_id is required.")
+    if not isinstance(deletes, list) or not isinstance(updates, list):
+        raise RequestError("'delete' and 'update' must be lists.")
+    if not deletes and not updates:
+        raise RequestError("Nothing to do: provide 'delete' and/or 'update'.")
+    if len(deletes) + len(updates) > BULK_MAX_ITEMS:
+        raise RequestError(f"At most {BULK_MAX_ITEMS} items per request.")
+
+    items = [{"op": "delete", "id": caption_id} for caption_id in deletes]
+    updates = [u if isinstance(u, dict) else {} for u in updates]
+    items += [{"op": "update", "id": u.get('id'), "text": u.get('text')} for u in updates]
+    results = []
+    seen = set()
+    for item in items:
+        result = {"op": item["op"], "id": item["id"]}
+        try:
+            item["oid"] = ObjectId(item["id"])
+        except (InvalidId, TypeError):
+            result["status"] = "invalid_id"
+        else:
+            if item["oid"] in seen:
+                result["status"] = "duplicate"
+            elif item["op"] == "update" and not item.get("text"):
+                result["status"] = "invalid"
+            else:
+                seen.add(item["oid"])
+        results.append(result)
+    return user_id, items, results, list(seen)
+
+
+def plan_bulk_operations(user_id, items: list, results: list, owned: set, now: datetime):
+    """Turn validated items on captions owned by the user into bulk_write operations."""
+    operations, op_items = [], []
+    for item, result in zip(items, results):
+        if "status" in result:
+            continue
+        if item["oid"] not in owned:
+            result["status"] = "not_found"
+            continue
+        owner_filter = {"_id": item["oid"], "user_id": user_id}
+        if item["op"] == "delete":
+            operations.append(DeleteOne(owner_filter))
+        else:
+            # editedAt marks a user edit; updatedAt also changes on backfills
+            operations.append(UpdateOne(owner_filter, {"$set": {"caption": item["text"], "updatedAt": now, "editedAt": now}}))
+        op_items.append((item, result))
+    return operations, op_items
+
+
+def bulk_timestamp() -> datetime:
+    """updatedAt for a bulk request, at Mongo's millisecond precision so a re-read compares equal."""
+    now = datetime.now()
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+
+def bulk_counts(write_result) -> dict:
+    return {"deleted": write_result.deleted_count, "matched": write_result.matched_count, "modified": write_result.modified_count}
+
+
+def bulk_error_details(bulk_write_error):
+    """Per-operation errors and counts from a BulkWriteError."""
+    details = bulk_write_error.details
+    failed = {err["index"]: err.get("errmsg", "write failed") for err in details.get("writeErrors", [])}
+    counts = {"deleted": details.get("nRemoved", 0), "matched": details.get("nMatched", 0), "modified": details.get("nModified", 0)}
+    return failed, counts
+
+
+def _ids_by_op(op_items: list, failed: dict) -> dict:
+    ids = {"delete": [], "update": []}
+    for index, (item, _) in enumerate(op_items):
+        if index not in failed:
+            ids[item["op"]].append(item["oid"])
+    return ids
+
+
+def bulk_verify_query(op_items: list, failed: dict, counts: dict):
+    """
+    A find() query to re-read the captions written, or None when the counts show every
+    operation took effect. An operation matches nothing when another request deleted
+    the caption between the ownership check and the bulk write.
+    """
+    ids = _ids_by_op(op_items, failed)
+    if counts["deleted"] >= len(ids["delete"]) and counts["matched"] >= len(ids["update"]):
+        return None
+    return {"_id": {"$in": ids["delete"] + ids["update"]}}
+
+
+def unapplied_operations(op_items: list, failed: dict, counts: dict, docs, now: datetime) -> dict:
+    """
+    Index -> status for the operations that did not take effect, from the re-read `docs`.
+
+    A caption that is gone after a delete may have been removed by a concurrent request
+    instead; when more deletes are gone than the write reported, those are 'ambiguous'.
+    An update whose caption is gone is 'not_found'; one whose caption still exists with
+    another updatedAt was overwritten by a concurrent edit and is a 'conflict'.
+    """
+    current = {doc["_id"]: doc for doc in docs}
+    unapplied = {}
+    gone = []
+    for index, (item, _) in enumerate(op_items):
+        if index in failed:
+            continue
+        doc = current.get(item["oid"])
+        if item["op"] == "delete":
+            if doc is not None:
+                unapplied[index] = "error"
+            else:
+                gone.append(index)
+        elif doc is None:
+            unapplied[index] = "not_found"
+        elif doc.get("updatedAt") != now:
+            unapplied[index] = "conflict"
+    if len(gone) > counts["deleted"]:
+        for index in gone:
+            unapplied[index] = "ambiguous"
+    return unapplied
+
+
+def finish_bulk(op_items: list, failed: dict, now: datetime, unapplied: dict = None) -> dict:
+    """Fill in per-item statuses and return the change set for the client."""
+    unapplied = unapplied or {}
+    changes = {"deleted": [], "updated": []}
+    for index, (item, result) in enumerate(op_items):
+        if index in failed:
+            result["status"] = "error"
+            result["message"] = failed[index]
+        elif unapplied.get(index) == "not_found":
+            # Deleted by another request after the ownership check
+            result["status"] = "not_found"
+            changes["deleted"].append(item["id"])
+        elif unapplied.get(index) == "conflict":
+            # Still exists with someone else's text, so the client must not drop it
+            result["status"] = "conflict"
+            result["message"] = "Caption was changed by another request."
+        elif unapplied.get(index) == "error":
+            result["status"] = "error"
+            result["message"] = "Caption was not deleted."
+        elif item["op"] == "delete":
+            # 'ambiguous' deletes are gone either way, so the client drops them too
+            result["status"] = "deleted"
+            changes["deleted"].append(item["id"])
+        else:
+            result["status"] = "updated"
+            changes["updated"].append({"_id": item["id"], "caption": item["text"], "updatedAt": now.isoformat()})
+    return changes
+
+
+class BulkMutation:
+    """
+    One /captions/bulk request. The blueprints make the Mongo calls (ownership read,
+    bulk_write, and a re-read when fewer captions matched than planned); planning,
+    statuses and stats live here.
+
+    :raises RequestError: from the constructor when the body is malformed.
+    """
+
+    def __init__(self, data: dict):
+        self.user_id, self.items, self.results, self.valid_ids = parse_bulk_request(data)
+        self.now = bulk_timestamp()
+        self.owned = {}
+        self.op_items = []
+        self.failed = {}
+        self.counts = {"deleted": 0, "matched": 0, "modified": 0}
+        self.unapplied = {}
+
+    def owned_query(self) -> dict:
+        """find() arguments for the captions this user owns; only those are touched."""
+        return {"filter": {"_id": {"$in": self.valid_ids}, "user_id": self.user_id}, "projection": STAT_PROJECTION}
+
+    def plan(self, owned_docs) -> list:
+        self.owned = {doc["_id"]: doc for doc in owned_docs}
+        operations, self.op_items = plan_bulk_operations(self.user_id, self.items, self.results, self.owned, self.now)
+        return operations
+
+    def written(self, write_result):
+        self.counts = bulk_counts(write_result)
+
+    def write_failed(self, bulk_write_error):
+        self.failed, self.counts = bulk_error_details(bulk_write_error)
+
+    def verify_query(self):
+        """find() arguments to re-read the written captions, or None when every write took effect."""
+        query = bulk_verify_query(self.op_items, self.failed, self.counts)
+        return None if query is None else {"filter": query, "projection": {"updatedAt": 1}}
+
+    def verified(self, docs):
+        self.unapplied = unapplied_operations(self.op_items, self.failed, self.counts, docs, self.now)
+
+    def stats_increments(self):
+        return bulk_increments(self.op_items, self.failed, self.owned, self.unapplied)
+
+    def stats_longest(self) -> int:
+        return bulk_longest(self.op_items, self.failed, self.unapplied)
+
+    def response(self) -> dict:
+        changes = finish_bulk(self.op_items, self.failed, self.now, self.unapplied)
+        print(f"[INFO] Bulk caption mutation for user {self.user_id}: {self.counts}")
+        return {"status": "success", "results": self.results, "changes": changes, "counts": self.counts}
+
+
+# --- Export ---
+
+def _export_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, ObjectId):
+        return str(value)
+    return value
+
+
+def _parse_export_date(value, name):
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise RequestError(f"Invalid '{name}' date, expected ISO format (e.g. 2026-01-31 or 2026-01-31T12:00:00).")
+    # 'until' is exclusive, so a bare date means "up to the end of that day"
+    if name == 'until' and len(value.strip()) == 10:
+        parsed += timedelta(days=1)
+    return parsed
+
+
+def parse_export_request(user_id, args) -> dict:
+    """
+    Validate export query params: format=ndjson|csv, fields=a,b, since/until (ISO dates), gzip=true.
+    The cursor and encoder batch size shrinks when image_url is exported.
+
+    `since` is inclusive and `until` exclusive; a date-only `until` (2026-01-31) includes that whole day.
+
+    :raises RequestError: on invalid parameters.
+    """
+    fmt = args.get('format', 'ndjson').lower()
+    if fmt not in ("ndjson", "csv"):
+        raise RequestError("Export format must be 'ndjson' or 'csv'.")
+
+    requested = args.get('fields')
+    fields = [f.strip() for f in requested.split(',') if f.strip()] if requested else EXPORT_DEFAULT_FIELDS
+    unknown = [f for f in fields if f not in EXPORT_FIELDS]
+    if unknown:
+        raise RequestError(f"Unknown export fields: {', '.join(unknown)}")
+
+    since = _parse_export_date(args.get('since'), 'since')
+    until = _parse_export_date(args.get('until'), 'until')
+    query = {"user_id": user_id}
+    if since or until:
+        query["createdAt"] = {}
+        if since:
+            query["createdAt"]["$gte"] = since
+        if until:
+            query["createdAt"]["$lt"] = until
+
+    projection = {field: 1 for field in fields}
+    if "_id" not in fields:
+        projection["_id"] = 0
+
+    gzip = args.get('gzip', 'false').lower() == 'true'
+    headers = {"Content-Disposition": f"attachment; filename=captions_{user_id}.{fmt}"}
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+
+    return {
+        "format": fmt,
+        "fields": fields,
+        "batch_size": EXPORT_IMAGE_BATCH_SIZE if "image_url" in fields else EXPORT_BATCH_SIZE,
+        "query": query,
+        "projection": projection,
+        "gzip": gzip,
+        "mimetype": "text/csv" if fmt == "csv" else "application/x-ndjson",
+        "headers": headers,
+    }
+
+
+class ExportEncoder:
+    """
+    Encodes documents to NDJSON/CSV (gzipped when `compress` is set) and hands back
+    one chunk per `batch_size` rows.
+    """
+
+    def __init__(self, fields: list, fmt: str, compress: bool = False, batch_size: int = EXPORT_BATCH_SIZE):
+        self.fields = fields
+        self.batch_size = batch_size
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer) if fmt == "csv" else None
+        self.compressor = gzip_compressor() if compress else None
+        self.count = 0
+        if self.writer:
+            self.writer.writerow(fields)
+
+    def add(self, doc: dict):
+        """Encode one document; returns a bytes chunk when a batch is complete, else None."""
+        row = {field: _export_value(doc.get(field)) for field in self.fields}
+        if self.writer:
+            self.writer.writerow([row[field] if row[field] is not None else "" for field in self.fields])
+        else:
+            self.buffer.write(json.dumps(row, ensure_ascii=False))
+            self.buffer.write("\n")
+        self.count += 1
+        if self.count % self.batch_size == 0:
+            return self._take()
+        return None
+
+    def finish(self) -> bytes:
+        chunk = self._take()
+        if self.compressor:
+            chunk += self.compressor.flush()
+        return chunk
+
+    def _take(self) -> bytes:
+        chunk = self.buffer.getvalue().encode("utf-8")
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        if self.compressor:
+            chunk = self.compressor.compress(chunk)
+        return chunk
+
+
+def gzip_compressor():
+    """A streaming gzip compressor (compress() per chunk, flush() at the end)."""
+    return zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
@@ -0,0 +1,225 @@
+"""
+Per-user dashboard counters kept in the `caption_stats` collection.
+
+Every caption insert, first edit and delete applies an atomic $inc to the owner's
+counter document, so the stats endpoint is a single _id lookup however long the
+history is. A caption counts as edited once a user edit set its `editedAt`
+(updatedAt also changes on backfills). `longest` (caption length in characters)
+is raised with $max on inserts and edits; deletes cannot lower it, so it stays
+an upper bound until the next rebuild. The $inc is a separate write from the
+caption change, so a failed or lost $inc leaves the counters off until
+rebuild_caption_stats.py recomputes them from the captions collection; run it on
+a schedule (--interval, or cron) and after backfill jobs.
+"""
+from collections import Counter
+from datetime import datetime
+
+# caption field -> counter map in the stats document
+STAT_DIMENSIONS = {
+    "platform": "by_platform",
+    "model_used": "by_model",
+    "tone": "by_tone",
+    "length": "by_length",
+}
+
+# Fields a caption document needs for its counters to be adjusted
+STAT_PROJECTION = {"user_id": 1, "platform": 1, "model_used": 1, "tone": 1, "length": 1, "createdAt": 1, "editedAt": 1}
+
+
+def _stat_key(value) -> str:
+    """Counter keys come from user input; keep them valid as Mongo field names."""
+    key = str(value).strip().lower() if value not in (None, "") else "unknown"
+    return key.replace(".", "_").replace("$", "_")
+
+
+def _day_key(created_at) -> str:
+    return created_at.strftime("%Y-%m-%d") if isinstance(created_at, datetime) else "unknown"
+
+
+def caption_increments(caption_doc: dict, sign: int = 1) -> Counter:
+    """The $inc fields for adding (sign=1) or removing (sign=-1) one caption."""
+    inc = Counter({"total": sign})
+    for field, counter in STAT_DIMENSIONS.items():
+        inc[f"{counter}.{_stat_key(caption_doc.get(field))}"] += sign
+    inc[f"daily.{_day_key(caption_doc.get('createdAt'))}"] += sign
+    if sign < 0 and caption_doc.get("editedAt"):
+        inc["edited"] += sign
+    return inc
+
+
+def stats_update(user_id, inc: Counter, longest: int = 0):
+    """
+    (filter, update) for an upserting $inc on a user's counter document, plus a $max
+    of `longest` (length of the longest caption written), or None if nothing changes.
+    """
+    inc = {field: amount for field, amount in inc.items() if amount}
+    if not user_id or not (inc or longest):
+        return None
+    update = {"$set": {"updatedAt": datetime.now()}}
+    if inc:
+        update["$inc"] = inc
+    if longest:
+        update["$max"] = {"longest": longest}
+    return {"_id": user_id}, update
+
+
+def format_stats(user_id, stats_doc: dict) -> dict:
+    """Shape a counter document for the API, dropping keys whose count fell to zero."""
+    stats_doc = stats_doc or {}
+    result = {
+        "user_id": user_id,
+        "total": stats_doc.get("total", 0),
+        "edited": stats_doc.get("edited", 0),
+        "longest": stats_doc.get("longest", 0),
+        "updatedAt": stats_doc["updatedAt"].isoformat() if stats_doc.get("updatedAt") else None,
+    }
+    for counter in STAT_DIMENSIONS.values():
+        result[counter] = {k: v for k, v in (stats_doc.get(counter) or {}).items() if v > 0}
+    result["daily"] = [{"date": day, "count": count} for day, count in sorted((stats_doc.get("daily") or {}).items()) if count > 0]
+    return result
+
+
+# --- Applying increments; stats failures are logged, never fail the caption write ---
+
+def removal_increments(caption_docs: list) -> Counter:
+    inc = Counter()
+    for doc in caption_docs:
+        inc.update(caption_increments(doc, -1))
+    return inc
+
+
+def edit_increments(count: int) -> Counter:
+    """Count captions edited for the first time (the ones without editedAt before the edit)."""
+    return Counter({"edited": count})
+
+
+def bulk_increments(op_items: list, failed: dict, owned: dict, unapplied: dict = None) -> Counter:
+    """
+    Counter changes for the bulk operations that took effect; `owned` maps _id -> pre-write document.
+
+    Deletes that cannot be told apart from a concurrent delete ('ambiguous') are left
+    out, so no caption is counted down twice; rebuild_caption_stats.py corrects them.
+    """
+    unapplied = unapplied or {}
+    inc = Counter()
+    for index, (item, _) in enumerate(op_items):
+        if index in failed or index in unapplied:
+            if unapplied.get(index) == "ambiguous":
+                print(f"[WARNING] Could not attribute delete of caption {item['id']}; its stats wait for the next rebuild.")
+            continue
+        doc = owned[item["oid"]]
+        if item["op"] == "delete":
+            inc.update(caption_increments(doc, -1))
+        elif not doc.get("editedAt"):
+            inc["edited"] += 1
+    return inc
+
+
+def bulk_longest(op_items: list, failed: dict, unapplied: dict = None) -> int:
+    """Length of the longest caption text a bulk edit wrote (0 if none)."""
+    unapplied = unapplied or {}
+    return max((len(item["text"]) for index, (item, _) in enumerate(op_items)
+                if item["op"] == "update" and index not in failed and index not in unapplied), default=0)
+
+
+def _log_stats_failure(user_id, update, error):
+    # The changes are logged so the drift is visible; the next rebuild corrects it
+    changes = {op: update[1][op] for op in ("$inc", "$max") if op in update[1]}
+    print(f"[ERROR] Failed to update caption stats for user {user_id} ({changes}); "
+          f"counters are off until rebuild_caption_stats.py runs: {error}")
+
+
+def apply_stats(db, user_id, inc: Counter, longest: int = 0):
+    update = stats_update(user_id, inc, longest)
+    if update is None:
+        return
+    try:
+        db.caption_stats.update_one(*update, upsert=True)
+    except Exception as e:
+        _log_stats_failure(user_id, update, e)
+
+
+async def apply_stats_async(motor_db, user_id, inc: Counter, longest: int = 0):
+    update = stats_update(user_id, inc, longest)
+    if update is None:
+        return
+    try:
+        await motor_db.caption_stats.update_one(*update, upsert=True)
+    except Exception as e:
+        _log_stats_failure(user_id, update, e)
+
+
+# --- Rebuild ---
+
+def rebuild_pipelines(user_id=None) -> dict:
+    """Aggregation pipelines producing (user, key, count) rows for every counter."""
+    match = {"user_id": user_id} if user_id else {"user_id": {"$nin": [None, ""]}}
+    pipelines = {
+        "total": [{"$match": match}, {"$group": {"_id": {"u": "$user_id"}, "n": {"$sum": 1}}}],
+        "edited": [
+            {"$match": {**match, "editedAt": {"$exists": True}}},
+            {"$group": {"_id": {"u": "$user_id"}, "n": {"$sum": 1}}},
+        ],
+        "longest": [
+            {"$match": match},
+            {"$group": {"_id": {"u": "$user_id"}, "n": {"$max": {"$strLenCP": {"$ifNull": ["$caption", ""]}}}}},
+        ],
+        "daily": [
+            {"$match": match},
+            {"$group": {"_id": {"u": "$user_id", "k": {"$dateToString": {"format": "%Y-%m-%d", "date": "$createdAt"}}}, "n": {"$sum": 1}}},
+        ],
+    }
+    for field, counter in STAT_DIMENSIONS.items():
+        pipelines[counter] = [{"$match": match}, {"$group": {"_id": {"u": "$user_id", "k": f"${field}"}, "n": {"$sum": 1}}}]
+    return pipelines
+
+
+def rebuild_stats(db, user_id=None, batch_size: int = 500) -> int:
+    """Recompute counter documents from the captions collection. Returns the number of users written."""
+    from pymongo import ReplaceOne
+
+    users = {}
+    for counter, pipeline in rebuild_pipelines(user_id).items():
+        for row in db.captions.aggregate(pipeline, allowDiskUse=True):
+            doc = users.setdefault(row["_id"]["u"], {counter: {} for counter in list(STAT_DIMENSIONS.values()) + ["daily"]})
+            if counter in ("total", "edited", "longest"):
+                doc[counter] = row["n"]
+            else:
+                key = row["_id"].get("k")
+                key = (key or "unknown") if counter == "daily" else _stat_key(key)
+                doc[counter][key] = doc[counter].get(key, 0) + row["n"]
+
+    now = datetime.now()
+    operations, written = [], 0
+    for uid, doc in users.items():
+        doc.setdefault("edited", 0)
+        doc.setdefault("longest", 0)
+        doc["updatedAt"] = now
+        operations.append(ReplaceOne({"_id": uid}, doc, upsert=True))
+        if len(operations) >= batch_size:
+            db.caption_stats.bulk_write(operations, ordered=False)
+            written += len(operations)
+            operations = []
+    if operations:
+        db.caption_stats.bulk_write(operations, ordered=False)
+        written += len(operations)
+
+    # Users whose captions are all gone keep no counters
+    if user_id and user_id not in users:
+        db.caption_stats.delete_one({"_id": user_id})
+    elif not user_id:
+        db.caption_stats.delete_many({"_id": {"$nin": list(users)}})
+    return written
+
+
+def migrate_edited_flags(db) -> int:
+    """
+    One-off: mark captions edited before editedAt existed. Those only have updatedAt;
+    captions whose updatedAt came from a backfill job (they carry `backfill`) are skipped.
+    Returns the number of captions marked.
+    """
+    result = db.captions.update_many(
+        {"updatedAt": {"$exists": True}, "editedAt": {"$exists": False}, "backfill": {"$exists": False}},
+        [{"$set": {"editedAt": "$updatedAt"}}],
+    )
+    return result.modified_count
@@ -1,179 +1,319 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
 from ai_core.blip_model import generate_caption
 from ai_core.gemini_caption import generate_gemini_caption
-import base64
-from bson.objectid import ObjectId
-from datetime import datetime
+from ai_core.hybrid_caption import generate_hybrid_caption
+from ai_core.model_registry import UnknownModelError
+from routes.session_auth import AuthError, authorize_user
+from routes.caption_common import (
+    RequestError,
+    BlipLease,
+    error_body,
+    parse_generate_form,
+    CaptionGeneration,
+    parse_caption_edit,
+    caption_edit_query,
+    edit_stats,
+    caption_delete_query,
+    user_captions_query,
+    finish_captions_page,
+    serialize_captions,
+    BulkMutation,
+    parse_export_request,
+    ExportEncoder,
+)
+from routes.caption_stats import (
+    caption_increments,
+    removal_increments,
+    apply_stats,
+    format_stats,
+)
 from bson.errors import InvalidId
+from pymongo.errors import BulkWriteError
 
-# Social platforms that should use Gemini refinement
-SOCIAL_PLATFORMS = {"instagram", "linkedin", "twitter", "x", "facebook"}
-
+# Request handling shared with routes/captioning_async.py lives in routes/caption_common.py;
+# this module only makes the blocking model and Mongo calls.
 captioning_blueprint = Blueprint('captioning', __name__)
 
+def _auth_error(e):
+    return jsonify(error_body(str(e))), e.status
+
+def _respond(body_status):
+    body, status = body_status
+    return jsonify(body), status
+
 @captioning_blueprint.route('/generate', methods=['POST'])
 def generate_general_caption():
-    blip_model = current_app.blip_model
-    blip_processor = current_app.blip_processor
-    blip_device = current_app.blip_device
-
     if 'image' not in request.files:
         return jsonify({"message": "No image file provided"}), 400
 
     image_file = request.files['image']
-    tone = request.form.get('tone', 'casual')
-    length = request.form.get('length', 'short')
-    platform = request.form.get('platform', 'general').lower()
-    ai_model_choice = request.form.get('ai_model')  # optional
-    user_id = request.form.get('user_id')
-    include_hashtags = request.form.get('includeHashtags', 'false').lower() == 'true'
-
-    # Auto-decide model if not given by frontend
-    if not ai_model_choice:
-        if platform in SOCIAL_PLATFORMS:
-            ai_model_choice = "gemini"
-        else:
-            ai_model_choice = "blip"
+    options = parse_generate_form(request.form)
+    # Captions are saved under the session's user, not whatever user_id the form claims
+    try:
+        options["user_id"] = authorize_user(request.headers, options["user_id"], allow_anonymous=True)
+    except AuthError as e:
+        return _auth_error(e)
+
+    # Reject an unknown BLIP model up front, even when only the Gemini fallback would use it
+    try:
+        current_app.model_registry.resolve(options["blip_model"])
+    except UnknownModelError as e:
+        return jsonify(error_body(str(e), "blip")), 400
 
-    ai_model_choice = ai_model_choice.lower()
-    print(f"[DEBUG] Backend decided: AI Model = {ai_model_choice}, Platform = {platform}")
+    blip = BlipLease(current_app.model_registry, options["blip_model"])
+    try:
+        return _generate_with_model(image_file, options, blip)
+    finally:
+        blip.release()
+
+def _generate_with_model(image_file, options, blip):
+    generation = CaptionGeneration(options, image_file.read(), current_app.caption_metrics, current_app.gemini_router)
+    invalid = generation.validate()
+    if invalid:
+        return _respond(invalid)
 
-    image_bytes = image_file.read()
-    final_caption = ""
-    used_model = ""
-    image_base64 = base64.b64encode(image_bytes).decode('utf-8')
-    image_url = f"data:image/jpeg;base64,{image_base64}"
+    image_bytes = generation.image_bytes
+    tone, length, platform = options["tone"], options["length"], options["platform"]
+
+    # Only the BLIP and hybrid paths need BLIP for sure; Gemini acquires it for its fallback only
+    if generation.mode != "gemini":
+        try:
+            blip.acquire()
+        except Exception as e:
+            return _respond(generation.fail(f"BLIP model unavailable: {str(e)}", "blip", 503))
 
     try:
         # --- BLIP LOGIC ---
-        if ai_model_choice == "blip":
-            # If BLIP is explicitly chosen, it MUST be for the 'general' platform.
-            if platform != 'general':
-                print(f"[ERROR] BLIP model selected for non-general platform: {platform}")
-                return jsonify({"status": "error", "message": "BLIP model can only be used for 'General' captions. Please select 'General' platform or switch to Gemini API.", "model": "blip"}), 400
+        if generation.mode == "blip":
             try:
                 # Pass length preference to BLIP model, tone is now fixed to casual within blip_model.py
-                final_caption = generate_caption(image_bytes, blip_model, blip_processor, blip_device, length)
-                used_model = "blip"
+                final_caption = generate_caption(image_bytes, *blip.args(), length)
+                generation.used_model = "blip"
             except Exception as e:
-                print(f"[ERROR] BLIP caption generation failed: {e}")
-                return jsonify({"status": "error", "message": f"BLIP caption generation failed: {str(e)}", "model": "blip"}), 500
+                return _respond(generation.fail(f"BLIP caption generation failed: {str(e)}", "blip"))
 
         # --- GEMINI LOGIC ---
-        elif ai_model_choice == "gemini":
-            try:
-                final_caption = generate_gemini_caption(image_bytes, tone, length, platform, include_hashtags)
-                used_model = "gemini"
-                # Fallback to BLIP if Gemini returns empty text
-                if not final_caption:
-                    print("[WARNING] Gemini returned empty caption, attempting BLIP fallback.")
-                    final_caption = generate_caption(image_bytes, blip_model, blip_processor, blip_device)
-                    used_model = "blip_fallback"
-            except Exception as e: # Catch any exception from Gemini
-                print(f"[ERROR] Gemini caption generation failed: {e}")
-                # Attempt BLIP fallback if Gemini fails entirely
+        elif generation.mode == "gemini":
+            final_caption = ""
+            prompt = generation.gemini_prompt()
+            if prompt:
+                final_caption = generation.gemini_done(
+                    generate_gemini_caption(image_bytes, tone, length, platform, options["include_hashtags"], prompt=prompt)
+                )
+            # Fallback to BLIP if Gemini was skipped or returned empty text
+            if not final_caption:
                 try:
-                    print("[INFO] Gemini failed, attempting BLIP fallback.")
-                    final_caption = generate_caption(image_bytes, blip_model, blip_processor, blip_device)
-                    used_model = "blip_fallback"
-                    print("[INFO] Gemini failed, successfully fell back to BLIP.")
-                except Exception as blip_fallback_e:
-                    print(f"[ERROR] BLIP fallback caption generation failed after Gemini error: {blip_fallback_e}")
-                    return jsonify({"status": "error", "message": f"Failed to generate caption with Gemini and BLIP fallback: {str(blip_fallback_e)}", "model": "gemini"}), 500
-
-        # --- INVALID MODEL ---
+                    final_caption = generate_caption(image_bytes, *blip.acquire().args())
+                    generation.used_model = "blip_fallback"
+                except Exception as e:
+                    return _respond(generation.fail(f"Failed to generate caption with Gemini and BLIP fallback: {str(e)}", "gemini"))
+
+        # --- HYBRID LOGIC: BLIP draft, text-only Gemini rewrite ---
         else:
-            print(f"[ERROR] Invalid AI model choice received: {ai_model_choice}")
-            return jsonify({"status": "error", "message": "Invalid AI model choice.", "model": "none"}), 400
+            try:
+                final_caption, hybrid_info = generate_hybrid_caption(
+                    image_bytes, *blip.args(), tone, length, platform, options["include_hashtags"],
+                    allow_refine=generation.allow_gemini
+                )
+                generation.hybrid_done(final_caption, hybrid_info)
+            except Exception as e:
+                return _respond(generation.fail(f"Hybrid caption generation failed: {str(e)}", "hybrid"))
 
-        if not final_caption:
-            print(f"[ERROR] Final caption is empty after using {used_model}.")
-            return jsonify({"status": "error", "message": f"Failed to generate caption: result was empty from {used_model}.", "model": used_model}), 500
+        body, status = generation.finish(final_caption, blip.handle)
 
         # Save to DB
-        if user_id:
+        user_id = options["user_id"]
+        if status == 200 and user_id:
             try:
                 mongo = current_app.mongo
-                captions_collection = mongo.db.captions
-                captions_collection.insert_one({
-                    "user_id": user_id,
-                    "caption": final_caption,
-                    "platform": platform,
-                    "tone": tone,
-                    "length": length,
-                    "image_url": image_url,
-                    "model_used": used_model,
-                    "createdAt": datetime.now()
-                })
-                print(f"[INFO] Caption saved to DB for user: {user_id} using {used_model}.")
+                caption_doc = generation.caption_doc(final_caption)
+                mongo.db.captions.insert_one(caption_doc)
+                apply_stats(mongo.db, user_id, caption_increments(caption_doc), len(final_caption))
+                print(f"[INFO] Caption saved to DB for user: {user_id} using {generation.used_model}.")
             except Exception as db_e:
                 print(f"[ERROR] Failed to save caption to database for user {user_id}: {db_e}")
-        else:
+        elif status == 200:
             print("[WARNING] Caption not saved to DB: No user_id provided for generated caption.")
 
-        return jsonify({
-            "status": "success",
-            "caption": final_caption,
-            "platform": platform,
-            "model": used_model,
-            "image_url": image_url
-        }), 200
+        return jsonify(body), status
 
     except Exception as e:
-        print(f"[CRITICAL ERROR] Unexpected caption generation error: {e}")
-        return jsonify({"status": "error", "message": f"Failed to generate caption due to unexpected server error: {str(e)}"}), 500
+        return _respond(generation.fail(f"Failed to generate caption due to unexpected server error: {str(e)}"))
+
+@captioning_blueprint.route('/metrics', methods=['GET'])
+def caption_metrics():
+    """Per-mode request counts, latency percentiles, upstream payload size and Gemini routing state."""
+    return jsonify({
+        "status": "success",
+        "modes": current_app.caption_metrics.snapshot(),
+        "gemini_routing": current_app.gemini_router.snapshot()
+    }), 200
+
+@captioning_blueprint.route('/stats/<user_id>', methods=['GET'])
+def get_user_stats(user_id):
+    """Dashboard totals from the user's counter document instead of scanning their captions."""
+    try:
+        user_id = authorize_user(request.headers, user_id)
+    except AuthError as e:
+        return _auth_error(e)
+
+    mongo = current_app.mongo
+
+    try:
+        stats_doc = mongo.db.caption_stats.find_one({"_id": user_id})
+        return jsonify({"status": "success", "stats": format_stats(user_id, stats_doc)}), 200
+    except Exception as e:
+        print(f"[ERROR] Failed to fetch caption stats for {user_id}: {e}")
+        return jsonify(error_body("Failed to fetch caption stats.")), 500
 
 @captioning_blueprint.route('/user_captions/<user_id>', methods=['GET'])
 def get_user_captions(user_id):
-    mongo = current_app.mongo
-    captions_collection = mongo.db.captions
+    try:
+        user_id = authorize_user(request.headers, user_id)
+    except AuthError as e:
+        return _auth_error(e)
+
+    captions_collection = current_app.mongo.db.captions
 
     try:
-        user_captions = list(captions_collection.find({"user_id": user_id}).sort("createdAt", -1))
-        for caption in user_captions:
-            caption['_id'] = str(caption['_id'])
-        return jsonify({"status": "success", "captions": user_captions}), 200
+        query = user_captions_query(user_id, request.args)
+    except RequestError as e:
+        return jsonify(error_body(str(e))), 400
+
+    try:
+        user_captions, next_before = finish_captions_page(list(captions_collection.find(**query)), query)
+        return jsonify({"status": "success", "captions": serialize_captions(user_captions), "next_before": next_before}), 200
     except Exception as e:
         print(f"[ERROR] Failed to fetch user captions for {user_id}: {e}")
-        return jsonify({"status": "error", "message": "Failed to fetch captions."}), 500
+        return jsonify(error_body("Failed to fetch captions.")), 500
 
 @captioning_blueprint.route('/caption/<caption_id>', methods=['PUT'])
 def update_caption(caption_id):
+    try:
+        owner = authorize_user(request.headers)
+    except AuthError as e:
+        return _auth_error(e)
+
     mongo = current_app.mongo
-    captions_collection = mongo.db.captions
-    data = request.get_json()
-    new_text = data.get('text')
 
-    if not new_text:
-        return jsonify({"message": "Caption text is required"}), 400
+    try:
+        new_text = parse_caption_edit(request.get_json(silent=True))
+    except RequestError as e:
+        return jsonify(error_body(str(e))), 400
 
     try:
-        result = captions_collection.update_one(
-            {"_id": ObjectId(caption_id)},
-            {"$set": {"caption": new_text, "updatedAt": datetime.now()}}
-        )
-        if result.modified_count == 1:
+        previous = mongo.db.captions.find_one_and_update(**caption_edit_query(owner, caption_id, new_text))
+        if previous is not None:
+            apply_stats(mongo.db, previous.get("user_id"), edit_stats(previous), len(new_text))
             return jsonify({"status": "success", "message": "Caption updated successfully."}), 200
         else:
-            return jsonify({"status": "error", "message": "Caption not found or not modified."}), 404
+            return jsonify(error_body("Caption not found or not modified.")), 404
+    except InvalidId:
+        return jsonify(error_body("Invalid caption ID format.")), 400
     except Exception as e:
         print(f"[ERROR] Failed to update caption {caption_id}: {e}")
-        return jsonify({"status": "error", "message": "Failed to update caption."}), 500
+        return jsonify(error_body("Failed to update caption.")), 500
 
 @captioning_blueprint.route('/caption/<caption_id>', methods=['DELETE'])
 def delete_caption(caption_id):
+    try:
+        owner = authorize_user(request.headers)
+    except AuthError as e:
+        return _auth_error(e)
+
     mongo = current_app.mongo
-    captions_collection = mongo.db.captions
 
     try:
-        result = captions_collection.delete_one({"_id": ObjectId(caption_id)})
-        if result.deleted_count == 1:
+        deleted = mongo.db.captions.find_one_and_delete(**caption_delete_query(owner, caption_id))
+        if deleted is not None:
+            apply_stats(mongo.db, deleted.get("user_id"), removal_increments([deleted]))
             return jsonify({"status": "success", "message": "Caption deleted successfully."}), 200
         else:
-            return jsonify({"status": "error", "message": "Caption not found."}), 404
+            return jsonify(error_body("Caption not found.")), 404
     except InvalidId as e:
         print(f"[ERROR] Invalid caption ID format received: {caption_id}. Error: {e}")
-        return jsonify({"status": "error", "message": "Invalid caption ID format."}), 400
+        return jsonify(error_body("Invalid caption ID format.")), 400
     except Exception as e:
         print(f"[ERROR] Failed to delete caption {caption_id}: {e}")
-        return jsonify({"status": "error", "message": "Failed to delete caption."}), 500
\ No newline at end of file
+        return jsonify(error_body("Failed to delete caption.")), 500
+
+@captioning_blueprint.route('/captions/bulk', methods=['POST'])
+def bulk_mutate_captions():
+    """
+    Delete and/or edit many captions of one user with a single bulk_write.
+
+    Body: {"user_id": ..., "delete": [id, ...], "update": [{"id": ..., "text": ...}, ...]}
+    Returns a per-item result and a change set the client can apply to its local state.
+    """
+    mongo = current_app.mongo
+    captions_collection = mongo.db.captions
+
+    try:
+        # 1. Validate every item, keeping results in request order
+        bulk = BulkMutation(request.get_json(silent=True) or {})
+    except RequestError as e:
+        return jsonify(error_body(str(e))), 400
+    try:
+        bulk.user_id = authorize_user(request.headers, bulk.user_id)
+    except AuthError as e:
+        return _auth_error(e)
+
+    try:
+        # 2. Only touch captions owned by this user
+        operations = bulk.plan(captions_collection.find(**bulk.owned_query()))
+
+        # 3. Apply everything in one round trip
+        if operations:
+            try:
+                bulk.written(captions_collection.bulk_write(operations, ordered=False))
+            except BulkWriteError as bwe:
+                bulk.write_failed(bwe)
+
+        # 4. When fewer captions matched than planned, find out which writes did not apply
+        verify_query = bulk.verify_query()
+        if verify_query is not None:
+            bulk.verified(list(captions_collection.find(**verify_query)))
+    except Exception as e:
+        print(f"[ERROR] Bulk caption mutation failed for user {bulk.user_id}: {e}")
+        return jsonify(error_body("Failed to apply bulk caption changes.")), 500
+
+    apply_stats(mongo.db, bulk.user_id, bulk.stats_increments(), bulk.stats_longest())
+    return jsonify(bulk.response()), 200
+
+
+def _export_rows(cursor, encoder):
+    """Encode cursor documents batch by batch so only one batch is held in memory."""
+    for doc in cursor:
+        chunk = encoder.add(doc)
+        if chunk:
+            yield chunk
+    chunk = encoder.finish()
+    if chunk:
+        yield chunk
+
+
+@captioning_blueprint.route('/export/<user_id>', methods=['GET'])
+def export_user_captions(user_id):
+    """
+    Stream a user's caption history as NDJSON or CSV straight off a Mongo cursor.
+
+    Query params: format=ndjson|csv, fields=comma,separated, since/until (ISO dates; a date-only until
+    includes that whole day), gzip=true.
+    """
+    try:
+        user_id = authorize_user(request.headers, user_id)
+    except AuthError as e:
+        return _auth_error(e)
+
+    captions_collection = current_app.mongo.db.captions
+
+    try:
+        export = parse_export_request(user_id, request.args)
+    except RequestError as e:
+        return jsonify(error_body(str(e))), 400
+
+    cursor = captions_collection.find(export["query"], export["projection"]).sort("createdAt", -1).batch_size(export["batch_size"])
+    body = _export_rows(cursor, ExportEncoder(export["fields"], export["format"], export["gzip"], export["batch_size"]))
+
+    print(f"[INFO] Streaming {export['format']} caption export for user: {user_id}")
+    return Response(stream_with_context(body), mimetype=export["mimetype"], headers=export["headers"])
@@ -0,0 +1,310 @@
+import asyncio
+
+from bson.errors import InvalidId
+from pymongo.errors import BulkWriteError
+from quart import Blueprint, request, jsonify, current_app, Response
+
+from ai_core.blip_model import generate_caption
+from ai_core.gemini_caption import generate_gemini_caption_async
+from ai_core.hybrid_caption import generate_hybrid_caption_async
+from ai_core.model_registry import UnknownModelError
+from routes.session_auth import AuthError, authorize_user
+from routes.caption_common import (
+    RequestError,
+    BlipLease,
+    error_body,
+    parse_generate_form,
+    CaptionGeneration,
+    parse_caption_edit,
+    caption_edit_query,
+    edit_stats,
+    caption_delete_query,
+    user_captions_query,
+    finish_captions_page,
+    serialize_captions,
+    BulkMutation,
+    parse_export_request,
+    ExportEncoder,
+)
+from routes.caption_stats import (
+    caption_increments,
+    removal_increments,
+    apply_stats_async,
+    format_stats,
+)
+
+# Async version of routes/captioning.py for the ASGI server (asgi_app.py). Request
+# handling is shared through routes/caption_common.py; here Mongo goes through Motor,
+# Gemini through the async client, and BLIP inference runs on current_app.blip_executor
+# so the event loop never blocks on it.
+async_captioning_blueprint = Blueprint('captioning_async', __name__)
+
+
+def _auth_error(e):
+    return jsonify(error_body(str(e))), e.status
+
+
+def _respond(body_status):
+    body, status = body_status
+    return jsonify(body), status
+
+
+async def _run_blip(func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(current_app.blip_executor, func, *args)
+
+
+@async_captioning_blueprint.route('/generate', methods=['POST'])
+async def generate_general_caption():
+    files = await request.files
+    if 'image' not in files:
+        return jsonify({"message": "No image file provided"}), 400
+
+    options = parse_generate_form(await request.form)
+    # Captions are saved under the session's user, not whatever user_id the form claims
+    try:
+        options["user_id"] = authorize_user(request.headers, options["user_id"], allow_anonymous=True)
+    except AuthError as e:
+        return _auth_error(e)
+
+    # Reject an unknown BLIP model up front, even when only the Gemini fallback would use it
+    try:
+        current_app.model_registry.resolve(options["blip_model"])
+    except UnknownModelError as e:
+        return jsonify(error_body(str(e), "blip")), 400
+
+    blip = BlipLease(current_app.model_registry, options["blip_model"])
+    try:
+        return await _generate_with_model(files['image'], options, blip)
+    finally:
+        blip.release()
+
+
+async def _generate_with_model(image_file, options, blip):
+    generation = CaptionGeneration(options, image_file.read(), current_app.caption_metrics, current_app.gemini_router)
+    invalid = generation.validate()
+    if invalid:
+        return _respond(invalid)
+
+    image_bytes = generation.image_bytes
+    tone, length, platform = options["tone"], options["length"], options["platform"]
+
+    # Only the BLIP and hybrid paths need BLIP for sure; Gemini acquires it for its fallback only.
+    # acquire() may have to load the model from disk, so it runs on the BLIP executor.
+    if generation.mode != "gemini":
+        try:
+            await blip.acquire_async(_run_blip)
+        except Exception as e:
+            return _respond(generation.fail(f"BLIP model unavailable: {str(e)}", "blip", 503))
+
+    try:
+        # --- BLIP LOGIC ---
+        if generation.mode == "blip":
+            try:
+                final_caption = await _run_blip(generate_caption, image_bytes, *blip.args(), length)
+                generation.used_model = "blip"
+            except Exception as e:
+                return _respond(generation.fail(f"BLIP caption generation failed: {str(e)}", "blip"))
+
+        # --- GEMINI LOGIC ---
+        elif generation.mode == "gemini":
+            final_caption = ""
+            prompt = generation.gemini_prompt()
+            if prompt:
+                final_caption = generation.gemini_done(
+                    await generate_gemini_caption_async(image_bytes, tone, length, platform, options["include_hashtags"], prompt=prompt)
+                )
+            # Fallback to BLIP if Gemini was skipped or returned empty text
+            if not final_caption:
+                try:
+                    await blip.acquire_async(_run_blip)
+                    final_caption = await _run_blip(generate_caption, image_bytes, *blip.args())
+                    generation.used_model = "blip_fallback"
+                except Exception as e:
+                    return _respond(generation.fail(f"Failed to generate caption with Gemini and BLIP fallback: {str(e)}", "gemini"))
+
+        # --- HYBRID LOGIC: BLIP draft, text-only Gemini rewrite ---
+        else:
+            try:
+                final_caption, hybrid_info = await generate_hybrid_caption_async(
+                    image_bytes, *blip.args(), tone, length, platform, options["include_hashtags"],
+                    allow_refine=generation.allow_gemini, executor=current_app.blip_executor
+                )
+                generation.hybrid_done(final_caption, hybrid_info)
+            except Exception as e:
+                return _respond(generation.fail(f"Hybrid caption generation failed: {str(e)}", "hybrid"))
+
+        body, status = generation.finish(final_caption, blip.handle)
+
+        # Save to DB
+        user_id = options["user_id"]
+        if status == 200 and user_id:
+            try:
+                caption_doc = generation.caption_doc(final_caption)
+                await current_app.motor_db.captions.insert_one(caption_doc)
+                await apply_stats_async(current_app.motor_db, user_id, caption_increments(caption_doc), len(final_caption))
+            except Exception as db_e:
+                print(f"[ERROR] Failed to save caption to database for user {user_id}: {db_e}")
+
+        return jsonify(body), status
+
+    except Exception as e:
+        return _respond(generation.fail(f"Failed to generate caption due to unexpected server error: {str(e)}"))
+
+
+@async_captioning_blueprint.route('/metrics', methods=['GET'])
+async def caption_metrics():
+    return jsonify({
+        "status": "success",
+        "modes": current_app.caption_metrics.snapshot(),
+        "gemini_routing": current_app.gemini_router.snapshot()
+    }), 200
+
+
+@async_captioning_blueprint.route('/stats/<user_id>', methods=['GET'])
+async def get_user_stats(user_id):
+    try:
+        user_id = authorize_user(request.headers, user_id)
+    except AuthError as e:
+        return _auth_error(e)
+
+    try:
+        stats_doc = await current_app.motor_db.caption_stats.find_one({"_id": user_id})
+        return jsonify({"status": "success", "stats": format_stats(user_id, stats_doc)}), 200
+    except Exception as e:
+        print(f"[ERROR] Failed to fetch caption stats for {user_id}: {e}")
+        return jsonify(error_body("Failed to fetch caption stats.")), 500
+
+
+@async_captioning_blueprint.route('/user_captions/<user_id>', methods=['GET'])
+async def get_user_captions(user_id):
+    try:
+        user_id = authorize_user(request.headers, user_id)
+    except AuthError as e:
+        return _auth_error(e)
+
+    captions_collection = current_app.motor_db.captions
+
+    try:
+        query = user_captions_query(user_id, request.args)
+    except RequestError as e:
+        return jsonify(error_body(str(e))), 400
+
+    try:
+        user_captions, next_before = finish_captions_page(await captions_collection.find(**query).to_list(length=None), query)
+        return jsonify({"status": "success", "captions": serialize_captions(user_captions), "next_before": next_before}), 200
+    except Exception as e:
+        print(f"[ERROR] Failed to fetch user captions for {user_id}: {e}")
+        return jsonify(error_body("Failed to fetch captions.")), 500
+
+
+@async_captioning_blueprint.route('/caption/<caption_id>', methods=['PUT'])
+async def update_caption(caption_id):
+    try:
+        owner = authorize_user(request.headers)
+    except AuthError as e:
+        return _auth_error(e)
+
+    motor_db = current_app.motor_db
+
+    try:
+        new_text = parse_caption_edit(await request.get_json(silent=True))
+    except RequestError as e:
+        return jsonify(error_body(str(e))), 400
+
+    try:
+        previous = await motor_db.captions.find_one_and_update(**caption_edit_query(owner, caption_id, new_text))
+        if previous is not None:
+            await apply_stats_async(motor_db, previous.get("user_id"), edit_stats(previous), len(new_text))
+            return jsonify({"status": "success", "message": "Caption updated successfully."}), 200
+        else:
+            return jsonify(error_body("Caption not found or not modified.")), 404
+    except InvalidId:
+        return jsonify(error_body("Invalid caption ID format.")), 400
+    except Exception as e:
+        print(f"[ERROR] Failed to update caption {caption_id}: {e}")
+        return jsonify(error_body("Failed to update caption.")), 500
+
+
+@async_captioning_blueprint.route('/caption/<caption_id>', methods=['DELETE'])
+async def delete_caption(caption_id):
+    try:
+        owner = authorize_user(request.headers)
+    except AuthError as e:
+        return _auth_error(e)
+
+    motor_db = current_app.motor_db
+
+    try:
+        deleted = await motor_db.captions.find_one_and_delete(**caption_delete_query(owner, caption_id))
+        if deleted is not None:
+            await apply_stats_async(motor_db, deleted.get("user_id"), removal_increments([deleted]))
+            return jsonify({"status": "success", "message": "Caption deleted successfully."}), 200
+        else:
+            return jsonify(error_body("Caption not found.")), 404
+    except InvalidId:
+        return jsonify(error_body("Invalid caption ID format.")), 400
+    except Exception as e:
+        print(f"[ERROR] Failed to delete caption {caption_id}: {e}")
+        return jsonify(error_body("Failed to delete caption.")), 500
+
+
+@async_captioning_blueprint.route('/captions/bulk', methods=['POST'])
+async def bulk_mutate_captions():
+    captions_collection = current_app.motor_db.captions
+
+    try:
+        bulk = BulkMutation(await request.get_json(silent=True) or {})
+    except RequestError as e:
+        return jsonify(error_body(str(e))), 400
+    try:
+        bulk.user_id = authorize_user(request.headers, bulk.user_id)
+    except AuthError as e:
+        return _auth_error(e)
+
+    try:
+        operations = bulk.plan([doc async for doc in captions_collection.find(**bulk.owned_query())])
+        if operations:
+            try:
+                bulk.written(await captions_collection.bulk_write(operations, ordered=False))
+            except BulkWriteError as bwe:
+                bulk.write_failed(bwe)
+
+        verify_query = bulk.verify_query()
+        if verify_query is not None:
+            bulk.verified([doc async for doc in captions_collection.find(**verify_query)])
+    except Exception as e:
+        print(f"[ERROR] Bulk caption mutation failed for user {bulk.user_id}: {e}")
+        return jsonify(error_body("Failed to apply bulk caption changes.")), 500
+
+    await apply_stats_async(current_app.motor_db, bulk.user_id, bulk.stats_increments(), bulk.stats_longest())
+    return jsonify(bulk.response()), 200
+
+
+async def _export_rows(cursor, encoder):
+    async for doc in cursor:
+        chunk = encoder.add(doc)
+        if chunk:
+            yield chunk
+    chunk = encoder.finish()
+    if chunk:
+        yield chunk
+
+
+@async_captioning_blueprint.route('/export/<user_id>', methods=['GET'])
+async def export_user_captions(user_id):
+    try:
+        user_id = authorize_user(request.headers, user_id)
+    except AuthError as e:
+        return _auth_error(e)
+
+    captions_collection = current_app.motor_db.captions
+
+    try:
+        export = parse_export_request(user_id, request.args)
+    except RequestError as e:
+        return jsonify(error_body(str(e))), 400
+
+    cursor = captions_collection.find(export["query"], export["projection"]).sort("createdAt", -1).batch_size(export["batch_size"])
+    body = _export_rows(cursor, ExportEncoder(export["fields"], export["format"], export["gzip"], export["batch_size"]))
+    return Response(body, mimetype=export["mimetype"], headers=export["headers"])
@@ -0,0 +1,214 @@
+"""
+Signed session tokens and off-thread bcrypt for the auth routes.
+
+Login issues an HMAC-SHA256 signed token carrying the username and an expiry;
+the caption and history routes verify it with one HMAC and no database lookup,
+instead of trusting the user_id sent by the client. bcrypt runs on a small
+bounded executor so a burst of logins cannot tie up every request thread.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from bcrypt import checkpw, gensalt, hashpw
+
+DEFAULT_TOKEN_TTL_SECONDS = 12 * 60 * 60
+
+_secret = None
+_secret_lock = threading.Lock()
+
+
+class AuthError(Exception):
+    """A rejected request; carries the message and HTTP status to return."""
+
+    def __init__(self, message: str, status: int = 401):
+        super().__init__(message)
+        self.status = status
+
+
+class BcryptBusy(Exception):
+    """Raised when the bcrypt executor is full or too slow; the route answers 503 with Retry-After."""
+
+    def __init__(self, message: str, retry_after: int = 1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def session_auth_required() -> bool:
+    """Set SESSION_AUTH_REQUIRED=false to still accept token-less requests during a rollout."""
+    return os.getenv("SESSION_AUTH_REQUIRED", "true").lower() == "true"
+
+
+def check_session_config():
+    """
+    Fail at startup when session auth is required but SESSION_SECRET is not set. A random
+    per-process secret would reject tokens issued by every other worker and before restarts.
+
+    :raises RuntimeError: If the secret is missing.
+    """
+    if session_auth_required() and not os.getenv("SESSION_SECRET"):
+        raise RuntimeError(
+            "SESSION_SECRET must be set while SESSION_AUTH_REQUIRED is true (the default). Add one to backend/.env, "
+            "e.g. from: python -c \"import secrets; print(secrets.token_hex(32))\". For local development only, "
+            "SESSION_AUTH_REQUIRED=false (or start_backend.bat dev) starts without it; see README.md."
+        )
+
+
+def _get_secret() -> bytes:
+    global _secret
+    if _secret is None:
+        with _secret_lock:
+            if _secret is None:
+                check_session_config()
+                configured = os.getenv("SESSION_SECRET")
+                if not configured:
+                    # Only during a rollout without required auth; tokens then only verify in this process
+                    print("[WARNING] SESSION_SECRET not set; using a random per-process secret.")
+                    configured = secrets.token_hex(32)
+                _secret = configured.encode("utf-8")
+    return _secret
+
+
+# --- Tokens ---
+
+def issue_token(username: str, ttl_seconds: int = None) -> dict:
+    """Sign a session token for `username`. Returns {"token": ..., "expires_at": unix seconds}."""
+    ttl_seconds = ttl_seconds or int(os.getenv("SESSION_TOKEN_TTL_SECONDS", DEFAULT_TOKEN_TTL_SECONDS))
+    expires_at = int(time.time()) + ttl_seconds
+    payload = _b64encode(json.dumps({"sub": username, "exp": expires_at}, separators=(",", ":")).encode("utf-8"))
+    signature = _b64encode(hmac.new(_get_secret(), payload.encode("ascii"), hashlib.sha256).digest())
+    return {"token": f"{payload}.{signature}", "expires_at": expires_at}
+
+
+def verify_token(token: str) -> str:
+    """
+    Check a token's signature and expiry.
+
+    :return: The username the token was issued to.
+    :raises AuthError: If the token is malformed, forged or expired.
+    """
+    payload, _, signature = (token or "").partition(".")
+    if not payload or not signature:
+        raise AuthError("Malformed session token.")
+    expected = _b64encode(hmac.new(_get_secret(), payload.encode("utf-8"), hashlib.sha256).digest())
+    if not hmac.compare_digest(signature.encode("utf-8"), expected.encode("ascii")):
+        raise AuthError("Invalid session token.")
+    try:
+        claims = json.loads(_b64decode(payload))
+    except ValueError:
+        raise AuthError("Malformed session token.")
+    if claims.get("exp", 0) < time.time():
+        raise AuthError("Session expired, please log in again.")
+    return claims["sub"]
+
+
+def session_user(headers):
+    """The username from an 'Authorization: Bearer <token>' header, or None when there is no token."""
+    scheme, _, token = headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    return verify_token(token.strip())
+
+
+def authorize_user(headers, claimed_user_id=None, allow_anonymous: bool = False):
+    """
+    Resolve the user a caption/history request acts for.
+
+    With a valid token the token's user wins, and a different claimed user_id is
+    rejected with 403. Without a token the request is rejected with 401, unless
+    session auth is not required (then the claimed user_id is trusted as before)
+    or `allow_anonymous` is set and no user was claimed.
+
+    :raises AuthError: When the request is not allowed.
+    """
+    user = session_user(headers)
+    if user is None:
+        if allow_anonymous and not claimed_user_id:
+            return None
+        if session_auth_required():
+            raise AuthError("Session token required.", 401)
+        return claimed_user_id
+    if claimed_user_id and claimed_user_id != user:
+        raise AuthError("Session token does not match this user.", 403)
+    return user
+
+
+# --- bcrypt ---
+
+class BcryptExecutor:
+    """
+    Caps concurrent bcrypt work at `workers` running and `max_queue` waiting calls.
+
+    This limits concurrency; it does not free the request thread. run() blocks the
+    calling request thread on the result (up to `timeout`) while a pool thread
+    hashes. bcrypt is deliberately slow CPU work, so the cap keeps a login burst
+    from occupying every request thread and turns overload into a fast 503. Every
+    admitted call holds a request thread, so the slots are capped at half of
+    `server_threads` and the other half keeps serving the rest of the API.
+    """
+
+    def __init__(self, workers: int = 2, max_queue: int = 4, timeout: float = 5.0, server_threads: int = None):
+        self.workers = workers
+        self.timeout = timeout
+        self.slots = workers + max_queue
+        if server_threads:
+            limit = max(1, server_threads // 2)
+            if self.slots > limit:
+                print(f"[WARNING] Capping bcrypt slots at {limit} (half of {server_threads} server threads) instead of {self.slots}.")
+                self.slots = limit
+        self._executor = ThreadPoolExecutor(max_workers=min(workers, self.slots), thread_name_prefix="bcrypt")
+        self._slots = threading.BoundedSemaphore(self.slots)
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            workers=int(os.getenv("BCRYPT_WORKERS", 2)),
+            max_queue=int(os.getenv("BCRYPT_MAX_QUEUE", 4)),
+            timeout=float(os.getenv("BCRYPT_TIMEOUT_SECONDS", 5)),
+            server_threads=int(os.getenv("WEB_THREADS", 16)),
+        )
+
+    def run(self, func, *args):
+        if not self._slots.acquire(blocking=False):
+            raise BcryptBusy("Too many sign-in requests in progress, please retry shortly.")
+        try:
+            future = self._executor.submit(func, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            # Drop it if it is still queued; a running hash finishes and frees its slot itself
+            future.cancel()
+            raise BcryptBusy("Sign-in is taking longer than usual, please retry shortly.", retry_after=max(1, round(self.timeout)))
+
+    def hash(self, *secrets_to_hash: str) -> list:
+        """Hash one or more secrets in a single executor job."""
+        return self.run(_hash_all, secrets_to_hash)
+
+    def check(self, secret: str, hashed: str) -> bool:
+        return self.run(_check, secret, hashed)
+
+
+def _hash_all(values) -> list:
+    return [hashpw(value.encode("utf-8"), gensalt()).decode("utf-8") for value in values]
+
+
+def _check(secret: str, hashed: str) -> bool:
+    return checkpw(secret.encode("utf-8"), hashed.encode("utf-8"))
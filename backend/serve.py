@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Production server entry point (replaces `python app.py`, which runs the Flask dev server).
+
+    python serve.py --mode sync --port 5123 --threads 16     # waitress + app.py (default)
+    python serve.py --mode async --port 5123 --workers 2     # uvicorn + asgi_app.py
+
+Sync mode stays the default until bench_serving.py shows async ahead on a
+deployment with Mongo and a loaded model; async mode is opt-in (SERVER_MODE=async).
+Last run (1 CPU, 16 threads / 1 worker, no Mongo or BLIP, fake Gemini at 0.5 s,
+1000 requests per level; req/s, p95 in brackets):
+
+    scenario   conc.  sync              async
+    health       16   378 (122 ms)      318 (121 ms)
+    health       64   153 (1636 ms)     147 (1556 ms)
+    health      256    55 (11489 ms)     85 (7332 ms)
+    generate     16    29 (596 ms)       10 (1945 ms)
+    generate     64    29 (2325 ms)      10 (6723 ms)
+
+Async only led on /health at 256 connections. Its /generate was capped at about
+10 req/s because, with the GEMINI_API_ENDPOINT override, the Gemini call runs via
+asyncio.to_thread on the default executor (5 threads on one CPU); against the real
+gRPC endpoint it is a native coroutine, which this run did not measure. At 256
+connections both modes opened the Gemini circuit and failed over to a missing BLIP.
+
+In async mode each worker is a separate process with its own BLIP copy; set
+CAPTION_WORKERS to the same value so torch threads are split across them. With
+BLIP_PIN_CPUS=true each worker claims its own index (and core slice) at startup.
+"""
+import argparse
+import os
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the caption backend with a production server.")
+    parser.add_argument("--mode", choices=("async", "sync"), default=os.getenv("SERVER_MODE", "sync"))
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", 5123)))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_WORKERS", 1)), help="Worker processes (async mode)")
+    parser.add_argument("--threads", type=int, default=int(os.getenv("WEB_THREADS", 16)), help="Request threads (sync mode; the Flask routes in async mode)")
+    args = parser.parse_args()
+
+    os.environ.setdefault("CAPTION_WORKERS", str(args.workers))
+    os.environ.setdefault("WEB_THREADS", str(args.threads))
+    # Worker slot files are keyed by port, so two servers on one host do not share indexes
+    os.environ.setdefault("PORT", str(args.port))
+
+    if args.mode == "async":
+        import uvicorn
+        uvicorn.run("asgi_app:create_asgi_app", factory=True, host=args.host, port=args.port, workers=args.workers)
+    else:
+        from waitress import serve
+        from app import create_app
+        serve(create_app(), host=args.host, port=args.port, threads=args.threads)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,7 @@
+@echo off
+cd /d %~dp0
+rem Needs SESSION_SECRET in backend\.env (see README.md). "start_backend.bat dev" starts without it for
+rem local development only: session auth is not required and tokens last until the server restarts.
+if /i "%~1"=="dev" set SESSION_AUTH_REQUIRED=false
+rem Production server (threaded WSGI); use --mode async for the uvicorn + Quart server
+python serve.py --mode sync --port 5123
@@ -0,0 +1,132 @@
+"""
+Unit tests for BackfillJob checkpointing: failed documents are remembered and
+retried on the next run, and the checkpoint never moves backwards.
+"""
+from types import SimpleNamespace
+
+import pytest
+
+from backfill_captions import BackfillJob
+
+
+class FakeCursor(list):
+    def sort(self, key, direction):
+        return FakeCursor(sorted(self, key=lambda doc: doc[key], reverse=direction < 0))
+
+    def batch_size(self, size):
+        return self
+
+    def close(self):
+        pass
+
+
+class FakeCaptions:
+    """Just enough of a Mongo collection for BackfillJob: _id range/$in queries and bulk UpdateOne."""
+
+    def __init__(self, docs):
+        self.docs = {doc["_id"]: dict(doc) for doc in docs}
+
+    def find(self, query, projection=None):
+        id_filter = query.get("_id", {})
+        docs = []
+        for doc in self.docs.values():
+            if "$gt" in id_filter and not doc["_id"] > id_filter["$gt"]:
+                continue
+            if "$in" in id_filter and doc["_id"] not in id_filter["$in"]:
+                continue
+            docs.append(dict(doc))
+        return FakeCursor(docs)
+
+    def bulk_write(self, operations, ordered=True):
+        modified = 0
+        for op in operations:
+            doc = self.docs[op._filter["_id"]]
+            if doc["caption"] == op._filter["caption"]:
+                doc.update(op._doc["$set"])
+                modified += 1
+        return SimpleNamespace(modified_count=modified)
+
+
+class FakeCheckpoints:
+    def __init__(self):
+        self.docs = {}
+
+    def find_one(self, query):
+        return self.docs.get(query["_id"])
+
+    def update_one(self, query, update, upsert=False):
+        self.docs.setdefault(query["_id"], {"_id": query["_id"]}).update(update["$set"])
+
+
+class NoLimit:
+    def acquire(self, tokens=0):
+        pass
+
+    def pause(self, seconds):
+        pass
+
+
+class ScriptedJob(BackfillJob):
+    """Skips Gemini: returns a new caption unless the document id is in `failing`."""
+
+    def __init__(self, db, failing=()):
+        super().__init__(db, "test-job", {}, NoLimit(), concurrency=2, batch_size=2)
+        self.failing = set(failing)
+        self.attempted = []
+
+    def recaption(self, doc):
+        self.attempted.append(doc["_id"])
+        return None if doc["_id"] in self.failing else f"new {doc['_id']}"
+
+
+@pytest.fixture
+def db():
+    docs = [{"_id": i, "caption": f"old {i}", "image_url": "data:image/jpeg;base64,"} for i in range(1, 7)]
+    return SimpleNamespace(captions=FakeCaptions(docs), backfill_checkpoints=FakeCheckpoints())
+
+
+def test_failed_documents_are_recorded_in_checkpoint(db):
+    stats = ScriptedJob(db, failing={2, 5}).run()
+
+    checkpoint = db.backfill_checkpoints.docs["test-job"]
+    assert checkpoint["last_id"] == 6
+    assert checkpoint["failed_ids"] == [2, 5]
+    assert stats["processed"] == 6
+    assert stats["failed"] == 2
+    assert stats["updated"] == 4
+
+
+def test_resumed_job_retries_failures_without_double_counting(db):
+    ScriptedJob(db, failing={2, 5}).run()
+    db.captions.docs[7] = {"_id": 7, "caption": "old 7", "image_url": "data:image/jpeg;base64,"}
+
+    second = ScriptedJob(db, failing={5})
+    stats = second.run()
+
+    # Earlier failures first, then only documents after the checkpoint
+    assert second.attempted == [2, 5, 7]
+    checkpoint = db.backfill_checkpoints.docs["test-job"]
+    assert checkpoint["last_id"] == 7
+    assert checkpoint["failed_ids"] == [5]
+    assert stats["processed"] == 7
+    assert stats["failed"] == 1
+    assert db.captions.docs[2]["caption"] == "new 2"
+    assert db.captions.docs[5]["caption"] == "old 5"
+
+
+def test_retry_does_not_move_checkpoint_backwards(db):
+    ScriptedJob(db, failing={2}).run()
+    job = ScriptedJob(db)
+    job.run()
+    assert db.backfill_checkpoints.docs["test-job"]["last_id"] == 6
+    assert db.backfill_checkpoints.docs["test-job"]["failed_ids"] == []
+
+
+def test_deleted_failures_are_dropped_instead_of_failing_forever(db):
+    ScriptedJob(db, failing={2, 5}).run()
+    del db.captions.docs[5]
+
+    stats = ScriptedJob(db).run()
+
+    assert db.backfill_checkpoints.docs["test-job"]["failed_ids"] == []
+    assert stats["failed"] == 0
@@ -0,0 +1,147 @@
+"""
+Unit tests for the request parsing shared by the sync and async caption blueprints.
+"""
+import csv
+import gzip
+import io
+import json
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+
+from routes.caption_common import (
+    CAPTIONS_PAGE_SIZE,
+    EXPORT_BATCH_SIZE,
+    EXPORT_IMAGE_BATCH_SIZE,
+    ExportEncoder,
+    RequestError,
+    bulk_timestamp,
+    bulk_verify_query,
+    finish_bulk,
+    finish_captions_page,
+    parse_export_request,
+    unapplied_operations,
+    user_captions_query,
+)
+
+
+def test_date_only_until_includes_the_whole_day():
+    export = parse_export_request("alice", {"since": "2026-01-01", "until": "2026-01-31"})
+    assert export["query"]["createdAt"] == {"$gte": datetime(2026, 1, 1), "$lt": datetime(2026, 2, 1)}
+
+
+def test_until_with_time_is_used_as_is():
+    export = parse_export_request("alice", {"until": "2026-01-31T12:00:00"})
+    assert export["query"]["createdAt"] == {"$lt": datetime(2026, 1, 31, 12)}
+
+
+def test_invalid_export_parameters_are_rejected():
+    with pytest.raises(RequestError):
+        parse_export_request("alice", {"format": "xml"})
+    with pytest.raises(RequestError):
+        parse_export_request("alice", {"fields": "caption,password"})
+    with pytest.raises(RequestError):
+        parse_export_request("alice", {"since": "last week"})
+
+
+def _op_items(*ops):
+    items = []
+    for op in ops:
+        oid = ObjectId()
+        items.append(({"op": op, "id": str(oid), "oid": oid, "text": "new"}, {"op": op, "id": str(oid)}))
+    return items
+
+
+def test_bulk_skips_verification_when_counts_match():
+    op_items = _op_items("delete", "update")
+    assert bulk_verify_query(op_items, {}, {"deleted": 1, "matched": 1, "modified": 1}) is None
+
+
+def test_bulk_reports_update_of_concurrently_deleted_caption_as_not_found():
+    now = bulk_timestamp()
+    op_items = _op_items("update", "update")
+    counts = {"deleted": 0, "matched": 1, "modified": 1}
+    assert bulk_verify_query(op_items, {}, counts) is not None
+
+    applied = op_items[1][0]["oid"]
+    unapplied = unapplied_operations(op_items, {}, counts, [{"_id": applied, "updatedAt": now}], now)
+    changes = finish_bulk(op_items, {}, now, unapplied)
+
+    assert [result["status"] for _, result in op_items] == ["not_found", "updated"]
+    assert changes["deleted"] == [op_items[0][0]["id"]]
+    assert [u["_id"] for u in changes["updated"]] == [op_items[1][0]["id"]]
+
+
+def test_bulk_reports_concurrently_edited_caption_as_conflict():
+    now = bulk_timestamp()
+    op_items = _op_items("update")
+    edited = {"_id": op_items[0][0]["oid"], "updatedAt": datetime(2026, 1, 1)}
+    unapplied = unapplied_operations(op_items, {}, {"deleted": 0, "matched": 0, "modified": 0}, [edited], now)
+    changes = finish_bulk(op_items, {}, now, unapplied)
+
+    assert op_items[0][1]["status"] == "conflict"
+    assert changes == {"deleted": [], "updated": []}
+
+
+def test_bulk_marks_unattributable_deletes_ambiguous():
+    now = bulk_timestamp()
+    op_items = _op_items("delete", "delete")
+    unapplied = unapplied_operations(op_items, {}, {"deleted": 1, "matched": 0, "modified": 0}, [], now)
+    assert unapplied == {0: "ambiguous", 1: "ambiguous"}
+
+
+def test_captions_page_defaults_and_limits():
+    query = user_captions_query("alice", {})
+    assert query["filter"] == {"user_id": "alice"}
+    assert query["limit"] == CAPTIONS_PAGE_SIZE + 1
+    assert user_captions_query("alice", {"platform": "Instagram"})["filter"]["platform"] == "instagram"
+    assert "platform" not in user_captions_query("alice", {"platform": "all"})["filter"]
+    for bad in ({"limit": "0"}, {"limit": "1000"}, {"limit": "ten"}, {"before": "garbage"}):
+        with pytest.raises(RequestError):
+            user_captions_query("alice", bad)
+
+
+def test_captions_page_cursor_round_trip():
+    created = datetime(2026, 10, 1, 12)
+    docs = [{"_id": ObjectId(), "createdAt": created} for _ in range(3)]
+    query = user_captions_query("alice", {"limit": "2"})
+
+    page, next_before = finish_captions_page(list(docs), query)
+    assert page == docs[:2]
+    follow = user_captions_query("alice", {"limit": "2", "before": next_before})["filter"]["$or"]
+    assert follow == [{"createdAt": {"$lt": created}}, {"createdAt": created, "_id": {"$lt": docs[1]["_id"]}}]
+
+    assert finish_captions_page(docs[:2], query) == (docs[:2], None)
+
+
+def _encode(encoder, docs):
+    chunks = [encoder.add(doc) for doc in docs]
+    chunks.append(encoder.finish())
+    return [chunk for chunk in chunks if chunk]
+
+
+def test_ndjson_export_encodes_object_ids_and_dates():
+    caption_id = ObjectId()
+    encoder = ExportEncoder(["_id", "caption", "createdAt", "editedAt"], "ndjson")
+    body = b"".join(_encode(encoder, [{"_id": caption_id, "caption": "héllo", "createdAt": datetime(2026, 1, 31, 12)}]))
+    assert json.loads(body) == {"_id": str(caption_id), "caption": "héllo", "createdAt": "2026-01-31T12:00:00", "editedAt": None}
+
+
+def test_csv_export_quotes_commas_quotes_and_newlines():
+    encoder = ExportEncoder(["caption", "platform"], "csv")
+    tricky = 'Sunset, "golden" hour\nsecond line'
+    body = b"".join(_encode(encoder, [{"caption": tricky, "platform": None}])).decode("utf-8")
+    assert list(csv.reader(io.StringIO(body))) == [["caption", "platform"], [tricky, ""]]
+
+
+def test_gzip_export_is_one_valid_stream_across_batches():
+    encoder = ExportEncoder(["caption"], "ndjson", compress=True, batch_size=2)
+    chunks = _encode(encoder, [{"caption": f"caption {i}"} for i in range(5)])
+    lines = gzip.decompress(b"".join(chunks)).decode("utf-8").splitlines()
+    assert [json.loads(line)["caption"] for line in lines] == [f"caption {i}" for i in range(5)]
+
+
+def test_exporting_images_uses_small_batches():
+    assert parse_export_request("alice", {})["batch_size"] == EXPORT_BATCH_SIZE
+    assert parse_export_request("alice", {"fields": "caption,image_url"})["batch_size"] == EXPORT_IMAGE_BATCH_SIZE
@@ -0,0 +1,65 @@
+"""
+Unit tests for the per-mode caption metrics and the Gemini payload size.
+"""
+from ai_core.caption_metrics import CaptionMetrics
+from ai_core.gemini_caption import build_gemini_prompt, gemini_payload_bytes
+from ai_core.gemini_router import PROBE
+from routes.caption_common import CaptionGeneration
+
+
+def test_failures_count_as_errors_and_latency_samples():
+    metrics = CaptionMetrics()
+    metrics.record("blip", 100.0)
+    metrics.record("blip", 300.0, error=True)
+
+    blip = metrics.snapshot()["blip"]
+    assert blip["count"] == 2
+    assert blip["errors"] == 1
+    assert blip["avg_latency_ms"] == 200.0
+
+
+def test_payload_bytes_match_the_prompt_sent():
+    prompt = build_gemini_prompt("casual", "short", "instagram", include_hashtags=True)
+    image = b"\xff" * 1234
+    assert gemini_payload_bytes(prompt, image) == len(prompt.encode("utf-8")) + 1234
+    assert gemini_payload_bytes(prompt) == len(prompt.encode("utf-8"))
+
+
+class StubRouter:
+    state = "open"
+
+    def __init__(self, admission):
+        self.admission = admission
+        self.recorded = []
+
+    def allow_request(self):
+        return self.admission
+
+    def record(self, success, latency_ms, admission):
+        self.recorded.append((success, admission))
+
+
+def _generation(metrics, router):
+    options = {"ai_model_choice": "gemini", "platform": "instagram", "tone": "casual", "length": "short",
+               "include_hashtags": False, "user_id": None}
+    return CaptionGeneration(options, b"\xff" * 10, metrics, router)
+
+
+def test_short_circuited_fallback_is_not_a_gemini_error():
+    metrics = CaptionMetrics()
+    generation = _generation(metrics, StubRouter(None))
+    assert generation.gemini_prompt() is None
+    generation.used_model = "blip_fallback"
+    generation.finish("a dog on a beach")
+
+    generation = _generation(metrics, StubRouter(PROBE))
+    assert generation.gemini_prompt()
+    generation.gemini_done("")
+    generation.used_model = "blip_fallback"
+    generation.finish("a dog on a beach")
+
+    gemini = metrics.snapshot()["gemini"]
+    assert gemini["count"] == 2
+    assert gemini["short_circuited"] == 1
+    assert gemini["errors"] == 1
+    assert generation.router.recorded == [(False, PROBE)]
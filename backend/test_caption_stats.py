@@ -0,0 +1,164 @@
+"""
+Unit tests for the dashboard counter increments and rebuild pipelines.
+"""
+from datetime import datetime
+
+from bson import ObjectId
+
+from routes import caption_stats
+from routes.caption_common import caption_edit_query, edit_stats, ensure_caption_indexes, plan_bulk_operations
+from routes.caption_stats import (
+    bulk_increments,
+    bulk_longest,
+    caption_increments,
+    format_stats,
+    rebuild_pipelines,
+    removal_increments,
+    stats_update,
+)
+
+CREATED = datetime(2026, 10, 1, 12, 30)
+
+
+def _caption(**extra):
+    doc = {"_id": ObjectId(), "user_id": "alice", "platform": "Instagram", "model_used": "gemini",
+           "tone": "casual", "length": "short", "createdAt": CREATED}
+    doc.update(extra)
+    return doc
+
+
+def _bulk_item(op, doc):
+    return {"op": op, "oid": doc["_id"], "id": str(doc["_id"])}, {"id": str(doc["_id"])}
+
+
+def test_insert_counts_every_dimension():
+    inc = caption_increments(_caption())
+    assert inc == {
+        "total": 1,
+        "by_platform.instagram": 1,
+        "by_model.gemini": 1,
+        "by_tone.casual": 1,
+        "by_length.short": 1,
+        "daily.2026-10-01": 1,
+    }
+
+
+def test_keys_from_user_input_are_valid_field_names():
+    inc = caption_increments(_caption(platform="my.site$", tone=None))
+    assert inc["by_platform.my_site_"] == 1
+    assert inc["by_tone.unknown"] == 1
+
+
+def test_removing_an_edited_caption_counts_edited_down():
+    assert removal_increments([_caption(editedAt=CREATED)])["edited"] == -1
+    # updatedAt alone (e.g. set by a backfill job) is not a user edit
+    assert removal_increments([_caption(updatedAt=CREATED)])["edited"] == 0
+
+
+def test_edit_counts_only_the_first_edit():
+    assert edit_stats({"user_id": "alice"})["edited"] == 1
+    assert edit_stats({"user_id": "alice", "editedAt": CREATED})["edited"] == 0
+    assert edit_stats({"user_id": "alice", "updatedAt": CREATED})["edited"] == 1
+
+
+def test_edits_set_edited_at():
+    query = caption_edit_query("alice", str(ObjectId()), "new text")
+    assert "editedAt" in query["update"]["$set"]
+    assert query["projection"] == {"user_id": 1, "editedAt": 1}
+
+    doc = _caption()
+    item = {"op": "update", "oid": doc["_id"], "id": str(doc["_id"]), "text": "new"}
+    operations, _ = plan_bulk_operations("alice", [item], [{"id": item["id"]}], {doc["_id"]}, CREATED)
+    assert operations[0]._doc["$set"]["editedAt"] == CREATED
+
+
+def test_bulk_increments_skip_failed_and_unapplied_operations():
+    deleted, failed, unapplied, edited, reedited = (_caption() for _ in range(5))
+    reedited["editedAt"] = CREATED
+    op_items = [_bulk_item("delete", deleted), _bulk_item("delete", failed), _bulk_item("delete", unapplied),
+                _bulk_item("update", edited), _bulk_item("update", reedited)]
+    owned = {doc["_id"]: doc for doc in (deleted, failed, unapplied, edited, reedited)}
+
+    inc = bulk_increments(op_items, failed={1: "error"}, owned=owned, unapplied={2: "ambiguous"})
+    assert inc["total"] == -1
+    assert inc["by_platform.instagram"] == -1
+    assert inc["edited"] == 1
+
+
+def test_stats_update_drops_zero_increments():
+    assert stats_update("alice", caption_increments(_caption()) + caption_increments(_caption(), -1)) is None
+    assert stats_update(None, caption_increments(_caption())) is None
+    query, update = stats_update("alice", caption_increments(_caption()))
+    assert query == {"_id": "alice"}
+    assert update["$inc"]["total"] == 1
+
+
+def test_longest_caption_is_raised_with_max():
+    _, update = stats_update("alice", caption_increments(_caption()), longest=42)
+    assert update["$max"] == {"longest": 42}
+    # A repeat edit changes no counter but can still make the caption longer
+    _, update = stats_update("alice", edit_stats({"editedAt": CREATED}), longest=80)
+    assert "$inc" not in update and update["$max"] == {"longest": 80}
+    assert stats_update("alice", edit_stats({"editedAt": CREATED})) is None
+
+
+def test_bulk_longest_counts_only_applied_edits():
+    op_items = [
+        ({"op": "update", "text": "x" * 10}, {}),
+        ({"op": "update", "text": "x" * 50}, {}),
+        ({"op": "delete"}, {}),
+        ({"op": "update", "text": "x" * 90}, {}),
+    ]
+    assert bulk_longest(op_items, failed={1: "error"}, unapplied={3: "conflict"}) == 10
+    assert bulk_longest(op_items[2:3], failed={}) == 0
+
+
+def test_format_stats_hides_counts_that_fell_to_zero():
+    stats = format_stats("alice", {
+        "total": 2, "edited": 1, "by_platform": {"instagram": 2, "twitter": 0},
+        "daily": {"2026-10-02": 1, "2026-10-01": 1, "2026-09-30": 0},
+    })
+    assert stats["by_platform"] == {"instagram": 2}
+    assert stats["daily"] == [{"date": "2026-10-01", "count": 1}, {"date": "2026-10-02", "count": 1}]
+    assert format_stats("bob", None)["total"] == 0
+    assert format_stats("bob", None)["longest"] == 0
+
+
+def test_rebuild_counts_edited_by_edited_at():
+    pipelines = rebuild_pipelines("alice")
+    assert pipelines["edited"][0]["$match"] == {"user_id": "alice", "editedAt": {"$exists": True}}
+    assert set(pipelines) == {"total", "edited", "longest", "daily", "by_platform", "by_model", "by_tone", "by_length"}
+    assert pipelines["longest"][1]["$group"]["n"] == {"$max": {"$strLenCP": {"$ifNull": ["$caption", ""]}}}
+
+
+def test_history_index_matches_the_history_sort():
+    class Captions:
+        def __init__(self):
+            self.indexes = {"_id_": {}, "user_createdAt": {}}
+
+        def create_index(self, keys, name):
+            self.indexes[name] = keys
+
+        def index_information(self):
+            return self.indexes
+
+        def drop_index(self, name):
+            del self.indexes[name]
+
+    class Db:
+        captions = Captions()
+
+    ensure_caption_indexes(Db())
+    assert Db.captions.indexes == {"_id_": {}, "user_createdAt_id": [("user_id", 1), ("createdAt", -1), ("_id", -1)]}
+
+
+def test_failed_stats_write_is_logged_not_raised(capsys):
+    class BrokenCollection:
+        def update_one(self, *args, **kwargs):
+            raise RuntimeError("connection reset")
+
+    class Db:
+        caption_stats = BrokenCollection()
+
+    caption_stats.apply_stats(Db(), "alice", caption_increments(_caption()))
+    assert "Failed to update caption stats for user alice" in capsys.readouterr().out
@@ -0,0 +1,103 @@
+"""
+Unit tests for the per-worker CPU configuration: worker slot claiming and thread-count settings.
+"""
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from ai_core import cpu_tuning
+
+torch = pytest.importorskip("torch")
+
+
+@pytest.fixture
+def slots(monkeypatch, tmp_path):
+    monkeypatch.setenv("WORKER_SLOT_DIR", str(tmp_path))
+    monkeypatch.setenv("PORT", "5999")
+    held = []
+    monkeypatch.setattr(cpu_tuning, "_worker_slot", None)
+
+    def claim(workers):
+        index = cpu_tuning.claim_worker_index(workers)
+        held.append(cpu_tuning._worker_slot)
+        return index
+
+    yield claim
+    for slot in held:
+        if slot is not None:
+            slot.close()
+
+
+def test_each_claim_takes_the_next_free_slot(slots):
+    assert [slots(3), slots(3), slots(3)] == [0, 1, 2]
+
+
+def test_a_released_slot_is_reused(slots):
+    assert slots(2) == 0
+    assert slots(2) == 1
+    # Closing the lock file is what happens when a worker process exits
+    cpu_tuning._worker_slot.close()
+    assert slots(2) == 1
+
+
+def test_slot_of_an_exited_process_is_reused(slots):
+    claim = "from ai_core import cpu_tuning; print(cpu_tuning.claim_worker_index(2))"
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(cpu_tuning.__file__)))
+    result = subprocess.run([sys.executable, "-c", claim], capture_output=True, text=True, check=True, cwd=backend_dir)
+    assert result.stdout.strip() == "0"
+    assert slots(2) == 0
+
+
+def test_all_slots_taken_falls_back_to_the_pid(slots):
+    slots(2)
+    slots(2)
+    assert slots(2) == os.getpid() % 2
+
+
+@pytest.fixture
+def fake_torch(monkeypatch, tmp_path):
+    """Records thread settings instead of touching torch's process-wide pools."""
+    state = {"threads": None, "interop": None}
+    monkeypatch.setattr(torch, "set_num_threads", lambda n: state.update(threads=n))
+    monkeypatch.setattr(torch, "set_num_interop_threads", lambda n: state.update(interop=n))
+    monkeypatch.setattr(torch, "get_num_threads", lambda: state["threads"])
+    monkeypatch.setattr(torch, "get_num_interop_threads", lambda: state["interop"])
+    monkeypatch.setattr(cpu_tuning, "physical_core_groups", lambda: [[c] for c in range(8)])
+    for name in ("CAPTION_WORKERS", "WORKER_INDEX", "TORCH_INTRA_OP_THREADS", "TORCH_INTER_OP_THREADS", "BLIP_PIN_CPUS"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv("BLIP_TUNING_FILE", str(tmp_path / "missing.json"))
+    return state
+
+
+def test_default_splits_cores_between_workers(fake_torch, monkeypatch):
+    monkeypatch.setenv("CAPTION_WORKERS", "4")
+    config = cpu_tuning.apply_cpu_config()
+    assert config["workers"] == 4
+    assert config["intra_op_threads"] == 2
+    assert config["inter_op_threads"] == 1
+    assert config["pinned_cpus"] is None
+
+
+def test_environment_wins_over_tuning_file_and_arguments_win_over_environment(fake_torch, monkeypatch, tmp_path):
+    tuning = tmp_path / "tuning.json"
+    tuning.write_text(json.dumps({"throughput": {"workers": 2, "intra_op_threads": 3, "inter_op_threads": 2}}))
+    monkeypatch.setenv("BLIP_TUNING_FILE", str(tuning))
+    assert cpu_tuning.apply_cpu_config()["intra_op_threads"] == 3
+
+    monkeypatch.setenv("TORCH_INTRA_OP_THREADS", "5")
+    monkeypatch.setenv("TORCH_INTER_OP_THREADS", "1")
+    config = cpu_tuning.apply_cpu_config()
+    assert (config["intra_op_threads"], config["inter_op_threads"]) == (5, 1)
+
+    assert cpu_tuning.apply_cpu_config(intra_op_threads=1)["intra_op_threads"] == 1
+
+
+def test_pinned_workers_get_disjoint_cores(fake_torch, monkeypatch):
+    pinned = []
+    monkeypatch.setattr(os, "sched_setaffinity", lambda pid, cpus: pinned.append(list(cpus)), raising=False)
+    cpu_tuning.apply_cpu_config(worker_index=0, workers=2, pin=True)
+    cpu_tuning.apply_cpu_config(worker_index=1, workers=2, pin=True)
+    assert pinned == [[0, 1, 2, 3], [4, 5, 6, 7]]
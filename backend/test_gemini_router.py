@@ -0,0 +1,114 @@
+"""
+Unit tests for the Gemini circuit breaker and the lazily read Gemini timeout.
+"""
+import pytest
+
+from ai_core import gemini_router
+from ai_core.gemini_caption import gemini_timeout_seconds
+from ai_core.gemini_router import CLOSED, HALF_OPEN, OPEN, PROBE, REQUEST, GeminiRouter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(gemini_router.time, "monotonic", fake.monotonic)
+    return fake
+
+
+def _router(**kwargs):
+    options = {"latency_threshold_ms": 1000, "error_threshold": 0.5, "alpha": 0.5, "min_requests": 3, "open_seconds": 30}
+    options.update(kwargs)
+    return GeminiRouter(**options)
+
+
+def test_stays_closed_until_min_requests(clock):
+    router = _router()
+    router.record(False, 100)
+    router.record(False, 100)
+    assert router.state == CLOSED
+    router.record(False, 100)
+    assert router.state == OPEN
+    assert router.allow_request() is None
+    assert router.short_circuited == 1
+
+
+def test_trips_on_latency(clock):
+    router = _router()
+    for _ in range(3):
+        router.record(True, 5000)
+    assert router.state == OPEN
+    assert "latency" in router.last_trip_reason
+
+
+def test_half_open_probe_closes_or_reopens(clock):
+    router = _router()
+    for _ in range(3):
+        router.record(False, 100)
+    clock.now += 30
+    assert router.allow_request() == PROBE
+    assert router.state == HALF_OPEN
+    assert router.allow_request() is None  # only one probe at a time
+    router.record(False, 100, PROBE)
+    assert router.state == OPEN
+
+    clock.now += 30
+    assert router.allow_request() == PROBE
+    router.record(True, 100, PROBE)
+    assert router.state == CLOSED
+
+
+def test_min_requests_counts_only_the_current_window(clock):
+    router = _router()
+    for _ in range(3):
+        router.record(False, 100)
+    clock.now += 30
+    router.record(True, 100, router.allow_request())
+    assert router.state == CLOSED
+
+    # Lifetime requests are well past min_requests, but one slow call after recovery must not re-trip
+    router.record(True, 5000)
+    assert router.state == CLOSED
+    assert router.snapshot()["window_requests"] == 2
+
+
+def test_stuck_probe_is_released(clock):
+    router = _router()
+    for _ in range(3):
+        router.record(False, 100)
+    clock.now += 30
+    assert router.allow_request() == PROBE
+    clock.now += 30
+    assert router.allow_request() == PROBE
+
+
+def test_request_admitted_while_closed_is_not_taken_for_the_probe(clock):
+    router = _router()
+    slow = router.allow_request()
+    assert slow == REQUEST
+    for _ in range(3):
+        router.record(False, 100)
+    clock.now += 30
+    probe = router.allow_request()
+    assert probe == PROBE
+
+    # The request that started before the trip finishes first; only the probe decides
+    router.record(True, 100, slow)
+    assert router.state == HALF_OPEN
+    assert router.allow_request() is None
+    router.record(False, 100, probe)
+    assert router.state == OPEN
+
+
+def test_gemini_timeout_read_at_call_time(monkeypatch):
+    monkeypatch.delenv("GEMINI_TIMEOUT", raising=False)
+    assert gemini_timeout_seconds() == 30
+    monkeypatch.setenv("GEMINI_TIMEOUT", "7.5")
+    assert gemini_timeout_seconds() == 7.5
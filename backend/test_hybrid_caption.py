@@ -0,0 +1,134 @@
+"""
+Unit tests for the hybrid BLIP draft -> Gemini text-only rewrite, with stubbed BLIP and Gemini.
+"""
+import asyncio
+import io
+import math
+from types import SimpleNamespace
+
+import pytest
+import torch
+from PIL import Image
+
+from ai_core import hybrid_caption
+from ai_core.hybrid_caption import generate_hybrid_caption, generate_hybrid_caption_async
+
+DRAFT = "a dog running on a beach"
+
+
+def _image_bytes() -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (8, 8)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class StubInputs(dict):
+    def to(self, device):
+        return self
+
+
+class StubProcessor:
+    def __call__(self, image, text=None, return_tensors=None):
+        return StubInputs(pixel_values=torch.zeros(1))
+
+    def decode(self, ids, skip_special_tokens=True):
+        return DRAFT
+
+
+class StubBlip:
+    """generate() returns one beam whose length-normalised log-probability gives `confidence`."""
+
+    def __init__(self, confidence: float):
+        self.score = math.log(confidence)
+
+    def generate(self, **kwargs):
+        assert kwargs["output_scores"] and kwargs["return_dict_in_generate"]
+        return SimpleNamespace(sequences=torch.tensor([[1, 2, 3]]), sequences_scores=torch.tensor([self.score]))
+
+
+class StubGemini:
+    def __init__(self, caption="Chasing waves 🐕", error=None):
+        self.caption = caption
+        self.error = error
+        self.calls = []
+
+    def __call__(self, draft, tone, length, platform, include_hashtags, image_data=None):
+        self.calls.append({"draft": draft, "image_data": image_data})
+        if self.error:
+            raise self.error
+        return self.caption, 320 if image_data is None else 320 + len(image_data)
+
+
+@pytest.fixture
+def gemini(monkeypatch):
+    stub = StubGemini()
+    monkeypatch.setattr(hybrid_caption, "generate_refined_caption", stub)
+    monkeypatch.delenv("HYBRID_CONFIDENCE_THRESHOLD", raising=False)
+    return stub
+
+
+def _caption(confidence, **kwargs):
+    return generate_hybrid_caption(_image_bytes(), StubBlip(confidence), StubProcessor(), "cpu",
+                                   "casual", "short", "instagram", **kwargs)
+
+
+def test_confident_draft_is_rewritten_text_only(gemini):
+    caption, info = _caption(0.9)
+    assert caption == "Chasing waves 🐕"
+    assert info["confidence"] == pytest.approx(0.9)
+    assert info["refined"] and not info["image_sent"]
+    assert gemini.calls == [{"draft": DRAFT, "image_data": None}]
+    assert info["payload_bytes"] == 320
+
+
+def test_unsure_draft_attaches_the_image(gemini):
+    image = _image_bytes()
+    caption, info = generate_hybrid_caption(image, StubBlip(0.3), StubProcessor(), "cpu", "casual", "short", "instagram")
+    assert info["image_sent"]
+    assert gemini.calls[0]["image_data"] == image
+    assert info["payload_bytes"] > 320
+
+
+def test_threshold_decides_whether_the_image_is_sent(gemini, monkeypatch):
+    assert not _caption(0.41)[1]["image_sent"]
+    assert _caption(0.39)[1]["image_sent"]
+    assert _caption(0.5, confidence_threshold=0.6)[1]["image_sent"]
+    monkeypatch.setenv("HYBRID_CONFIDENCE_THRESHOLD", "0.2")
+    assert not _caption(0.3)[1]["image_sent"]
+
+
+def test_failed_rewrite_returns_the_draft(gemini):
+    gemini.error = RuntimeError("503 from Gemini")
+    caption, info = _caption(0.9)
+    assert caption == DRAFT
+    assert not info["refined"]
+    assert "503" in info["error"]
+    assert info["refine_latency_ms"] is not None
+
+
+def test_empty_rewrite_returns_the_draft(gemini):
+    gemini.caption = ""
+    caption, info = _caption(0.9)
+    assert caption == DRAFT
+    assert not info["refined"]
+
+
+def test_open_circuit_skips_gemini(gemini):
+    caption, info = _caption(0.9, allow_refine=lambda: False)
+    assert caption == DRAFT
+    assert info["skipped"]
+    assert gemini.calls == []
+
+
+def test_async_rewrite_matches_the_sync_path(monkeypatch):
+    calls = []
+
+    async def refine(draft, tone, length, platform, include_hashtags, image_data=None):
+        calls.append(image_data)
+        return "Async caption", 300
+
+    monkeypatch.setattr(hybrid_caption, "generate_refined_caption_async", refine)
+    caption, info = asyncio.run(generate_hybrid_caption_async(
+        _image_bytes(), StubBlip(0.2), StubProcessor(), "cpu", "casual", "short", "instagram"))
+    assert caption == "Async caption"
+    assert info["image_sent"] and calls[0] is not None
@@ -0,0 +1,208 @@
+"""
+Unit tests for the BLIP model registry: budget eviction, pinning, swaps and the swap marker.
+"""
+import gc
+import json
+import os
+import weakref
+
+import pytest
+
+from ai_core import blip_model, model_store
+from ai_core.model_registry import ModelRegistry, PinnedModelError, UnknownModelError
+
+MB = 1024 * 1024
+MODELS = {"base": "test/base", "large": "test/large", "huge": "test/huge"}
+SIZES_MB = {"test/base": 100, "test/large": 300, "test/huge": 500}
+
+
+class FakeTensor:
+    def __init__(self, size_mb):
+        self.size_mb = size_mb
+
+    def numel(self):
+        return self.size_mb * MB
+
+    def element_size(self):
+        return 1
+
+
+class FakeModel:
+    def __init__(self, size_mb):
+        self.size_mb = size_mb
+
+    def parameters(self):
+        return [FakeTensor(self.size_mb)]
+
+    def buffers(self):
+        return []
+
+
+class FakeLoader:
+    """Stands in for load_blip_model and records what was in memory when each load started."""
+
+    def __init__(self, monkeypatch):
+        self.monkeypatch = monkeypatch
+        self.calls = []
+        self.registry = None
+
+    def __call__(self, model_name, store_dir, version):
+        loaded = sorted(self.registry.loaded) if self.registry else []
+        self.calls.append((model_name, version, loaded))
+        self.monkeypatch.setattr(blip_model, "LOAD_STATS", {"version": version or "hub"})
+        return FakeModel(SIZES_MB[model_name]), "processor", "cpu"
+
+
+def _store_version(store_dir, model_name, version, size_mb):
+    path = os.path.join(store_dir, model_store._model_slug(model_name), version)
+    os.makedirs(path)
+    with open(os.path.join(path, model_store.MANIFEST_FILE), "w") as f:
+        json.dump({"files": {"model.safetensors": {"size": size_mb * MB}, "config.json": {"size": 10}}}, f)
+
+
+@pytest.fixture
+def loader(monkeypatch):
+    return FakeLoader(monkeypatch)
+
+
+def _registry(loader, tmp_path, budget=0):
+    registry = ModelRegistry(models=MODELS, tiers={"fast": "base"}, default="base",
+                             memory_budget_mb=budget, store_dir=str(tmp_path), loader=loader)
+    loader.registry = registry
+    return registry
+
+
+def test_evicts_before_loading_using_the_estimated_size(loader, tmp_path):
+    _store_version(str(tmp_path), "test/huge", "v1", 500)
+    registry = _registry(loader, tmp_path, budget=650)
+    registry.load("base")
+    registry.load("large")
+
+    registry.load("huge")
+    # 100 (pinned base) + 300 + 500 > 650: large is gone before huge starts loading
+    assert loader.calls[-1] == ("test/huge", None, ["base"])
+    assert list(registry.loaded) == ["base", "huge"]
+    assert registry.evictions == 1
+
+
+def test_size_estimate_falls_back_to_the_measured_size(loader, tmp_path):
+    registry = _registry(loader, tmp_path)
+    assert registry.estimate_mb("large") == 0
+    registry.load("large")
+    assert registry.estimate_mb("large") == 300
+
+
+def test_size_estimate_reads_the_store_manifest(loader, tmp_path):
+    _store_version(str(tmp_path), "test/large", "v1", 300)
+    registry = _registry(loader, tmp_path)
+    assert registry.estimate_mb("large") == 300
+    assert registry.estimate_mb("large", version="v1") == 300
+
+
+def test_default_model_is_never_evicted(loader, tmp_path):
+    registry = _registry(loader, tmp_path, budget=350)
+    registry.load("base")
+    registry.load("large")
+    registry.load("huge")
+    assert "base" in registry.loaded
+    assert registry.is_ready()
+
+
+def test_default_model_cannot_be_unloaded(loader, tmp_path):
+    registry = _registry(loader, tmp_path)
+    registry.load("fast")
+    with pytest.raises(PinnedModelError):
+        registry.unload("base")
+    assert registry.is_ready()
+
+
+def test_swap_to_unknown_version_raises_and_keeps_serving(loader, tmp_path):
+    registry = _registry(loader, tmp_path)
+    registry.load("base")
+    with pytest.raises(UnknownModelError):
+        registry.swap("base", version="v9")
+    assert registry.loaded["base"].version == "hub"
+    assert len(loader.calls) == 1
+
+
+def test_swap_keeps_old_handle_for_running_requests(loader, tmp_path):
+    _store_version(str(tmp_path), "test/base", "v2", 100)
+    registry = _registry(loader, tmp_path)
+    old = registry.acquire("base")
+
+    new = registry.swap("base", version="v2")
+    assert registry.acquire("base") is new
+    assert old.retired and old in registry.retired
+
+    old.release()
+    assert old not in registry.retired
+
+
+def test_swaps_are_followed_by_other_workers(loader, tmp_path):
+    _store_version(str(tmp_path), "test/base", "v2", 100)
+    _store_version(str(tmp_path), "test/large", "v3", 300)
+    worker_a = _registry(loader, tmp_path)
+    worker_b = ModelRegistry(models=MODELS, default="base", store_dir=str(tmp_path), loader=loader)
+    worker_a.load("base")
+    worker_b.load("base")
+
+    worker_a.swap("base", version="v2")
+    worker_a.swap("large", version="v3")
+    with open(os.path.join(str(tmp_path), model_store.SWAPS_FILE)) as f:
+        assert json.load(f)["base"]["version"] == "v2"
+
+    # Loaded models switch on the next acquire, unloaded ones load the swapped version later
+    with worker_b.acquire("base") as handle:
+        assert handle.version == "v2"
+    assert "large" not in worker_b.loaded
+    assert worker_b.versions["large"] == "v3"
+    with worker_b.acquire("large") as handle:
+        assert handle.version == "v3"
+
+    loads = worker_b.loads
+    worker_b.acquire("base").release()
+    assert worker_b.loads == loads  # nothing new recorded, nothing reloaded
+
+
+def test_unknown_names_and_tiers_are_rejected(loader, tmp_path):
+    registry = _registry(loader, tmp_path)
+    assert registry.resolve("fast") == "base"
+    with pytest.raises(UnknownModelError):
+        registry.acquire("giant")
+
+
+def test_evicted_model_is_garbage_collected(tmp_path):
+    """Loaded last, so a module-level reference left by load_blip_model would keep it alive."""
+    transformers = pytest.importorskip("transformers")
+
+    # A tiny BLIP checkpoint, stored and loaded through the real model store and loader
+    checkpoint = tmp_path / "checkpoint"
+    checkpoint.mkdir()
+    vocab = checkpoint / "vocab.txt"
+    vocab.write_text("\n".join(["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", "a", "dog"]))
+    transformers.BlipProcessor(
+        transformers.BlipImageProcessor(size={"height": 32, "width": 32}),
+        transformers.BertTokenizerFast(str(vocab)),
+    ).save_pretrained(checkpoint)
+    config = transformers.BlipConfig(
+        vision_config={"hidden_size": 32, "intermediate_size": 64, "num_hidden_layers": 1,
+                       "num_attention_heads": 2, "image_size": 32, "patch_size": 16},
+        text_config={"vocab_size": 7, "hidden_size": 32, "intermediate_size": 64, "num_hidden_layers": 1,
+                     "num_attention_heads": 2, "encoder_hidden_size": 32, "max_position_embeddings": 64},
+    )
+    transformers.BlipForConditionalGeneration(config).save_pretrained(checkpoint, safe_serialization=True)
+    store = str(tmp_path / "store")
+    for model_name in ("test/base", "test/large"):
+        model_store.fetch_model(model_name, store_dir=store, version="v1", source=str(checkpoint))
+
+    registry = ModelRegistry(models={"base": "test/base", "large": "test/large"}, tiers={}, default="base",
+                             memory_budget_mb=0, store_dir=store)
+    registry.load("base")
+    registry.load("large")
+    large = weakref.ref(registry.loaded["large"].model)
+
+    # Admin unload and budget eviction both retire the handle the same way
+    registry.unload("large")
+    gc.collect()
+    assert large() is None
+    assert registry.is_ready()
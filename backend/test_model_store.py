@@ -0,0 +1,47 @@
+"""
+Round-trip test for the memory-mapped safetensors loader, using a tiny BLIP config.
+"""
+import pytest
+
+torch = pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+
+from ai_core import model_store
+
+
+def _tiny_blip():
+    config = transformers.BlipConfig(
+        vision_config={"hidden_size": 32, "intermediate_size": 64, "num_hidden_layers": 1,
+                       "num_attention_heads": 2, "image_size": 32, "patch_size": 16},
+        text_config={"vocab_size": 99, "hidden_size": 32, "intermediate_size": 64, "num_hidden_layers": 1,
+                     "num_attention_heads": 2, "encoder_hidden_size": 32, "max_position_embeddings": 64},
+    )
+    torch.manual_seed(0)
+    return transformers.BlipForConditionalGeneration(config).eval()
+
+
+def test_mmap_load_matches_the_saved_model(tmp_path):
+    original = _tiny_blip()
+    original.save_pretrained(tmp_path, safe_serialization=True)
+
+    loaded = model_store.load_mmap_model(str(tmp_path), transformers.BlipForConditionalGeneration)
+
+    expected, actual = original.state_dict(), loaded.state_dict()
+    assert expected.keys() == actual.keys()
+    for name, tensor in expected.items():
+        assert torch.equal(tensor, actual[name]), name
+
+    # The output projection is tied to the word embeddings, not a separate copy
+    decoder = loaded.text_decoder
+    assert decoder.cls.predictions.decoder.weight.data_ptr() == decoder.bert.embeddings.word_embeddings.weight.data_ptr()
+
+    pixel_values, input_ids = torch.randn(1, 3, 32, 32), torch.tensor([[1, 5, 7]])
+    with torch.no_grad():
+        assert torch.equal(original(pixel_values=pixel_values, input_ids=input_ids).logits,
+                           loaded(pixel_values=pixel_values, input_ids=input_ids).logits)
+
+
+def test_missing_weights_are_reported(tmp_path):
+    _tiny_blip().config.save_pretrained(tmp_path)
+    with pytest.raises(FileNotFoundError):
+        model_store.load_mmap_model(str(tmp_path), transformers.BlipForConditionalGeneration)
@@ -0,0 +1,88 @@
+"""
+Unit tests for the token-bucket quota limiter used by the Gemini backfill job.
+"""
+import time
+
+import pytest
+
+from ai_core import rate_limiter
+from ai_core.rate_limiter import TokenBucket, QuotaLimiter
+
+
+class FakeClock:
+    """Stands in for time.monotonic/time.sleep so waits are instant and exact."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(rate_limiter.time, "monotonic", fake.monotonic)
+    monkeypatch.setattr(rate_limiter.time, "sleep", fake.sleep)
+    return fake
+
+
+def test_bucket_starts_full_and_then_waits_for_refill(clock):
+    bucket = TokenBucket(rate_per_minute=60)  # one token per second
+    for _ in range(60):
+        bucket.acquire()
+    assert clock.slept == []
+
+    bucket.acquire()
+    assert clock.slept == [pytest.approx(1.0)]
+
+
+def test_acquire_larger_than_capacity_is_capped(clock):
+    bucket = TokenBucket(rate_per_minute=60, capacity=10)
+    bucket.acquire(500)
+    assert clock.slept == []
+    assert bucket.tokens == 0
+
+
+def test_pause_holds_callers_until_deadline(clock):
+    bucket = TokenBucket(rate_per_minute=60)
+    bucket.pause(5)
+    bucket.acquire()
+    # 5 s of pause, then one second to refill a single token from the drained bucket
+    assert sum(clock.slept) == pytest.approx(6.0)
+
+
+def test_pause_never_shortens_an_existing_pause(clock):
+    bucket = TokenBucket(rate_per_minute=60)
+    bucket.pause(10)
+    bucket.pause(2)
+    assert bucket.paused_until == pytest.approx(clock.now + 10)
+
+
+def test_quota_limiter_charges_both_buckets(clock):
+    limiter = QuotaLimiter(rpm=60, tpm=600)
+    limiter.acquire(tokens=600)
+    assert limiter.requests.tokens == pytest.approx(59)
+    assert limiter.tokens.tokens == pytest.approx(0)
+
+    limiter.acquire(tokens=300)
+    # The token bucket refills at 10 tokens/s, so 300 tokens take 30 s
+    assert sum(clock.slept) == pytest.approx(30)
+
+
+def test_rejects_non_positive_rate():
+    with pytest.raises(ValueError):
+        TokenBucket(0)
+
+
+def test_real_clock_refill_smoke():
+    bucket = TokenBucket(rate_per_minute=6000, capacity=1)
+    bucket.acquire()
+    started = time.monotonic()
+    bucket.acquire()
+    assert time.monotonic() - started < 0.5
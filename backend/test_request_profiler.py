@@ -0,0 +1,114 @@
+"""
+Unit tests for arming the request profiler and capping its output directory.
+"""
+import asyncio
+import os
+import threading
+import time
+
+import pytest
+from flask import Flask, Response
+
+from request_profiler import RequestProfiler, _Sampler
+
+
+@pytest.mark.parametrize("interval_ms", [0, -5, 0.5])
+def test_arm_rejects_sub_millisecond_interval(tmp_path, interval_ms):
+    profiler = RequestProfiler(output_dir=str(tmp_path))
+    with pytest.raises(ValueError):
+        profiler.arm(count=1, interval_ms=interval_ms)
+    assert profiler.armed is False
+
+
+def test_arm_accepts_one_millisecond(tmp_path):
+    profiler = RequestProfiler(output_dir=str(tmp_path))
+    profiler.arm(count=1, interval_ms=1)
+    assert profiler.status()["interval_ms"] == 1
+
+
+def _write_profile(directory, name, size=10):
+    for ext in (".json", ".folded"):
+        with open(os.path.join(directory, name + ext), "wb") as f:
+            f.write(b"x" * size)
+
+
+def test_prune_keeps_newest_profiles(tmp_path):
+    profiler = RequestProfiler(output_dir=str(tmp_path), max_profiles=2)
+    for i in range(4):
+        _write_profile(tmp_path, f"20260101-00000{i}-abc{i}")
+    profiler._prune()
+    assert sorted(os.listdir(tmp_path)) == [
+        "20260101-000002-abc2.folded", "20260101-000002-abc2.json",
+        "20260101-000003-abc3.folded", "20260101-000003-abc3.json",
+    ]
+
+
+def test_prune_enforces_size_cap(tmp_path):
+    profiler = RequestProfiler(output_dir=str(tmp_path), max_profiles=100, max_mb=1)
+    _write_profile(tmp_path, "20260101-000000-old", size=400 * 1024)
+    _write_profile(tmp_path, "20260101-000001-new", size=400 * 1024)
+    profiler._prune()
+    assert sorted(os.listdir(tmp_path)) == ["20260101-000001-new.folded", "20260101-000001-new.json"]
+
+
+def test_streamed_response_is_profiled_until_the_body_is_sent(tmp_path):
+    app = Flask(__name__)
+    profiler = RequestProfiler(output_dir=str(tmp_path))
+    profiler.init_app(app)
+
+    @app.route("/export")
+    def export():
+        def body():
+            time.sleep(0.2)
+            yield "rows"
+        return Response(body())
+
+    profiler.arm(count=1, interval_ms=1)
+    response = app.test_client().get("/export")
+    assert len(profiler.recent) == 0
+    assert response.get_data() == b"rows"
+    response.close()
+    assert profiler.recent[0]["id"] == response.headers["X-Profile-Id"]
+    assert profiler.recent[0]["elapsed_ms"] >= 200
+
+
+def test_quart_streamed_response_is_profiled_until_the_body_is_sent(tmp_path):
+    quart = pytest.importorskip("quart")
+    app = quart.Quart(__name__)
+    profiler = RequestProfiler(output_dir=str(tmp_path))
+    profiler.init_async_app(app)
+
+    @app.route("/export")
+    async def export():
+        async def body():
+            await asyncio.sleep(0.2)
+            yield b"rows"
+        return quart.Response(body())
+
+    async def fetch():
+        response = await app.test_client().get("/export")
+        return await response.get_data()
+
+    profiler.arm(count=1, interval_ms=1)
+    assert asyncio.run(fetch()) == b"rows"
+    assert profiler.recent[0]["elapsed_ms"] >= 200
+
+
+def test_sampler_includes_executor_threads():
+    stop = threading.Event()
+
+    def caption_on_executor():
+        while not stop.is_set():
+            pass
+
+    worker = threading.Thread(target=caption_on_executor, name="blip_0")
+    worker.start()
+    sampler = _Sampler(threading.get_ident(), 0.001, ("blip",))
+    sampler.start()
+    time.sleep(0.1)
+    sampler.stop()
+    stop.set()
+    worker.join()
+
+    executor_stacks = [stack for stack in sampler.stacks if stack.startswith("thread:blip_0;")]
+    assert any("caption_on_executor" in stack for stack in executor_stacks)
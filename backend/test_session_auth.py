@@ -0,0 +1,121 @@
+"""
+Unit tests for signed session tokens, request authorization and the bounded bcrypt executor.
+"""
+import threading
+
+import pytest
+
+from routes import session_auth
+from routes.session_auth import (
+    AuthError,
+    BcryptBusy,
+    BcryptExecutor,
+    authorize_user,
+    check_session_config,
+    issue_token,
+    verify_token,
+)
+
+
+@pytest.fixture(autouse=True)
+def secret(monkeypatch):
+    monkeypatch.setenv("SESSION_SECRET", "test-secret")
+    monkeypatch.delenv("SESSION_AUTH_REQUIRED", raising=False)
+    monkeypatch.setattr(session_auth, "_secret", None)
+
+
+def _bearer(username):
+    return {"Authorization": f"Bearer {issue_token(username)['token']}"}
+
+
+def test_token_round_trip():
+    assert verify_token(issue_token("alice")["token"]) == "alice"
+
+
+def test_forged_and_expired_tokens_are_rejected(monkeypatch):
+    payload, _, signature = issue_token("alice")["token"].partition(".")
+    with pytest.raises(AuthError):
+        verify_token(f"{payload}.{signature[:-2]}xx")
+    with pytest.raises(AuthError):
+        verify_token("not-a-token")
+
+    token = issue_token("alice", ttl_seconds=10)["token"]
+    issued_at = session_auth.time.time()
+    monkeypatch.setattr(session_auth.time, "time", lambda: issued_at + 60)
+    with pytest.raises(AuthError, match="expired"):
+        verify_token(token)
+
+
+def test_token_user_wins_over_the_claimed_user():
+    assert authorize_user(_bearer("alice")) == "alice"
+    assert authorize_user(_bearer("alice"), "alice") == "alice"
+    with pytest.raises(AuthError) as e:
+        authorize_user(_bearer("alice"), "bob")
+    assert e.value.status == 403
+
+
+def test_token_less_requests(monkeypatch):
+    with pytest.raises(AuthError) as e:
+        authorize_user({}, "bob")
+    assert e.value.status == 401
+    assert authorize_user({}, None, allow_anonymous=True) is None
+
+    monkeypatch.setenv("SESSION_AUTH_REQUIRED", "false")
+    assert authorize_user({}, "bob") == "bob"
+
+
+def test_missing_secret_fails_when_auth_is_required(monkeypatch):
+    monkeypatch.delenv("SESSION_SECRET")
+    with pytest.raises(RuntimeError):
+        check_session_config()
+    with pytest.raises(RuntimeError):
+        issue_token("alice")
+
+    # During a rollout without required auth a per-process secret is still allowed
+    monkeypatch.setenv("SESSION_AUTH_REQUIRED", "false")
+    check_session_config()
+    assert verify_token(issue_token("alice")["token"]) == "alice"
+
+
+def test_bcrypt_slots_stay_below_the_server_threads():
+    assert BcryptExecutor(workers=2, max_queue=32, server_threads=16).slots == 8
+    assert BcryptExecutor(workers=2, max_queue=4, server_threads=16).slots == 6
+    assert BcryptExecutor(workers=4, max_queue=4, server_threads=1).slots == 1
+
+
+def test_full_bcrypt_executor_answers_busy_immediately():
+    executor = BcryptExecutor(workers=1, max_queue=0, timeout=5)
+    release = threading.Event()
+    started = threading.Event()
+
+    def blocked():
+        started.set()
+        release.wait(5)
+        return "done"
+
+    holder = threading.Thread(target=executor.run, args=(blocked,))
+    holder.start()
+    started.wait(5)
+    try:
+        with pytest.raises(BcryptBusy):
+            executor.run(lambda: "never runs")
+    finally:
+        release.set()
+        holder.join()
+    assert executor.run(lambda: "ok") == "ok"
+
+
+def test_slow_bcrypt_raises_busy_with_retry_hint():
+    executor = BcryptExecutor(workers=1, max_queue=1, timeout=0.05)
+    release = threading.Event()
+    with pytest.raises(BcryptBusy) as e:
+        executor.run(release.wait, 5)
+    assert e.value.retry_after >= 1
+    release.set()
+
+
+def test_hash_and_check():
+    executor = BcryptExecutor(workers=1, max_queue=1)
+    hashed, = executor.hash("s3cret")
+    assert executor.check("s3cret", hashed)
+    assert not executor.check("wrong", hashed)
@@ -1,5 +1,6 @@
 // App.js
 import React, { useState } from 'react';
+import axios from 'axios';
 import LoginPage from './components/LoginPage';
 import HomePage from './components/HomePage';
 import ImageUploaderPage from './components/ImageUploaderPage';
@@ -18,12 +19,17 @@ function App() {
     setIsLoggedIn(false);
     setUserName('User');
     setUserEmail('');
+    delete axios.defaults.headers.common['Authorization'];
   };
 
   const handleLoginSuccess = (userData) => {
     setIsLoggedIn(true);
     setUserName(userData.username || 'User');
     setUserEmail(userData.email || '');
+    // Caption and history routes identify the user by this session token
+    if (userData.token) {
+      axios.defaults.headers.common['Authorization'] = `Bearer ${userData.token}`;
+    }
     setCurrentView('home');
   };
 
@@ -159,6 +159,18 @@ const platformButtonActiveStyle = {
   borderBottom: '2px solid var(--primary)'
 };
 
+const bulkBarStyle = {
+  width: '100%',
+  maxWidth: '1000px',
+  display: 'flex',
+  justifyContent: 'space-between',
+  alignItems: 'center',
+  marginBottom: '16px',
+  color: 'var(--foreground)',
+  position: 'relative',
+  zIndex: 5
+};
+
 const captionListStyle = {
   width: '100%',
   maxWidth: '1000px',
@@ -237,37 +249,68 @@ const emptyStateStyle = {
   margin: '20px auto'
 };
 
+const CAPTIONS_PAGE_SIZE = 20;
+
 const DashboardPage = ({ onBackToHome, onSignOut, userName = 'User', onNavigateToUploader }) => {
   const API_BASE_URL = 'http://localhost:5123';
   const [captions, setCaptions] = useState([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
   const [activePlatform, setActivePlatform] = useState('all'); // 'all', 'instagram', 'facebook', etc.
-
-  const fetchCaptions = async () => {
-    setLoading(true);
+  const [stats, setStats] = useState(null); // Server-maintained counters from /api/caption/stats
+  const [selectedIds, setSelectedIds] = useState([]); // Captions ticked for bulk delete
+  const [nextBefore, setNextBefore] = useState(null); // Cursor for the next page, null when all are loaded
+  const [loadingMore, setLoadingMore] = useState(false);
+
+  const fetchCaptions = async (before = null) => {
+    // Only a page of recent captions is loaded; the stat cards come from fetchStats
+    if (before) {
+      setLoadingMore(true);
+    } else {
+      setLoading(true);
+    }
     setError('');
     try {
-      const response = await axios.get(`${API_BASE_URL}/api/caption/user_captions/${userName}`);
+      const params = { limit: CAPTIONS_PAGE_SIZE, platform: activePlatform };
+      if (before) params.before = before;
+      const response = await axios.get(`${API_BASE_URL}/api/caption/user_captions/${userName}`, { params });
       const fetchedCaptions = response.data.captions.map(caption => ({
         ...caption,
         id: caption._id, // Map MongoDB's _id to id for frontend usage
         createdAt: new Date(caption.createdAt).toLocaleString()
       }));
-      setCaptions(fetchedCaptions);
+      setCaptions(prev => (before ? [...prev, ...fetchedCaptions] : fetchedCaptions));
+      setNextBefore(response.data.next_before || null);
     } catch (err) {
       console.error('Error fetching captions:', err);
       setError('Failed to load captions. Please try again later.');
-      setCaptions([]);
+      if (!before) setCaptions([]);
     } finally {
       setLoading(false);
+      setLoadingMore(false);
+    }
+  };
+
+  const fetchStats = async () => {
+    try {
+      const response = await axios.get(`${API_BASE_URL}/api/caption/stats/${userName}`);
+      setStats(response.data.stats);
+    } catch (err) {
+      console.error('Error fetching caption stats:', err);
+      setStats(null); // Fall back to counting the loaded captions
     }
   };
 
   useEffect(() => {
-    fetchCaptions();
+    fetchStats();
   }, [userName]);
 
+  // The platform tabs filter on the server, so switching tabs loads that platform's first page
+  useEffect(() => {
+    setSelectedIds([]);
+    fetchCaptions();
+  }, [userName, activePlatform]);
+
   const handleCopyToClipboard = (text) => {
     navigator.clipboard.writeText(text).then(() => {
       alert('Caption copied to clipboard!');
@@ -277,16 +320,56 @@ const DashboardPage = ({ onBackToHome, onSignOut, userName = 'User', onNavigateT
     });
   };
 
+  // Patch local state with the change set returned by the bulk API instead of refetching everything
+  const applyCaptionChanges = ({ deleted = [], updated = [] }) => {
+    const updatedById = new Map(updated.map(u => [u._id, u]));
+    setCaptions(prev => prev
+      .filter(c => !deleted.includes(c.id))
+      .map(c => (updatedById.has(c.id) ? { ...c, caption: updatedById.get(c.id).caption } : c)));
+    if (deleted.length > 0) {
+      fetchStats();
+    }
+  };
+
+  const toggleSelected = (captionId) => {
+    setSelectedIds(prev => (prev.includes(captionId) ? prev.filter(id => id !== captionId) : [...prev, captionId]));
+  };
+
+  // Delete through the bulk API and report what actually happened to each caption
+  const deleteCaptions = async (captionIds) => {
+    try {
+      const response = await axios.post(`${API_BASE_URL}/api/caption/captions/bulk`, {
+        user_id: userName,
+        delete: captionIds,
+      });
+      applyCaptionChanges(response.data.changes);
+      setSelectedIds(prev => prev.filter(id => !response.data.changes.deleted.includes(id)));
+
+      const results = response.data.results;
+      const deleted = results.filter(r => r.status === 'deleted').length;
+      const notFound = results.filter(r => r.status === 'not_found').length;
+      const failed = results.length - deleted - notFound;
+      const messages = [];
+      if (deleted > 0) messages.push(`${deleted} caption${deleted === 1 ? '' : 's'} deleted.`);
+      if (notFound > 0) messages.push(`${notFound} caption${notFound === 1 ? ' was' : 's were'} not found (already deleted?).`);
+      if (failed > 0) messages.push(`${failed} caption${failed === 1 ? '' : 's'} could not be deleted.`);
+      alert(messages.join('\n'));
+    } catch (err) {
+      console.error('Error deleting captions:', err);
+      alert('Failed to delete captions.');
+    }
+  };
+
   const handleDeleteCaption = async (captionId) => {
     if (window.confirm('Are you sure you want to delete this caption?')) {
-      try {
-        await axios.delete(`${API_BASE_URL}/api/caption/caption/${captionId}`);
-        alert('Caption deleted successfully!');
-        fetchCaptions(); // Refresh the list
-      } catch (err) {
-        console.error('Error deleting caption:', err);
-        alert('Failed to delete caption.');
-      }
+      await deleteCaptions([captionId]);
+    }
+  };
+
+  const handleDeleteSelected = async () => {
+    if (selectedIds.length === 0) return;
+    if (window.confirm(`Delete ${selectedIds.length} selected caption${selectedIds.length === 1 ? '' : 's'}?`)) {
+      await deleteCaptions(selectedIds);
     }
   };
 
@@ -295,9 +378,9 @@ const DashboardPage = ({ onBackToHome, onSignOut, userName = 'User', onNavigateT
     : captions.filter(c => c.platform.toLowerCase() === activePlatform);
 
   // Calculate stats
-  const totalCaptions = captions.length;
-  const uniquePlatforms = new Set(captions.map(c => c.platform)).size;
-  const longestCaptionLength = captions.reduce((max, c) => Math.max(max, c.caption.length), 0);
+  const totalCaptions = stats ? stats.total : captions.length;
+  const uniquePlatforms = stats ? Object.keys(stats.by_platform).length : new Set(captions.map(c => c.platform)).size;
+  const longestCaptionLength = stats ? stats.longest : captions.reduce((max, c) => Math.max(max, c.caption.length), 0);
 
   return (
     <div style={pageStyle}>
@@ -492,6 +575,26 @@ const DashboardPage = ({ onBackToHome, onSignOut, userName = 'User', onNavigateT
         </div>
       )}
 
+      {!loading && !error && filteredCaptions.length > 0 && (
+        <div style={bulkBarStyle}>
+          <label style={{ display: 'flex', alignItems: 'center', gap: '8px', cursor: 'pointer' }}>
+            <input
+              type="checkbox"
+              checked={filteredCaptions.every(c => selectedIds.includes(c.id))}
+              onChange={(e) => setSelectedIds(e.target.checked ? filteredCaptions.map(c => c.id) : [])}
+            />
+            Select all
+          </label>
+          <button
+            style={{ ...actionButtonStyleSmall, ...deleteButtonStyleSmall, opacity: selectedIds.length === 0 ? 0.5 : 1 }}
+            disabled={selectedIds.length === 0}
+            onClick={handleDeleteSelected}
+          >
+            Delete selected ({selectedIds.length})
+          </button>
+        </div>
+      )}
+
       {!loading && !error && filteredCaptions.length > 0 && (
         <div style={captionListStyle}>
           {filteredCaptions.map(caption => (
@@ -507,6 +610,14 @@ const DashboardPage = ({ onBackToHome, onSignOut, userName = 'User', onNavigateT
                 e.currentTarget.style.boxShadow = 'var(--shadow-md)';
               }}
             >
+              <label style={{ display: 'flex', alignItems: 'center', gap: '8px', marginBottom: '10px', fontSize: '14px', opacity: 0.8, cursor: 'pointer' }}>
+                <input
+                  type="checkbox"
+                  checked={selectedIds.includes(caption.id)}
+                  onChange={() => toggleSelected(caption.id)}
+                />
+                Select
+              </label>
               <p style={captionTextStyle}>{caption.caption}</p>
               <div style={captionMetaStyle}>
                 <span>Platform: {caption.platform}</span>
@@ -565,6 +676,16 @@ const DashboardPage = ({ onBackToHome, onSignOut, userName = 'User', onNavigateT
           ))}
         </div>
       )}
+
+      {!loading && !error && nextBefore && (
+        <button
+          style={{ ...iconButton, marginTop: '30px', position: 'relative', zIndex: 5, opacity: loadingMore ? 0.6 : 1 }}
+          disabled={loadingMore}
+          onClick={() => fetchCaptions(nextBefore)}
+        >
+          {loadingMore ? 'Loading...' : 'Load more'}
+        </button>
+      )}
     </div>
   );
 };
@@ -293,6 +293,7 @@ const ImageUploaderPage = ({ onBackToHome, onSignOut, userName = 'User' }) => {
   const [platform, setPlatform] = useState('instagram'); // Set default to 'instagram' for initial Gemini model
   const [includeHashtags, setIncludeHashtags] = useState(false);
   const [aiModel, setAiModel] = useState('gemini'); // State for AI model selection
+  const [blipQuality, setBlipQuality] = useState('fast'); // BLIP model tier: 'fast' (base) or 'quality' (large)
 
   const [file, setFile] = useState(null);
   const [previewUrl, setPreviewUrl] = useState('');
@@ -381,6 +382,7 @@ const ImageUploaderPage = ({ onBackToHome, onSignOut, userName = 'User' }) => {
       form.append('length', length); // LENGTH PREFERENCE IS SENT HERE
       form.append('platform', platform);
       form.append('ai_model', aiModel);
+      form.append('blip_model', blipQuality); // Which BLIP model serves BLIP, hybrid drafts and fallbacks
       form.append('includeHashtags', includeHashtags); // Send hashtag preference to backend
       form.append('user_id', userName); // Assuming userName is a unique identifier for the user
 
@@ -401,7 +403,7 @@ const ImageUploaderPage = ({ onBackToHome, onSignOut, userName = 'User' }) => {
     } finally {
       setIsGenerating(false);
     }
-  }, [file, tone, length, platform, includeHashtags, aiModel, userName]);
+  }, [file, tone, length, platform, includeHashtags, aiModel, blipQuality, userName]);
 
   const handleAiModelChange = useCallback((e) => {
     const newAiModel = e.target.value;
@@ -411,7 +413,7 @@ const ImageUploaderPage = ({ onBackToHome, onSignOut, userName = 'User' }) => {
       // BLIP model doesn't support platform-specific prompting, so default to 'general'
       setPlatform('general');
       setTone('casual'); // Set tone to casual when BLIP is selected
-    } else if (newAiModel === 'gemini') {
+    } else if (newAiModel === 'gemini' || newAiModel === 'hybrid') {
       // If switching to Gemini and platform was 'general' (from BLIP), set a more relevant default
       if (platform === 'general') {
         setPlatform('instagram');
@@ -672,9 +674,32 @@ const ImageUploaderPage = ({ onBackToHome, onSignOut, userName = 'User' }) => {
               >
                 <option value="gemini">✨ Gemini API</option>
                 <option value="blip">🧠 BLIP Model</option>
+                <option value="hybrid">⚡ Hybrid (BLIP draft + Gemini rewrite)</option>
               </select>
             </div>
 
+            {aiModel !== 'gemini' && (
+              <div>
+                <div style={{ fontSize: '14px', fontWeight: '600', marginBottom: '8px', color: 'var(--foreground)' }}>BLIP Quality</div>
+                <select
+                  value={blipQuality}
+                  onChange={(e) => setBlipQuality(e.target.value)}
+                  style={selectStyle}
+                  onFocus={(e) => {
+                    e.target.style.borderColor = 'var(--primary)';
+                    e.target.style.boxShadow = '0 0 0 2px hsla(var(--primary), 0.3)';
+                  }}
+                  onBlur={(e) => {
+                    e.target.style.borderColor = 'var(--border)';
+                    e.target.style.boxShadow = 'var(--shadow-sm)';
+                  }}
+                >
+                  <option value="fast">Fast (BLIP base)</option>
+                  <option value="quality">Quality (BLIP large)</option>
+                </select>
+              </div>
+            )}
+
             <div style={toggleRowStyle}>
               <input 
                 id="hashtags-toggle" 
@@ -65,7 +65,8 @@ const LoginPage = ({ onLoginSuccess }) => {
                 setTimeout(() => {
                     onLoginSuccess({
                         username: response.data.username,
-                        email: response.data.email
+                        email: response.data.email,
+                        token: response.data.token
                     });
                 }, 1000);
             }